@@ -1,19 +1,115 @@
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
 from app.models import User
+from app.crud import get_principal_revision
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app.database import get_db
+from app.database import get_db, SessionLocal
+from app.metrics import histogram
 
 # SECURITY SETTINGS (Minor Project Defaults)
 SECRET_KEY = "dataintellect_minor_project_secret" # In production, use os.getenv()
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Principal cache: avoids a users lookup on every authenticated request.
+# Role changes and deletions bump principal_revision (in any process, e.g. promote_admin.py);
+# each worker reads it at most every PRINCIPAL_REVISION_CHECK_SECONDS and drops its cache
+# when it moved. The TTL bounds staleness for changes made without bumping it.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "1024"))
+PRINCIPAL_REVISION_CHECK_SECONDS = float(os.getenv("PRINCIPAL_REVISION_CHECK_SECONDS", "1"))
+
+# Password hashing: bcrypt cost factor and the size of the dedicated hashing pool.
+# Hashes made with a different cost are upgraded transparently on the next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+
+HASH_MS = histogram("password_hash_ms", "bcrypt hash time", op="hash")
+VERIFY_MS = histogram("password_hash_ms", "bcrypt verify time", op="verify")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
+
+class Principal:
+    """Detached snapshot of an authenticated User, safe to share across requests."""
+    __slots__ = ("id", "email", "role", "created_at")
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.email = user.email
+        self.role = user.role
+        self.created_at = user.created_at
+
+class PrincipalCache:
+    """Bounded TTL + LRU cache of principals keyed on the token subject (email)."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.revision = None  # principal_revision the entries were loaded under
+        self._revision_checked_at = float("-inf")
+
+    def revision_due(self) -> bool:
+        return time.monotonic() - self._revision_checked_at >= PRINCIPAL_REVISION_CHECK_SECONDS
+
+    def sync(self, revision: int):
+        """Record the current principal_revision, dropping every entry if it moved."""
+        with self._lock:
+            self._revision_checked_at = time.monotonic()
+            if revision != self.revision:
+                self._entries.clear()
+                self.revision = revision
+
+    def get(self, subject: str):
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def put(self, subject: str, principal: Principal, revision: int):
+        """Cache a principal loaded under `revision`; ignored if the revision moved meanwhile."""
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if revision != self.revision:
+                return
+            self._entries[subject] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str | None = None):
+        """Drop one subject, or everything when subject is None."""
+        with self._lock:
+            if subject is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(subject, None)
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES)
+
+def invalidate_principal(email: str | None = None):
+    """Call whenever a user's identity or role changes in this process."""
+    principal_cache.invalidate(email)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -21,6 +117,28 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _timed(hist, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        hist.observe((time.perf_counter() - started) * 1000)
+
+async def hash_password_async(password: str) -> str:
+    """Hash on the bounded hashing pool so bcrypt never blocks the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, _timed, HASH_MS, pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Verify on the hashing pool. Returns (valid, new_hash); new_hash is set when the
+    stored hash uses an outdated scheme or cost and should be replaced.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _hash_executor, _timed, VERIFY_MS, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -44,11 +162,32 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+
+    if principal_cache.revision_due():
+        principal_cache.sync(get_principal_revision(db))
+    revision = principal_cache.revision
+    principal = principal_cache.get(email)
+    if principal is not None:
+        return principal
         
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal(user)
+    principal_cache.put(email, principal, revision)
+    return principal
+
+def get_stream_user(token: str | None = Depends(optional_oauth2_scheme), access_token: str | None = None):
+    """
+    get_current_user for long-lived streams. Browsers' EventSource cannot set headers, so the
+    token may also be passed as ?access_token=. A cache miss uses its own short session, so
+    no connection is held for the lifetime of the stream.
+    """
+    db = SessionLocal()
+    try:
+        return get_current_user(token or access_token or "", db)
+    finally:
+        db.close()
 
 def get_current_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -0,0 +1,154 @@
+"""
+Conditional GETs and response caching for the dashboard endpoints.
+
+Each user's financial data only changes on their uploads and clears and on
+retention drops, each of which bumps that user's data_version counter in its
+transaction. Analytics responses are tagged with the user's version (ETag,
+Last-Modified). A matching If-None-Match or If-Modified-Since is answered with 304
+before the endpoint runs any query other than the single-row version lookup.
+HTTP dates have one-second precision, so Last-Modified is only sent once the second
+of the version's change has passed; until then a further change could carry the
+same date and be answered with a false 304.
+Otherwise, responses are kept in a bounded in-process LRU keyed on (user, path,
+query string, version), so repeated polls within a worker are served from memory
+until the user's next change.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.crud import get_data_version
+from app.auth import get_current_user
+from app.models import User
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+# Larger bodies (e.g. big record pages) are served but not cached
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+class ResponseCache:
+    """
+    Thread-safe LRU of serialized responses shared by all users. Keys start with the
+    owner_id; an owner's entries of older versions are dropped when a newer one is stored.
+    """
+
+    def __init__(self, max_entries: int, max_entry_bytes: int):
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._versions = {}  # owner_id -> newest version stored
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version: int):
+        with self._lock:
+            entry = self._entries.get((key, version))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, version))
+            self.hits += 1
+            return entry
+
+    def put(self, key, version: int, entry):
+        if self.max_entries <= 0 or len(entry[0]) > self.max_entry_bytes:
+            return
+        with self._lock:
+            owner_id = key[0]
+            current = self._versions.get(owner_id)
+            if current is None or version > current:
+                for stale in [cached for cached in self._entries if cached[0][0] == owner_id]:
+                    del self._entries[stale]
+                self._versions[owner_id] = version
+            elif version < current:
+                return
+            self._entries[(key, version)] = entry
+            self._entries.move_to_end((key, version))
+            while len(self._entries) > self.max_entries:
+                ((evicted_owner, _, _), _), _ = self._entries.popitem(last=False)
+                if not any(cached[0][0] == evicted_owner for cached in self._entries):
+                    del self._versions[evicted_owner]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "owners": len(self._versions), "hits": self.hits, "misses": self.misses}
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_ENTRY_BYTES)
+
+def _last_modified(updated_at):
+    """updated_at as an HTTP date (whole seconds, UTC), or None while its second is still running."""
+    if updated_at is None:
+        return None
+    second = updated_at.replace(microsecond=0, tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) < second + timedelta(seconds=1):
+        return None
+    return second
+
+def _not_modified(request: Request, etag: str, updated_at) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        # Weak comparison: W/"5" matches "5"
+        return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = _last_modified(updated_at)
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:  # "-0000" parses as naive; HTTP dates are UTC
+            since = since.replace(tzinfo=timezone.utc)
+        # Any change after a Last-Modified was sent falls in a later second
+        return last_modified <= since
+    return False
+
+class VersionedResponse:
+    """The current user's data version plus cache access for the endpoint."""
+
+    def __init__(self, request: Request, owner_id: int, version: int, updated_at):
+        self.key = (owner_id, request.url.path, str(request.query_params))
+        self.version = version
+        # The owner is part of the tag so a shared client never revalidates across users
+        self.headers = {"ETag": f'W/"{owner_id}-{version}"', "Cache-Control": "private, no-cache"}
+        last_modified = _last_modified(updated_at)
+        if last_modified is not None:
+            self.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    def cached(self):
+        """The cached response for this path, query and version, if any."""
+        entry = response_cache.get(self.key, self.version)
+        if entry is None:
+            return None
+        body, status_code, media_type = entry
+        return Response(content=body, status_code=status_code, media_type=media_type, headers=self.headers)
+
+    def store(self, response: Response) -> Response:
+        """Tag a freshly built response with the version headers and cache it."""
+        response.headers.update(self.headers)
+        if response.status_code == 200:
+            response_cache.put(self.key, self.version, (response.body, response.status_code, response.media_type))
+        return response
+
+def conditional_get(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> VersionedResponse:
+    """
+    Dependency for cacheable GETs: answers 304 when the client's ETag or
+    Last-Modified is still current for the current user's data, otherwise returns
+    the request's VersionedResponse.
+    """
+    version, updated_at = get_data_version(db, current_user.id)
+    versioned = VersionedResponse(request, current_user.id, version, updated_at)
+    if _not_modified(request, versioned.headers["ETag"], updated_at):
+        raise HTTPException(status_code=304, headers=versioned.headers)
+    return versioned
@@ -1,7 +1,37 @@
+from __future__ import annotations
+
 from sqlalchemy.orm import Session
-import pandas as pd
+from sqlalchemy import insert, case, func, select, delete, text
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import TYPE_CHECKING
+import io
 import app.models as models
 
+# pandas is only needed on the upload path; keep it out of the API's import time
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Column order used for every bulk load into financial_records
+RECORD_COLUMNS = [
+    "owner_id", "account_id", "date", "revenue", "expense", "balance",
+    "transaction_count", "overdue_amount", "payment_delay_days", "source_row_id", "created_at"
+]
+
+# Columns written by the aggregate upsert (derived metrics + sufficient statistics)
+AGGREGATE_COLUMNS = [
+    "owner_id", "account_id", "month", "avg_revenue", "avg_expense", "profit", "expense_ratio",
+    "cashflow_volatility", "record_count", "revenue_sum", "revenue_sumsq",
+    "expense_sum", "expense_sumsq", "overdue_sum", "overdue_count", "delay_sum",
+    "delay_max", "delayed_count", "created_at"
+]
+
+def upsert_insert(db: Session, table):
+    """INSERT construct supporting ON CONFLICT for the session's dialect."""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
 def create_financial_records(db: Session, df: pd.DataFrame):
     # Convert DataFrame rows to Dictionary list
     records_data = df.to_dict(orient='records')
@@ -25,4 +55,356 @@ def create_financial_records(db: Session, df: pd.DataFrame):
     db.add_all(db_records)
     db.commit()
     
-    return len(db_records)
\ No newline at end of file
+    return len(db_records)
+
+# Unique natural key of financial_records (see uq_financial_records_natural_key)
+NATURAL_KEY = ["owner_id", "account_id", "date", "source_row_id"]
+
+# Per-transaction staging table that uploads are COPYed into before the upsert
+STAGING_TABLE = "financial_records_staging"
+
+def upsert_financial_records(db: Session, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bulk load a prepared chunk into financial_records inside the session's transaction,
+    skipping rows whose natural key already exists. Returns the rows actually inserted.
+    On PostgreSQL the chunk is COPYed into a temp staging table and moved over with one
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING; elsewhere a Core executemany is used.
+    """
+    frame = df[RECORD_COLUMNS].drop_duplicates(NATURAL_KEY)
+    if frame.empty:
+        return frame
+
+    columns = ", ".join(RECORD_COLUMNS)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ON COMMIT DROP AS "
+            f"SELECT {columns} FROM financial_records WITH NO DATA"
+        ))
+        db.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        # Raw DBAPI cursor on the session's connection, so COPY shares the transaction
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+        inserted = db.execute(text(
+            f"INSERT INTO financial_records ({columns}) SELECT {columns} FROM {STAGING_TABLE} "
+            f"ON CONFLICT ({', '.join(NATURAL_KEY)}) DO NOTHING "
+            f"RETURNING {', '.join(NATURAL_KEY)}"
+        )).all()
+    else:
+        table = models.FinancialRecord.__table__
+        stmt = upsert_insert(db, table).on_conflict_do_nothing(
+            index_elements=[table.c[name] for name in NATURAL_KEY]
+        ).returning(*[table.c[name] for name in NATURAL_KEY])
+        inserted = db.execute(stmt, frame.to_dict(orient="records")).all()
+
+    # Common case: nothing overlapped, so no need to match keys
+    if len(inserted) == len(frame):
+        return frame
+    if not inserted:
+        return frame.iloc[:0]
+
+    import pandas as pd
+
+    owner_ids, account_ids, dates, source_row_ids = zip(*inserted)
+    inserted_keys = pd.MultiIndex.from_arrays(
+        [list(owner_ids), list(account_ids), pd.to_datetime(list(dates)), list(source_row_ids)]
+    )
+    return frame[pd.MultiIndex.from_frame(frame[NATURAL_KEY]).isin(inserted_keys)]
+
+def find_upload(db: Session, owner_id: int, content_hash: str):
+    """Ledger entry of a file with these exact bytes previously ingested by the owner, if any."""
+    return db.execute(
+        select(models.UploadLedger).where(
+            models.UploadLedger.owner_id == owner_id,
+            models.UploadLedger.content_hash == content_hash
+        )
+    ).scalar_one_or_none()
+
+def record_upload(db: Session, owner_id: int, content_hash: str, filename: str, uploaded_by: str, size_bytes: int):
+    """
+    Add a ledger entry for a file being ingested. The unique (owner_id, content_hash)
+    makes a concurrent ingest of the same file by the same owner block here and fail
+    with IntegrityError.
+    """
+    entry = models.UploadLedger(
+        owner_id=owner_id,
+        content_hash=content_hash,
+        filename=filename,
+        uploaded_by=uploaded_by,
+        size_bytes=size_bytes
+    )
+    db.add(entry)
+    db.flush()
+    return entry
+
+
+def upsert_financial_aggregates(db: Session, agg_df: pd.DataFrame) -> int:
+    """
+    Merge per (owner_id, account_id, month) statistics into financial_aggregates with a single
+    INSERT ... ON CONFLICT. Counts and sums are added; derived metrics are recomputed
+    from the merged sums so a month split across uploads stays correct.
+    """
+    if agg_df.empty:
+        return 0
+
+    table = models.FinancialAggregate.__table__
+    stmt = upsert_insert(db, table)
+    new = stmt.excluded
+
+    n = table.c.record_count + new.record_count
+    revenue_sum = table.c.revenue_sum + new.revenue_sum
+    revenue_sumsq = table.c.revenue_sumsq + new.revenue_sumsq
+    expense_sum = table.c.expense_sum + new.expense_sum
+    variance = (revenue_sumsq - revenue_sum * revenue_sum / n) / (n - 1)
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.owner_id, table.c.account_id, table.c.month],
+        set_={
+            "record_count": n,
+            "revenue_sum": revenue_sum,
+            "revenue_sumsq": revenue_sumsq,
+            "expense_sum": expense_sum,
+            "expense_sumsq": table.c.expense_sumsq + new.expense_sumsq,
+            "overdue_sum": table.c.overdue_sum + new.overdue_sum,
+            "overdue_count": table.c.overdue_count + new.overdue_count,
+            "delay_sum": table.c.delay_sum + new.delay_sum,
+            "delay_max": case((new.delay_max > table.c.delay_max, new.delay_max), else_=table.c.delay_max),
+            "delayed_count": table.c.delayed_count + new.delayed_count,
+            "avg_revenue": revenue_sum / n,
+            "avg_expense": expense_sum / n,
+            "profit": revenue_sum - expense_sum,
+            "expense_ratio": case((revenue_sum > 0, expense_sum / revenue_sum), else_=0.0),
+            "cashflow_volatility": case(
+                ((n > 1) & (variance > 0), func.sqrt(variance)), else_=0.0
+            ),
+        }
+    )
+
+    db.execute(stmt, agg_df[AGGREGATE_COLUMNS].to_dict(orient="records"))
+    return len(agg_df)
+
+
+def ensure_dashboard_totals(db: Session, owner_id: int):
+    """
+    Seed the owner's running totals from financial_records if they are cold.
+    Must run before an upload writes its rows so they are not counted twice.
+    """
+    if db.get(models.DashboardTotals, owner_id) is not None:
+        return
+
+    count, revenue, expense, balance = db.execute(select(
+        func.count(models.FinancialRecord.id),
+        func.coalesce(func.sum(models.FinancialRecord.revenue), 0.0),
+        func.coalesce(func.sum(models.FinancialRecord.expense), 0.0),
+        func.coalesce(func.sum(models.FinancialRecord.balance), 0.0)
+    ).where(models.FinancialRecord.owner_id == owner_id)).one()
+
+    table = models.DashboardTotals.__table__
+    db.execute(
+        upsert_insert(db, table).values(
+            owner_id=owner_id,
+            record_count=count,
+            total_revenue=revenue,
+            total_expense=expense,
+            total_balance=balance,
+            updated_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[table.c.owner_id])
+    )
+
+def add_dashboard_totals(db: Session, owner_id: int, record_count: int, revenue: float, expense: float, balance: float):
+    """Add one upload's totals to the owner's running totals row."""
+    table = models.DashboardTotals.__table__
+    stmt = upsert_insert(db, table).values(
+        owner_id=owner_id,
+        record_count=record_count,
+        total_revenue=revenue,
+        total_expense=expense,
+        total_balance=balance,
+        updated_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.owner_id],
+        set_={
+            "record_count": table.c.record_count + stmt.excluded.record_count,
+            "total_revenue": table.c.total_revenue + stmt.excluded.total_revenue,
+            "total_expense": table.c.total_expense + stmt.excluded.total_expense,
+            "total_balance": table.c.total_balance + stmt.excluded.total_balance,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+    db.execute(stmt)
+
+def reset_dashboard_totals(db: Session, owner_id: int):
+    """Reset the owner's running totals to a warm, all-zero row (used after clearing data)."""
+    db.execute(delete(models.DashboardTotals).where(models.DashboardTotals.owner_id == owner_id))
+    db.add(models.DashboardTotals(owner_id=owner_id))
+
+def get_data_version(db: Session, owner_id: int):
+    """(version, updated_at) of the owner's financial data; (0, None) before the first change."""
+    row = db.execute(
+        select(models.DataVersion.version, models.DataVersion.updated_at)
+        .where(models.DataVersion.owner_id == owner_id)
+    ).first()
+    return (row.version, row.updated_at) if row is not None else (0, None)
+
+def bump_data_version(db: Session, owner_id: int):
+    """Advance the owner's data version in the caller's transaction, invalidating cached responses."""
+    table = models.DataVersion.__table__
+    stmt = upsert_insert(db, table).values(owner_id=owner_id, version=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.owner_id],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at}
+    )
+    db.execute(stmt)
+
+def bump_all_data_versions(db: Session):
+    """Advance every owner's data version, e.g. after data of all owners was removed."""
+    table = models.DataVersion.__table__
+    db.execute(table.update().values(version=table.c.version + 1, updated_at=datetime.utcnow()))
+
+def get_principal_revision(db: Session) -> int:
+    """Current users revision; cached principals from an older revision are stale."""
+    return db.execute(select(models.PrincipalRevision.revision).where(models.PrincipalRevision.id == 1)).scalar() or 0
+
+def bump_principal_revision(db: Session):
+    """
+    Advance the users revision in the caller's transaction. Call with every change to a
+    user's role or existence, so all API workers drop their cached principals.
+    """
+    table = models.PrincipalRevision.__table__
+    stmt = upsert_insert(db, table).values(id=1, revision=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={"revision": table.c.revision + 1, "updated_at": stmt.excluded.updated_at}
+    )
+    db.execute(stmt)
+
+MONTHLY_COLUMNS = ["owner_id", "month", "record_count", "revenue_sum", "expense_sum", "balance_sum", "updated_at"]
+
+def ensure_monthly_totals(db: Session, owner_id: int):
+    """
+    Seed the owner's monthly_totals from financial_records if their rollup is empty
+    but records exist. Like ensure_dashboard_totals, this must run before an upload
+    writes its rows.
+    """
+    if db.execute(
+        select(models.MonthlyTotals.month).where(models.MonthlyTotals.owner_id == owner_id).limit(1)
+    ).first() is not None:
+        return
+    if db.execute(
+        select(models.FinancialRecord.id).where(models.FinancialRecord.owner_id == owner_id).limit(1)
+    ).first() is None:
+        return
+
+    if db.get_bind().dialect.name == "sqlite":
+        month = func.strftime("%Y-%m", models.FinancialRecord.date)
+    else:
+        month = func.to_char(models.FinancialRecord.date, "YYYY-MM")
+    rows = db.execute(
+        select(
+            month.label("month"),
+            func.count(models.FinancialRecord.id).label("record_count"),
+            func.sum(models.FinancialRecord.revenue).label("revenue_sum"),
+            func.sum(models.FinancialRecord.expense).label("expense_sum"),
+            func.sum(models.FinancialRecord.balance).label("balance_sum")
+        ).where(models.FinancialRecord.owner_id == owner_id).group_by(month)
+    ).mappings().all()
+
+    now = datetime.utcnow()
+    db.execute(insert(models.MonthlyTotals), [{**row, "owner_id": owner_id, "updated_at": now} for row in rows])
+
+def upsert_monthly_totals(db: Session, monthly_df: pd.DataFrame) -> int:
+    """Add per-month sums of one upload to the owner's monthly_totals in a single upsert."""
+    if monthly_df.empty:
+        return 0
+
+    table = models.MonthlyTotals.__table__
+    stmt = upsert_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.owner_id, table.c.month],
+        set_={
+            "record_count": table.c.record_count + stmt.excluded.record_count,
+            "revenue_sum": table.c.revenue_sum + stmt.excluded.revenue_sum,
+            "expense_sum": table.c.expense_sum + stmt.excluded.expense_sum,
+            "balance_sum": table.c.balance_sum + stmt.excluded.balance_sum,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+    db.execute(stmt, monthly_df[MONTHLY_COLUMNS].to_dict(orient="records"))
+    return len(monthly_df)
+
+def remove_months(db: Session, months: list) -> list:
+    """
+    Remove whole months (YYYY-MM) of every owner from the rollups after their records
+    were dropped, subtracting them from each owner's running totals. Returns the
+    owner_ids that had data in those months.
+    """
+    if not months:
+        return []
+
+    removed = db.execute(
+        select(
+            models.MonthlyTotals.owner_id,
+            func.sum(models.MonthlyTotals.record_count),
+            func.sum(models.MonthlyTotals.revenue_sum),
+            func.sum(models.MonthlyTotals.expense_sum),
+            func.sum(models.MonthlyTotals.balance_sum)
+        ).where(models.MonthlyTotals.month.in_(months)).group_by(models.MonthlyTotals.owner_id)
+    ).all()
+
+    for owner_id, count, revenue, expense, balance in removed:
+        if db.get(models.DashboardTotals, owner_id) is not None:
+            add_dashboard_totals(db, owner_id, -count, -revenue, -expense, -balance)
+
+    db.execute(delete(models.MonthlyTotals).where(models.MonthlyTotals.month.in_(months)))
+    db.execute(delete(models.FinancialAggregate).where(models.FinancialAggregate.month.in_(months)))
+    db.execute(delete(models.AccountRisk).where(models.AccountRisk.month.in_(months)))
+    db.execute(delete(models.AccountDistribution).where(models.AccountDistribution.month.in_(months)))
+    db.execute(delete(models.MonthlyDistribution).where(models.MonthlyDistribution.month.in_(months)))
+    return [owner_id for owner_id, *_ in removed]
+
+# Tables holding one owner's data, deleted child-first by clear_owner_data
+OWNER_TABLES = [
+    models.FinancialRecord, models.FinancialAggregate, models.MonthlyTotals, models.AccountRisk,
+    models.PortfolioRisk, models.AccountDistribution, models.MonthlyDistribution, models.UploadLedger
+]
+
+def clear_owner_data(db: Session, owner_id: int) -> int:
+    """
+    Delete one owner's records, rollups, scores and upload ledger, leaving every other
+    owner untouched. Each DELETE is an index range scan on the owner-leading indexes.
+    Returns the number of financial records removed.
+    """
+    removed = 0
+    for model in OWNER_TABLES:
+        result = db.execute(delete(model).where(model.owner_id == owner_id))
+        if model is models.FinancialRecord:
+            removed = result.rowcount
+    reset_dashboard_totals(db, owner_id)
+    bump_data_version(db, owner_id)
+    return removed
+
+def delete_owner_data(db: Session, owner_id: int) -> list:
+    """
+    Delete everything stored for an owner who is being deleted: the tables cleared by
+    clear_owner_data plus their running totals, data version and ingest jobs, with no
+    totals row seeded back. Returns the rejected-row report paths of the deleted jobs,
+    for the caller to remove once the transaction has committed.
+    """
+    reports = db.execute(
+        select(models.IngestJobRecord.rejected_path).where(
+            models.IngestJobRecord.owner_id == owner_id,
+            models.IngestJobRecord.rejected_path.is_not(None)
+        )
+    ).scalars().all()
+    for model in OWNER_TABLES + [models.DashboardTotals, models.DataVersion, models.IngestJobRecord]:
+        db.execute(delete(model).where(model.owner_id == owner_id))
+    return reports
@@ -0,0 +1,211 @@
+"""
+Server-pushed dashboard updates for GET /dashboard/stream (Server-Sent Events).
+
+Each worker has one Broadcaster. Every open stream subscribes under its user's id.
+Upload jobs, clears and retention drops publish a small delta to that user's
+streams once their transaction has committed: the new data version and totals,
+plus the months (with their new monthly totals) and accounts that changed. An
+event is serialized once and the same bytes are queued for every subscriber, so
+fan-out is one queue put per connection, and an idle stream costs a heartbeat
+comment every STREAM_HEARTBEAT_SECONDS. Nothing is published for users without
+an open stream.
+
+Uploads are processed by the worker that accepted them, so streams held by other
+workers would miss them. While a worker has subscribers it reads the data_version
+rows of those users every STREAM_POLL_SECONDS (one query for all of them) and
+publishes a "changed" event with the new totals when a version moved without a
+local event.
+
+Each stream queues at most STREAM_QUEUE_SIZE events; a slow client loses the
+oldest. Every event carries the data version (also its SSE id) and full totals,
+so a client that sees a gap refetches what it displays.
+"""
+import asyncio
+import os
+import threading
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import DashboardTotals, MonthlyTotals, DataVersion
+from app.crud import get_data_version
+from app.instrumentation import logger
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "32"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "5"))
+# Reconnect delay suggested to EventSource clients
+STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", "3000"))
+
+def _offer(queue: asyncio.Queue, message: bytes):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+def format_event(event: str, data: dict) -> bytes:
+    """One SSE message; the data version is the event id."""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (data["version"], event.encode(), orjson.dumps(data))
+
+class Broadcaster:
+    """Fans events out to this worker's open streams, per user. Thread-safe."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._streams = {}  # owner_id -> {queue: event loop}
+        self._versions = {}  # owner_id -> newest version sent to its streams
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.published = 0
+
+    def subscribe(self, owner_id: int) -> asyncio.Queue:
+        """Register a stream; must be called on the event loop that will read the queue."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        with self._lock:
+            self._streams.setdefault(owner_id, {})[queue] = loop
+            if self._watcher is None or self._watcher.done() or self._watcher.get_loop() is not loop:
+                self._watcher = loop.create_task(self._watch())
+        return queue
+
+    def unsubscribe(self, owner_id: int, queue: asyncio.Queue):
+        with self._lock:
+            streams = self._streams.get(owner_id, {})
+            streams.pop(queue, None)
+            if not streams:
+                self._streams.pop(owner_id, None)
+                self._versions.pop(owner_id, None)
+
+    def owners(self) -> list:
+        with self._lock:
+            return list(self._streams)
+
+    def has_subscribers(self, owner_id: int) -> bool:
+        with self._lock:
+            return owner_id in self._streams
+
+    def connections(self) -> int:
+        with self._lock:
+            return sum(len(streams) for streams in self._streams.values())
+
+    def seen(self, owner_id: int, version: int):
+        """Record a version a stream of the owner already reflects."""
+        with self._lock:
+            if owner_id in self._streams:
+                self._versions[owner_id] = max(version, self._versions.get(owner_id, version))
+
+    def is_new(self, owner_id: int, version: int) -> bool:
+        with self._lock:
+            return version > self._versions.get(owner_id, version - 1)
+
+    def publish(self, owner_id: int, event: str, data: dict):
+        """Queue an event (with data["version"]) on every stream of the owner. Callable from any thread."""
+        message = format_event(event, data)
+        with self._lock:
+            streams = list(self._streams.get(owner_id, {}).items())
+            if streams:
+                self._versions[owner_id] = max(data["version"], self._versions.get(owner_id, data["version"]))
+                self.published += 1
+        for queue, loop in streams:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:  # Event loop already closed
+                self.unsubscribe(owner_id, queue)
+
+    async def _watch(self):
+        """Catch changes committed by other workers while anyone is subscribed."""
+        while True:
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            owners = self.owners()
+            if not owners:
+                return
+            try:
+                await run_in_threadpool(_poll_versions, owners)
+            except Exception:
+                logger.exception("Dashboard stream version poll failed")
+
+broadcaster = Broadcaster(STREAM_QUEUE_SIZE)
+
+def current_state(db, owner_id: int) -> dict:
+    """The owner's committed data version and totals, as sent with every event."""
+    version, _ = get_data_version(db, owner_id)
+    totals = db.get(DashboardTotals, owner_id)
+    revenue = totals.total_revenue or 0.0 if totals else 0.0
+    expense = totals.total_expense or 0.0 if totals else 0.0
+    return {
+        "version": version,
+        "totals": {
+            "record_count": totals.record_count or 0 if totals else 0,
+            "total_revenue": revenue,
+            "total_expense": expense,
+            "net_profit": revenue - expense,
+            "current_balance": totals.total_balance or 0.0 if totals else 0.0,
+        }
+    }
+
+def publish_change(owner_id: int, event: str, months=(), **fields):
+    """
+    After a commit, publish the owner's new version and totals plus `fields` to their
+    streams. `months` (YYYY-MM) are sent with their monthly totals. Blocking; a no-op
+    without subscribers.
+    """
+    if not broadcaster.has_subscribers(owner_id):
+        return
+    db = SessionLocal()
+    try:
+        data = current_state(db, owner_id)
+        if months:
+            rows = db.execute(
+                select(MonthlyTotals).where(MonthlyTotals.owner_id == owner_id, MonthlyTotals.month.in_(list(months)))
+                .order_by(MonthlyTotals.month)
+            ).scalars().all()
+            data["months"] = [
+                {"month": row.month, "record_count": row.record_count, "revenue": row.revenue_sum,
+                 "expense": row.expense_sum}
+                for row in rows
+            ]
+    finally:
+        db.close()
+    broadcaster.publish(owner_id, event, {**data, **fields})
+
+def publish_changes(owner_ids, event: str, **fields):
+    """publish_change for several owners after a request's commit; failures are logged, not raised."""
+    for owner_id in owner_ids:
+        try:
+            publish_change(owner_id, event, **fields)
+        except Exception:
+            logger.exception("Dashboard stream publish for owner %s failed", owner_id)
+
+def _poll_versions(owners: list):
+    db = SessionLocal()
+    try:
+        versions = db.execute(
+            select(DataVersion.owner_id, DataVersion.version).where(DataVersion.owner_id.in_(owners))
+        ).all()
+    finally:
+        db.close()
+    for owner_id, version in versions:
+        if broadcaster.is_new(owner_id, version):
+            publish_change(owner_id, "changed")
+
+async def event_stream(owner_id: int):
+    """SSE body of one /dashboard/stream connection: a "ready" event with the current state, then deltas."""
+    queue = broadcaster.subscribe(owner_id)
+    try:
+        db = SessionLocal()
+        try:
+            state = await run_in_threadpool(current_state, db, owner_id)
+        finally:
+            db.close()
+        broadcaster.seen(owner_id, state["version"])
+        yield b"retry: %d\n" % STREAM_RETRY_MS + format_event("ready", state)
+
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # SSE comment; keeps proxies from closing an idle connection
+                yield b": keepalive\n\n"
+    finally:
+        broadcaster.unsubscribe(owner_id, queue)
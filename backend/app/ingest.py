@@ -0,0 +1,407 @@
+"""
+Chunked ingestion pipeline for /upload/financial-data.
+
+Accepts CSV (plain, gzip or zstd compressed), Parquet and Arrow IPC uploads; the
+format is detected from the file's magic bytes. Columnar files are read record
+batch by record batch with their types intact.
+
+The upload is read in bounded chunks so memory stays flat regardless of file size.
+Each chunk is validated column-wise (dtype coercion, null and range masks): rows
+that fail are written with their reasons to a rejected-rows report instead of
+failing the upload, and the rest are loaded. Every row is stamped with the
+uploading user's id (owner_id). Each chunk is bulk
+loaded with COPY, skipping rows whose natural key (owner_id, account_id, date,
+source_row_id) is already stored, and the rows actually inserted are folded into
+running per (account_id, month) sufficient statistics (count, sum, sum of squares),
+which are merged into the owner's financial_aggregates once the whole file is read.
+Their values are also counted into mergeable quantile sketches (app.sketches).
+"""
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.partitions import is_partitioned, ensure_partitions, month_start, PartitionLockTimeout
+from app.risk import update_risk_scores
+from app.sketches import SketchBuilder
+from app.crud import (
+    upsert_financial_records, upsert_financial_aggregates,
+    ensure_dashboard_totals, add_dashboard_totals,
+    ensure_monthly_totals, upsert_monthly_totals, bump_data_version
+)
+
+CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "50000"))
+
+# Upload columns in the order used by the rejected-rows report
+INPUT_COLUMNS = [
+    "account_id", "date", "revenue", "expense", "balance",
+    "transaction_count", "overdue_amount", "payment_delay_days"
+]
+REQUIRED_COLUMNS = set(INPUT_COLUMNS)
+
+# column: (minimum, maximum) accepted after numeric coercion; None is unbounded
+INT32_MAX = 2 ** 31 - 1
+NUMERIC_RANGES = {
+    "revenue": (0, None),
+    "expense": (0, None),
+    "balance": (None, None),
+    "overdue_amount": (0, None),
+    "transaction_count": (0, INT32_MAX),
+    "payment_delay_days": (0, INT32_MAX),
+}
+INTEGER_COLUMNS = ("transaction_count", "payment_delay_days")
+
+# Rows kept in one upload's rejected-rows report; further rejects are only counted
+REJECTED_REPORT_MAX_ROWS = int(os.getenv("INGEST_REJECTED_REPORT_MAX_ROWS", "1000000"))
+REJECTED_COLUMNS = ["row_number", "reason", *INPUT_COLUMNS]
+
+# Account ids listed in an upload's result (and its dashboard stream event); further ones are only counted
+CHANGED_ACCOUNTS_MAX = int(os.getenv("INGEST_CHANGED_ACCOUNTS_MAX", "200"))
+
+# Values hashed into source_row_id for files without their own row ids
+ROW_HASH_COLUMNS = sorted(REQUIRED_COLUMNS)
+
+class IngestError(ValueError):
+    """Raised when an upload cannot be ingested (e.g. invalid CSV structure)."""
+
+def peak_memory_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024
+    return round(peak / divisor, 1)
+
+# Magic numbers used to detect the upload format
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def detect_format(fileobj) -> str:
+    """Sniff the upload format: parquet, arrow_file, arrow_stream, csv_gzip, csv_zstd or csv."""
+    fileobj.seek(0)
+    head = fileobj.read(8)
+    fileobj.seek(0)
+
+    if head.startswith(PARQUET_MAGIC):
+        return "parquet"
+    if head.startswith(ARROW_FILE_MAGIC):
+        return "arrow_file"
+    if head.startswith(ARROW_STREAM_MAGIC):
+        return "arrow_stream"
+    if head.startswith(GZIP_MAGIC):
+        return "csv_gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "csv_zstd"
+    return "csv"
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise IngestError("Parquet/Arrow uploads require pyarrow to be installed on the server")
+    return pyarrow
+
+def _batch_frames(batches, chunk_size: int):
+    """Re-slice Arrow record batches to at most chunk_size rows and convert to pandas."""
+    for batch in batches:
+        for offset in range(0, batch.num_rows, chunk_size):
+            # date_as_object=False keeps dates as datetime64 instead of Python objects
+            yield batch.slice(offset, chunk_size).to_pandas(date_as_object=False)
+
+def iter_chunks(fileobj, chunk_size: int = CHUNK_SIZE, file_format: str | None = None):
+    """Yield the upload as DataFrames of at most chunk_size rows."""
+    file_format = file_format or detect_format(fileobj)
+    fileobj.seek(0)
+
+    if file_format == "parquet":
+        pa = _import_pyarrow()
+        yield from _batch_frames(pa.parquet.ParquetFile(fileobj).iter_batches(batch_size=chunk_size), chunk_size)
+    elif file_format == "arrow_file":
+        pa = _import_pyarrow()
+        reader = pa.ipc.open_file(fileobj)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        yield from _batch_frames(batches, chunk_size)
+    elif file_format == "arrow_stream":
+        pa = _import_pyarrow()
+        yield from _batch_frames(pa.ipc.open_stream(fileobj), chunk_size)
+    else:
+        compression = {"csv_gzip": "gzip", "csv_zstd": "zstd"}.get(file_format)
+        try:
+            reader = pd.read_csv(fileobj, chunksize=chunk_size, compression=compression)
+        except pd.errors.EmptyDataError:
+            raise IngestError("CSV file is empty")
+        except ImportError:
+            raise IngestError("zstd-compressed uploads require the zstandard package on the server")
+        yield from reader
+
+def validate_chunk(chunk: pd.DataFrame, first_row: int = 0):
+    """
+    Coerce the input columns of one chunk column-wise and check nulls and ranges as
+    boolean masks. Returns (valid rows with their coerced dtypes, rejected rows as
+    read plus row_number and reason, {reason: count}). `first_row` is the number of
+    data rows before this chunk, so row_number is the 1-based data row of the file.
+    """
+    checks = []  # (mask of failing rows, reason)
+
+    raw = chunk["account_id"]
+    account_id = raw.astype(str)
+    checks.append((raw.isna().to_numpy() | (account_id == "").to_numpy(), "account_id is missing"))
+
+    raw = chunk["date"]
+    dates = pd.to_datetime(raw, errors="coerce")
+    missing = raw.isna().to_numpy()
+    checks.append((missing, "date is missing"))
+    checks.append((dates.isna().to_numpy() & ~missing, "date is not a valid date"))
+
+    numeric = {}
+    for column, (low, high) in NUMERIC_RANGES.items():
+        raw = chunk[column]
+        values = pd.to_numeric(raw, errors="coerce").astype(np.float64).to_numpy()
+        missing = raw.isna().to_numpy()
+        checks.append((missing, f"{column} is missing"))
+        checks.append((np.isnan(values) & ~missing, f"{column} is not a number"))
+        checks.append((np.isinf(values), f"{column} is not finite"))
+        if low is not None:
+            checks.append((values < low, f"{column} is below {low}"))
+        if high is not None:
+            checks.append((values > high, f"{column} is above {high}"))
+        if column in INTEGER_COLUMNS:
+            checks.append((np.isfinite(values) & (values % 1 != 0), f"{column} is not a whole number"))
+        numeric[column] = values
+
+    bad = np.zeros(len(chunk), dtype=bool)
+    for mask, _ in checks:
+        bad |= mask
+    counts = {reason: int(mask.sum()) for mask, reason in checks if mask.any()}
+
+    rejected = None
+    if bad.any():
+        rejected = chunk.loc[bad, INPUT_COLUMNS].copy()
+        reasons = np.full(len(rejected), "", dtype=object)
+        for mask, reason in checks:
+            hit = mask[bad]
+            if hit.any():
+                reasons[hit] = np.where(reasons[hit] == "", reason, reasons[hit] + "; " + reason)
+        rejected.insert(0, "reason", reasons)
+        rejected.insert(0, "row_number", first_row + np.flatnonzero(bad) + 1)
+
+    good = ~bad
+    valid = chunk[good].copy()
+    valid["account_id"] = account_id[good]
+    valid["date"] = dates[good].dt.normalize()
+    for column, values in numeric.items():
+        kept = values[good]
+        valid[column] = kept.astype(np.int64) if column in INTEGER_COLUMNS else kept
+    return valid, rejected, counts
+
+def prepare_chunk(chunk: pd.DataFrame, owner_id: int, first_row: int = 0):
+    """
+    Normalize and validate one chunk and stamp its valid rows with their owner.
+    Returns (valid rows, rejected rows or None, {reason: count}); see validate_chunk.
+    """
+    chunk.columns = [c.lower().strip() for c in chunk.columns]
+
+    if not REQUIRED_COLUMNS.issubset(chunk.columns):
+        missing = REQUIRED_COLUMNS - set(chunk.columns)
+        raise IngestError(f"File structure invalid. Missing: {missing}")
+
+    chunk, rejected, counts = validate_chunk(chunk, first_row)
+
+    # Stable per-row identity so a re-sent row maps onto the stored one. The hash covers
+    # the raw int64 behind datetime64, so the date is pinned to one unit whatever the
+    # reader produced (CSV parses to microseconds, Parquet date32 to milliseconds).
+    hashed = chunk[ROW_HASH_COLUMNS].astype({"date": "datetime64[us]"})
+    row_hash = pd.util.hash_pandas_object(hashed, index=False).map("{:016x}".format)
+    if "source_row_id" in chunk.columns:
+        chunk["source_row_id"] = chunk["source_row_id"].astype("string").fillna(row_hash).astype(str)
+    else:
+        chunk["source_row_id"] = row_hash
+    chunk["owner_id"] = owner_id
+    chunk["created_at"] = datetime.utcnow()
+    return chunk, rejected, counts
+
+def chunk_months(chunk: pd.DataFrame) -> set:
+    """First-of-month dates present in a prepared chunk."""
+    months = np.unique(chunk["date"].to_numpy().astype("datetime64[M]"))
+    return {month_start(ts) for ts in pd.DatetimeIndex(months)}
+
+def partial_stats(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Per (account_id, month) statistics for one chunk; see merge_stats for combining."""
+    month = chunk["date"].dt.strftime("%Y-%m").rename("month")
+    return chunk.assign(
+        revenue_sq=chunk["revenue"] ** 2,
+        expense_sq=chunk["expense"] ** 2,
+        is_overdue=(chunk["overdue_amount"] > 0).astype(np.int64),
+        is_delayed=(chunk["payment_delay_days"] > 0).astype(np.int64)
+    ).groupby([chunk["account_id"], month]).agg(
+        record_count=("revenue", "size"),
+        revenue_sum=("revenue", "sum"),
+        revenue_sumsq=("revenue_sq", "sum"),
+        expense_sum=("expense", "sum"),
+        expense_sumsq=("expense_sq", "sum"),
+        balance_sum=("balance", "sum"),
+        overdue_sum=("overdue_amount", "sum"),
+        overdue_count=("is_overdue", "sum"),
+        delay_sum=("payment_delay_days", "sum"),
+        delay_max=("payment_delay_days", "max"),
+        delayed_count=("is_delayed", "sum"),
+    )
+
+def merge_stats(stats, partial: pd.DataFrame) -> pd.DataFrame:
+    """Combine two partial_stats frames; every column adds except the maxima."""
+    if stats is None:
+        return partial
+    how = {column: ("max" if column.endswith("_max") else "sum") for column in partial.columns}
+    return pd.concat([stats, partial]).groupby(level=[0, 1]).agg(how)
+
+def finalize_aggregates(stats: pd.DataFrame) -> pd.DataFrame:
+    """Derive the FinancialAggregate metrics for this upload's statistics (vectorized)."""
+    n = stats["record_count"].to_numpy(dtype=float)
+    revenue_sum = stats["revenue_sum"].to_numpy()
+    expense_sum = stats["expense_sum"].to_numpy()
+
+    # Sample variance from sufficient statistics; single-record groups get 0
+    variance = np.divide(
+        stats["revenue_sumsq"].to_numpy() - revenue_sum ** 2 / n,
+        n - 1,
+        out=np.zeros_like(n),
+        where=n > 1
+    )
+
+    agg_df = stats.reset_index()
+    agg_df["avg_revenue"] = revenue_sum / n
+    agg_df["avg_expense"] = expense_sum / n
+    agg_df["profit"] = revenue_sum - expense_sum
+    agg_df["expense_ratio"] = np.divide(
+        expense_sum, revenue_sum, out=np.zeros_like(revenue_sum), where=revenue_sum > 0
+    )
+    agg_df["cashflow_volatility"] = np.sqrt(np.clip(variance, 0, None))
+    return agg_df
+
+def merge_rollups(db: Session, owner_id: int, stats: pd.DataFrame, rows: int) -> int:
+    """
+    Merge one upload's statistics into the owner's financial_aggregates, monthly_totals
+    and dashboard_totals. Returns the number of (account_id, month) rows merged.
+    """
+    now = datetime.utcnow()
+    agg_df = finalize_aggregates(stats)
+    agg_df["owner_id"] = owner_id
+    agg_df["created_at"] = now
+    aggregates = upsert_financial_aggregates(db, agg_df)
+
+    monthly_df = stats.groupby(level="month")[
+        ["record_count", "revenue_sum", "expense_sum", "balance_sum"]
+    ].sum().reset_index()
+    monthly_df["owner_id"] = owner_id
+    monthly_df["updated_at"] = now
+    upsert_monthly_totals(db, monthly_df)
+
+    add_dashboard_totals(
+        db, owner_id, rows,
+        float(stats["revenue_sum"].sum()),
+        float(stats["expense_sum"].sum()),
+        float(stats["balance_sum"].sum())
+    )
+    return aggregates
+
+def ingest_file(
+    db: Session, fileobj, owner_id: int, chunk_size: int = CHUNK_SIZE, progress=None, rejected_report=None
+) -> dict:
+    """
+    Stream an upload (any supported format) into the owner's financial_records and maintain
+    their rollups (financial_aggregates, monthly_totals, dashboard_totals) and risk scores.
+    Does not commit; the caller owns the transaction.
+    `progress`, if given, is called with the running count of rows read after each chunk.
+    Rows failing validation are skipped and, if `rejected_report` (a text file) is given,
+    written to it as CSV with REJECTED_COLUMNS, up to REJECTED_REPORT_MAX_ROWS rows.
+    """
+    started = time.perf_counter()
+    file_format = detect_format(fileobj)
+
+    rows_read = 0
+    rows = 0
+    chunks = 0
+    stats = None
+    rejected_rows = 0
+    rejection_reasons = {}
+
+    # Seed the summary and monthly stores before any rows of this upload are written
+    ensure_dashboard_totals(db, owner_id)
+    ensure_monthly_totals(db, owner_id)
+
+    sketches = SketchBuilder(db, owner_id)
+
+    # Monthly partitions are created (and committed separately) on first sight of a month
+    partitioned = is_partitioned(db)
+    ensured_months = set()
+
+    for chunk in iter_chunks(fileobj, chunk_size, file_format):
+        read = len(chunk)
+        chunk, rejected, counts = prepare_chunk(chunk, owner_id, rows_read)
+        if rejected is not None:
+            if rejected_report is not None and rejected_rows < REJECTED_REPORT_MAX_ROWS:
+                rejected.iloc[:REJECTED_REPORT_MAX_ROWS - rejected_rows].to_csv(
+                    rejected_report, header=rejected_rows == 0, index=False
+                )
+            rejected_rows += len(rejected)
+            for reason, count in counts.items():
+                rejection_reasons[reason] = rejection_reasons.get(reason, 0) + count
+        if partitioned:
+            new_months = chunk_months(chunk) - ensured_months
+            try:
+                ensure_partitions(db, new_months)
+            except PartitionLockTimeout as e:
+                raise IngestError(str(e)) from e
+            ensured_months |= new_months
+        rows_read += read
+        # Only newly inserted rows count towards the rollups
+        inserted = upsert_financial_records(db, chunk)
+        rows += len(inserted)
+        chunks += 1
+        if progress is not None:
+            progress(rows_read)
+
+        if not inserted.empty:
+            partial = partial_stats(inserted)
+            stats = merge_stats(stats, partial)
+            sketches.add(inserted)
+
+    aggregates = merge_rollups(db, owner_id, stats, rows) if stats is not None else 0
+    sketches.flush()
+    # Rescore only the accounts and months this upload touched
+    risk_scores = update_risk_scores(db, owner_id, stats.index) if stats is not None else 0
+    if rows:
+        bump_data_version(db, owner_id)
+
+    months_changed = sorted(stats.index.unique(level="month")) if stats is not None else []
+    accounts_changed = sorted(stats.index.unique(level="account_id")) if stats is not None else []
+
+    elapsed = time.perf_counter() - started
+    return {
+        "format": file_format,
+        "records_inserted": rows,
+        "records_skipped": rows_read - rejected_rows - rows,
+        "records_rejected": rejected_rows,
+        "rejection_reasons": rejection_reasons,
+        "aggregates_generated": aggregates,
+        "risk_scores_updated": risk_scores,
+        "sketches_updated": sketches.sketches_written,
+        "months_changed": months_changed,
+        "accounts_changed": accounts_changed[:CHANGED_ACCOUNTS_MAX],
+        "accounts_changed_total": len(accounts_changed),
+        "chunks": chunks,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_read / elapsed, 1) if elapsed > 0 else None,
+        "peak_memory_mb": peak_memory_mb()
+    }
@@ -0,0 +1,120 @@
+"""
+Request timing and SQL accounting.
+
+MetricsMiddleware (pure ASGI, so streaming responses are untouched) times every
+request into a per-route histogram and adds a Server-Timing header. SQLAlchemy
+cursor events count statements and DB time for the request that issued them,
+found through a context variable that follows the request into threadpool
+workers.
+
+Startup is broken down into import, DB init and first request times, which are
+logged once and exported as gauges on /metrics.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from app.metrics import histogram
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger("uvicorn.error")
+
+# Startup phases in milliseconds: import_ms, db_init_ms, first_request_ms
+startup_timings = {}
+
+class RequestStats:
+    __slots__ = ("queries", "db_ms")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+
+_current = ContextVar("request_stats", default=None)
+
+def current_request_stats():
+    return _current.get()
+
+def instrument_engine(engine):
+    """Attach statement counting/timing hooks to an engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_ms += (time.perf_counter() - started) * 1000
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                server_timing = (
+                    f'app;dur={elapsed_ms:.1f}, '
+                    f'db;dur={stats.db_ms:.1f};desc="{stats.queries} queries"'
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", server_timing.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            # Label by route template (e.g. /upload/jobs/{job_id}) to keep cardinality bounded
+            route = scope.get("route")
+            labels = {
+                "method": scope["method"],
+                "route": getattr(route, "path", "<unmatched>")
+            }
+            histogram("http_request_ms", "Request latency in milliseconds", **labels).observe(
+                (time.perf_counter() - started) * 1000
+            )
+            histogram("http_request_db_ms", "DB time per request in milliseconds", **labels).observe(stats.db_ms)
+            histogram(
+                "http_request_queries", "SQL statements per request", QUERY_COUNT_BUCKETS, **labels
+            ).observe(stats.queries)
+
+class FirstRequestTimer:
+    """Logs the startup breakdown once the worker has served its first request."""
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = True
+
+    async def __call__(self, scope, receive, send):
+        if not self.pending or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.pending = False
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            startup_timings["first_request_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(
+                "Startup: import %sms, DB init %sms, first request (%s %s) %sms",
+                startup_timings.get("import_ms"), startup_timings.get("db_init_ms"),
+                scope["method"], scope["path"], startup_timings["first_request_ms"]
+            )
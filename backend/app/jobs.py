@@ -0,0 +1,296 @@
+"""
+Background ingest jobs.
+
+Uploads are spooled to a temporary file and processed on a bounded thread pool,
+so pandas parsing and the blocking database work never run on the event loop.
+Job state is written to the ingest_jobs table in short transactions of its own
+(on submit, start, every INGEST_PROGRESS_SAVE_SECONDS of progress and at the end),
+so any worker can answer GET /upload/jobs/{id}; the worker running a job answers
+from memory. Rejected-row reports are written to INGEST_REPORT_DIR, which must be
+shared by all workers (the default temp directory is, on a single host).
+Every ingested file is recorded in upload_ledger by owner and content hash, so an
+identical re-upload by the same user (e.g. a client retry after a timeout) is
+skipped instead of ingested twice. Rows rejected by validation are kept in a
+per-job CSV report until the job is pruned. The newest INGEST_MAX_FINISHED_JOBS
+finished jobs are kept.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import text, select, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models import IngestJobRecord
+from app.crud import find_upload, record_upload
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_FINISHED_JOBS = int(os.getenv("INGEST_MAX_FINISHED_JOBS", "200"))
+INGEST_PROGRESS_SAVE_SECONDS = float(os.getenv("INGEST_PROGRESS_SAVE_SECONDS", "1"))
+INGEST_REPORT_DIR = os.getenv("INGEST_REPORT_DIR", tempfile.gettempdir())
+
+logger = logging.getLogger("uvicorn.error")
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs = {}  # Jobs queued or running in this worker
+_lock = threading.Lock()
+
+# Unique key of upload_ledger; only its violation means the file was ingested concurrently
+LEDGER_KEY = "uq_upload_ledger_owner_content_hash"
+
+# IngestJob attributes stored in ingest_jobs
+JOB_COLUMNS = [
+    "id", "owner_id", "filename", "content_hash", "size_bytes", "status", "rows_processed", "result",
+    "error", "rejected_path", "created_at", "started_at", "finished_at"
+]
+
+class IngestJob:
+    def __init__(self, filename: str, owner_id: int, owner_email: str, content_hash: str, size_bytes: int):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.owner_id = owner_id
+        self.owner_email = owner_email
+        self.content_hash = content_hash
+        self.size_bytes = size_bytes
+        self.status = "queued"  # queued -> running -> succeeded | failed | duplicate
+        self.rows_processed = 0
+        self.rejected_path = None  # CSV report of rejected rows, if any
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_record(cls, record: IngestJobRecord) -> "IngestJob":
+        job = cls.__new__(cls)
+        for column in JOB_COLUMNS:
+            setattr(job, column, getattr(record, column))
+        job.owner_email = None
+        return job
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "duplicate")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "content_hash": self.content_hash,
+            "status": self.status,
+            "rows_processed": self.rows_processed,
+            "result": self.result,
+            "rejected_rows_url": f"/upload/jobs/{self.id}/rejected" if self.rejected_path else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+def spool_upload(source, suffix: str = "") -> tuple:
+    """
+    Copy an upload stream to a temp file that outlives the request, hashing it on the way.
+    Returns (path, sha256 hex digest, size in bytes). Blocking.
+    """
+    source.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix="ingest-", suffix=suffix, delete=False) as target:
+        while block := source.read(1024 * 1024):
+            digest.update(block)
+            target.write(block)
+            size += len(block)
+        return target.name, digest.hexdigest(), size
+
+def _remove_file(path):
+    if path is not None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def remove_reports(paths):
+    """Delete rejected-row reports of jobs whose rows were deleted."""
+    for path in paths:
+        _remove_file(path)
+
+def _remove_report(job: IngestJob):
+    _remove_file(job.rejected_path)
+    job.rejected_path = None
+
+def _is_duplicate_upload(error: IntegrityError) -> bool:
+    """Whether the violated constraint is upload_ledger's (owner_id, content_hash) key."""
+    diag = getattr(error.orig, "diag", None)  # psycopg2
+    if diag is not None:
+        return diag.constraint_name == LEDGER_KEY
+    # SQLite names the columns instead: "UNIQUE constraint failed: upload_ledger.owner_id, ..."
+    return "UNIQUE constraint failed: upload_ledger." in str(error.orig)
+
+def _save(job: IngestJob, *columns):
+    """Write some of the job's attributes to its ingest_jobs row. Blocking; failures are logged."""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(IngestJobRecord).where(IngestJobRecord.id == job.id)
+            .values({column: getattr(job, column) for column in columns})
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Saving state of job %s failed", job.id)
+    finally:
+        db.close()
+
+def _prune_finished():
+    """Delete finished jobs (of any worker) beyond the newest INGEST_MAX_FINISHED_JOBS, with their reports."""
+    db = SessionLocal()
+    try:
+        stale = db.execute(
+            select(IngestJobRecord.id, IngestJobRecord.rejected_path)
+            .where(IngestJobRecord.finished_at.is_not(None))
+            .order_by(IngestJobRecord.finished_at.desc())
+            .offset(INGEST_MAX_FINISHED_JOBS)
+        ).all()
+        if stale:
+            db.execute(delete(IngestJobRecord).where(IngestJobRecord.id.in_([job_id for job_id, _ in stale])))
+            db.commit()
+            for _, path in stale:
+                _remove_file(path)
+    finally:
+        db.close()
+
+def _run(job: IngestJob, path: str):
+    # Imported on first use: the ingest pipeline pulls in pandas/numpy/pyarrow
+    from app.ingest import ingest_file, IngestError
+
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    report = tempfile.NamedTemporaryFile(
+        "w", prefix="rejected-", suffix=".csv", dir=INGEST_REPORT_DIR, newline="", encoding="utf-8", delete=False
+    )
+    job.rejected_path = report.name
+    _save(job, "status", "started_at", "rejected_path")
+
+    saved_at = time.monotonic()
+
+    def progress(rows: int):
+        nonlocal saved_at
+        job.rows_processed = rows
+        if time.monotonic() - saved_at >= INGEST_PROGRESS_SAVE_SECONDS:
+            _save(job, "rows_processed")
+            saved_at = time.monotonic()
+
+    db = SessionLocal()
+    try:
+        # Large uploads may legitimately outlive the request statement timeout
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text("SET LOCAL statement_timeout = 0"))
+        # Claimed in the ingest transaction: a failed ingest leaves no ledger entry behind
+        entry = record_upload(db, job.owner_id, job.content_hash, job.filename, job.owner_email, job.size_bytes)
+        with open(path, "rb") as fileobj:
+            stats = ingest_file(db, fileobj, job.owner_id, progress=progress, rejected_report=report)
+        entry.records_inserted = stats["records_inserted"]
+        entry.records_skipped = stats["records_skipped"]
+        entry.records_rejected = stats["records_rejected"]
+        db.commit()
+        job.result = stats
+        job.status = "succeeded"
+    except IntegrityError as e:
+        db.rollback()
+        if _is_duplicate_upload(e):
+            # The same file was ingested concurrently and committed first
+            job.error = "Identical file was already ingested"
+            job.status = "duplicate"
+        else:
+            job.error = f"Ingestion failed: {str(e)}"
+            job.status = "failed"
+    except IngestError as e:
+        db.rollback()
+        job.error = str(e)
+        job.status = "failed"
+    except Exception as e:
+        db.rollback()
+        job.error = f"Ingestion failed: {str(e)}"
+        job.status = "failed"
+    finally:
+        db.close()
+        report.close()
+        # Only a successful ingest with rejected rows keeps its report
+        if job.status != "succeeded" or not job.result["records_rejected"]:
+            _remove_report(job)
+        job.finished_at = datetime.utcnow()
+        os.remove(path)
+        _save(job, *JOB_COLUMNS[5:])
+        with _lock:
+            _jobs.pop(job.id, None)
+        try:
+            _prune_finished()
+        except Exception:
+            logger.exception("Pruning finished jobs failed")
+
+    if job.status == "succeeded":
+        # Append the new rows to this worker's query snapshot (no-op until the first query)
+        from app.snapshot import refresh_if_loaded
+        try:
+            refresh_if_loaded(job.owner_id)
+        except Exception:
+            logger.exception("Query snapshot refresh after job %s failed", job.id)
+
+        # Push the delta to the owner's open dashboards (no-op without subscribers)
+        from app.events import publish_change
+        try:
+            if job.result["records_inserted"]:
+                publish_change(
+                    job.owner_id, "upload", months=job.result["months_changed"], job_id=job.id,
+                    records_inserted=job.result["records_inserted"],
+                    accounts=job.result["accounts_changed"],
+                    accounts_total=job.result["accounts_changed_total"]
+                )
+        except Exception:
+            logger.exception("Dashboard stream publish after job %s failed", job.id)
+
+def find_duplicate(owner_id: int, content_hash: str):
+    """Ledger entry of a file with this content hash the owner already ingested, if any. Blocking."""
+    db = SessionLocal()
+    try:
+        return find_upload(db, owner_id, content_hash)
+    finally:
+        db.close()
+
+def submit_ingest(path: str, filename: str, owner_id: int, owner_email: str, content_hash: str, size_bytes: int) -> IngestJob:
+    """Queue a spooled upload for ingestion into the owner's data and return its job. Blocking (one insert)."""
+    job = IngestJob(filename, owner_id, owner_email, content_hash, size_bytes)
+    db = SessionLocal()
+    try:
+        db.add(IngestJobRecord(**{column: getattr(job, column) for column in JOB_COLUMNS}))
+        db.commit()
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        db.close()
+    with _lock:
+        _jobs[job.id] = job
+    _executor.submit(_run, job, path)
+    return job
+
+def get_job(job_id: str):
+    """The job, live if this worker runs it, otherwise as last saved to ingest_jobs. Blocking."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    db = SessionLocal()
+    try:
+        record = db.get(IngestJobRecord, job_id)
+        return IngestJob.from_record(record) if record is not None else None
+    finally:
+        db.close()
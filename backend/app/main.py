@@ -1,21 +1,49 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-import pandas as pd
-import io
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+import os
 
-from app.database import engine, Base, get_db
-import app.schemas as schemas, app.crud as crud
-from app.models import FinancialRecord
+# pandas/numpy are imported lazily by the upload path, not here
+from app.database import engine, init_db, warm_pool, pool_status
+from app.events import broadcaster
+from app.instrumentation import MetricsMiddleware, FirstRequestTimer, instrument_engine, startup_timings, logger
+from app.metrics import render_prometheus
 
 from app.routers import analytics, upload, settings, auth
 
-Base.metadata.create_all(bind=engine)
+# Schema creation at startup; disable and run init_db.py from the deploy step instead
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Pooled connections to open before serving (0 = connect on first use)
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "0"))
+
+startup_timings["import_ms"] = round((time.perf_counter() - _import_started) * 1000, 1)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if DB_INIT_ON_STARTUP:
+        await run_in_threadpool(init_db)
+    if DB_POOL_WARMUP > 0:
+        await run_in_threadpool(warm_pool, DB_POOL_WARMUP)
+    startup_timings["db_init_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        "Ready: import %sms, DB init %sms (schema creation %s, pool warm-up %d)",
+        startup_timings["import_ms"], startup_timings["db_init_ms"],
+        "on" if DB_INIT_ON_STARTUP else "off", DB_POOL_WARMUP
+    )
+    yield
 
 app = FastAPI(
     title="DataIntellect API", 
     description="Financial Risk Intelligence Platform APIs",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Register Routers
@@ -38,6 +66,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON payloads (e.g. record pages) for clients sending Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", "1024")))
+
+# Per-route latency histograms, per-request SQL accounting and Server-Timing headers
+if os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes"):
+    instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
+# Outermost, so the first request is timed end to end
+app.add_middleware(FirstRequestTimer)
+
 @app.get("/")
 def read_root():
     return {"message": "DataIntellect API is running", "status": "active"}
@@ -45,3 +84,23 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text format: request/DB histograms, bcrypt timings, pool and stream gauges.
+    """
+    pool = pool_status()
+    return render_prometheus({
+        "db_pool_size": ("Configured pool size", pool["pool_size"]),
+        "db_pool_checked_out": ("Connections currently checked out", pool["checked_out"]),
+        "db_pool_idle": ("Idle connections in the pool", pool["idle"]),
+        "db_pool_overflow": ("Overflow connections in use", pool["overflow"]),
+        "db_pool_checkout_timeouts": ("Checkouts that timed out", pool["checkout_timeouts"]),
+        "dashboard_stream_connections": ("Open /dashboard/stream connections", broadcaster.connections()),
+        "dashboard_stream_events": ("Events published to dashboard streams", broadcaster.published),
+        **{
+            f"startup_{phase}": (f"Worker startup phase {phase}", value)
+            for phase, value in startup_timings.items()
+        }
+    })
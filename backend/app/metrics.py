@@ -0,0 +1,122 @@
+"""
+Lightweight in-process metrics.
+
+Histograms use fixed buckets (milliseconds by default), so observing a value is a
+bisect plus a few integer updates under a lock. Quantiles are estimated by linear
+interpolation inside the bucket that contains them.
+"""
+import bisect
+import threading
+
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class Histogram:
+    def __init__(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS_MS, labels=None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = dict(labels or {})
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def quantile(self, q: float):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower  # Beyond the last bucket; report its bound
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "count": total,
+            "sum": round(total_sum, 3),
+            "mean": round(total_sum / total, 3) if total else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def histogram(name: str, help: str = "", buckets=DEFAULT_BUCKETS_MS, **labels) -> Histogram:
+    """Get or create the histogram for (name, labels)."""
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        hist = _registry.get(key)
+        if hist is None:
+            hist = _registry[key] = Histogram(name, help, buckets, labels)
+        return hist
+
+def collect():
+    """All registered histograms, sorted by name and labels."""
+    with _registry_lock:
+        return [_registry[key] for key in sorted(_registry)]
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def render_prometheus(gauges: dict | None = None) -> str:
+    """
+    Prometheus text exposition of every registered histogram, plus optional
+    gauges given as {name: (help, value)}.
+    """
+    lines = []
+    seen = set()
+    for hist in collect():
+        if hist.name not in seen:
+            seen.add(hist.name)
+            lines.append(f"# HELP {hist.name} {hist.help}")
+            lines.append(f"# TYPE {hist.name} histogram")
+
+        snapshot = hist.snapshot()
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{hist.name}_bucket{_format_labels({**hist.labels, 'le': bound})} {count}")
+        lines.append(f"{hist.name}_sum{_format_labels(hist.labels)} {snapshot['sum']}")
+        lines.append(f"{hist.name}_count{_format_labels(hist.labels)} {snapshot['count']}")
+
+    for name, (help, value) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, LargeBinary, JSON, UniqueConstraint, Index
 import datetime
 from app.database import Base
 
@@ -11,24 +11,60 @@ class User(Base):
     role = Column(String, default="user")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+class PrincipalRevision(Base):
+    """Single-row counter bumped whenever a user's role changes or a user is deleted (see app.auth)."""
+    __tablename__ = "principal_revision"
+
+    id = Column(Integer, primary_key=True)  # Always 1
+    revision = Column(BigInteger, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class FinancialRecord(Base):
     __tablename__ = "financial_records"
+    __table_args__ = (
+        # Every index is led by owner_id, so a tenant's queries only touch its own entries
+        # Keyset pagination on (date, id), optionally scoped to one account
+        Index("ix_financial_records_owner_date_id", "owner_id", "date", "id"),
+        # Covering index for per-account lookups (latest balance is an index-only scan)
+        Index(
+            "ix_financial_records_owner_account_date_id", "owner_id", "account_id", "date", "id",
+            postgresql_include=["balance"]
+        ),
+        # Rows appended since a snapshot was taken (app.snapshot: id > highest id held)
+        Index("ix_financial_records_owner_id_id", "owner_id", "id"),
+        # Natural key: re-sent rows are skipped by INSERT ... ON CONFLICT DO NOTHING
+        Index(
+            "uq_financial_records_natural_key", "owner_id", "account_id", "date", "source_row_id", unique=True
+        ),
+        # Monthly range partitions, managed by app.partitions
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    account_id = Column(String, index=True)
-    date = Column(Date)
+    # The partition key must be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(Integer, nullable=False)  # Uploading user (tenant)
+    account_id = Column(String)
+    date = Column(Date, primary_key=True)
     revenue = Column(Float)
     expense = Column(Float)
     balance = Column(Float)
     transaction_count = Column(Integer)
     overdue_amount = Column(Float)
     payment_delay_days = Column(Integer)
+    # Row id from the source file, or a hash of the row's values when the file has none
+    source_row_id = Column(String)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 class FinancialAggregate(Base):
     __tablename__ = "financial_aggregates"
+    __table_args__ = (
+        # One mergeable row per tenant, account and month
+        UniqueConstraint("owner_id", "account_id", "month", name="uq_financial_aggregates_owner_account_month"),
+        Index("ix_financial_aggregates_owner_month", "owner_id", "month"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, nullable=False)
     account_id = Column(String, index=True)
     month = Column(String, index=True)  # Format: YYYY-MM
     avg_revenue = Column(Float)
@@ -36,4 +72,151 @@ class FinancialAggregate(Base):
     profit = Column(Float)
     expense_ratio = Column(Float)
     cashflow_volatility = Column(Float)
+    # Sufficient statistics; the derived columns above are recomputed from these on merge
+    record_count = Column(Integer, default=0)
+    revenue_sum = Column(Float, default=0.0)
+    revenue_sumsq = Column(Float, default=0.0)
+    expense_sum = Column(Float, default=0.0)
+    expense_sumsq = Column(Float, default=0.0)
+    overdue_sum = Column(Float, default=0.0)
+    overdue_count = Column(Integer, default=0)  # Records with overdue_amount > 0
+    delay_sum = Column(Integer, default=0)
+    delay_max = Column(Integer, default=0)
+    delayed_count = Column(Integer, default=0)  # Records with payment_delay_days > 0
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class DashboardTotals(Base):
+    """Per-tenant running totals for /dashboard/summary, maintained in the upload transaction."""
+    __tablename__ = "dashboard_totals"
+
+    owner_id = Column(Integer, primary_key=True)  # One row per tenant
+    record_count = Column(Integer, default=0)
+    total_revenue = Column(Float, default=0.0)
+    total_expense = Column(Float, default=0.0)
+    total_balance = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class MonthlyTotals(Base):
+    """Per-tenant monthly rollup backing /dashboard/trends (one row per tenant and month)."""
+    __tablename__ = "monthly_totals"
+
+    owner_id = Column(Integer, primary_key=True)
+    month = Column(String, primary_key=True)  # Format: YYYY-MM
+    record_count = Column(Integer, default=0)
+    revenue_sum = Column(Float, default=0.0)
+    expense_sum = Column(Float, default=0.0)
+    balance_sum = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class UploadLedger(Base):
+    """One row per ingested file, keyed by tenant and the SHA-256 of its bytes."""
+    __tablename__ = "upload_ledger"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "content_hash", name="uq_upload_ledger_owner_content_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, nullable=False)
+    content_hash = Column(String, nullable=False)
+    filename = Column(String)
+    uploaded_by = Column(String)
+    size_bytes = Column(BigInteger)
+    records_inserted = Column(Integer, default=0)
+    records_skipped = Column(Integer, default=0)  # Rows already present under their natural key
+    records_rejected = Column(Integer, default=0)  # Rows that failed validation
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class IngestJobRecord(Base):
+    """State of a background ingest job (app.jobs), so any worker can report on it."""
+    __tablename__ = "ingest_jobs"
+    __table_args__ = (
+        # Pruning keeps the newest finished jobs
+        Index("ix_ingest_jobs_finished_at", "finished_at"),
+    )
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    owner_id = Column(Integer, nullable=False)
+    filename = Column(String)
+    content_hash = Column(String)
+    size_bytes = Column(BigInteger)
+    status = Column(String, nullable=False)  # queued -> running -> succeeded | failed | duplicate
+    rows_processed = Column(BigInteger, default=0)
+    result = Column(JSON)
+    error = Column(String)
+    rejected_path = Column(String)  # Rejected-rows report under INGEST_REPORT_DIR, if kept
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class AccountRisk(Base):
+    """Precomputed rolling-window risk score per account and month, maintained by app.risk."""
+    __tablename__ = "account_risk"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "account_id", "month", name="uq_account_risk_owner_account_month"),
+        # Riskiest accounts of a month
+        Index("ix_account_risk_owner_month_score", "owner_id", "month", "score"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, nullable=False)
+    account_id = Column(String, nullable=False)
+    month = Column(String, nullable=False)  # Format: YYYY-MM, last month of the window
+    score = Column(Float)  # 0 (healthy) .. 100 (critical)
+    level = Column(String)  # Low | Medium | High
+    # Window signals the score is built from
+    expense_ratio = Column(Float)
+    overdue_ratio = Column(Float)  # Overdue amount / revenue
+    avg_delay_days = Column(Float)
+    revenue_volatility = Column(Float)  # Coefficient of variation of revenue
+    record_count = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class PortfolioRisk(Base):
+    """Per-tenant risk over each account's latest score, maintained by app.risk at upload time."""
+    __tablename__ = "portfolio_risk"
+
+    owner_id = Column(Integer, primary_key=True)  # One row per tenant with scored accounts
+    average_score = Column(Float)
+    level = Column(String)  # Low | Medium | High, of the average score
+    accounts_low = Column(Integer, default=0)
+    accounts_medium = Column(Integer, default=0)
+    accounts_high = Column(Integer, default=0)
+    as_of = Column(String)  # Latest scored month, YYYY-MM
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class AccountDistribution(Base):
+    """Quantile sketch of one metric for one account and month, maintained by app.sketches."""
+    __tablename__ = "account_distributions"
+    __table_args__ = (
+        UniqueConstraint(
+            "owner_id", "account_id", "month", "metric", name="uq_account_distributions_owner_account_month_metric"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, nullable=False)
+    account_id = Column(String, nullable=False)
+    month = Column(String, nullable=False)  # Format: YYYY-MM
+    metric = Column(String, nullable=False)  # payment_delay_days | overdue_amount | revenue
+    bucket_keys = Column(LargeBinary, nullable=False)  # Ascending int16 bucket keys
+    bucket_counts = Column(LargeBinary, nullable=False)  # int64 count per key
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class MonthlyDistribution(Base):
+    """Per-tenant quantile sketch of one metric over all accounts of a month (see AccountDistribution)."""
+    __tablename__ = "monthly_distributions"
+
+    owner_id = Column(Integer, primary_key=True)
+    month = Column(String, primary_key=True)  # Format: YYYY-MM
+    metric = Column(String, primary_key=True)
+    bucket_keys = Column(LargeBinary, nullable=False)
+    bucket_counts = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class DataVersion(Base):
+    """Per-tenant counter bumped by every committed change to that tenant's financial data."""
+    __tablename__ = "data_version"
+
+    owner_id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,132 @@
+"""
+Monthly range partitions of financial_records (PostgreSQL).
+
+financial_records is declared PARTITION BY RANGE (date). Partitions are named
+financial_records_pYYYY_MM and created on demand during ingest with
+CREATE TABLE ... (LIKE ...) + ATTACH PARTITION, which only takes a
+SHARE UPDATE EXCLUSIVE lock on the parent, so dashboard reads and other
+uploads keep running. Creation commits in its own short transaction, so an
+upload needing a new month waits at most for another upload's partition
+creation, not for that whole upload. Whole months are removed by dropping their partition.
+
+An upload that needs a new month after it has inserted rows holds a lock on the
+parent while the partition is attached on another connection. If a DROP or
+TRUNCATE of the table queued behind the upload in between, the ATTACH waits for it
+and it waits for the upload: a deadlock PostgreSQL cannot see, as it runs through
+this process. Partition creation therefore waits at most PARTITION_LOCK_TIMEOUT_MS
+per attempt and gives up after PARTITION_LOCK_RETRIES retries with
+PartitionLockTimeout, on which the upload fails and its rollback releases the lock.
+
+On databases where the table is not partitioned (e.g. created before this
+change and not rebuilt with fix_schema.py) these helpers are no-ops.
+"""
+import os
+import re
+import time
+from datetime import date
+
+from sqlalchemy import exc, text
+from sqlalchemy.orm import Session
+
+PARENT_TABLE = "financial_records"
+PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})_(\d{{2}})$")
+# Advisory lock serializing partition creation between concurrent ingests
+PARTITION_LOCK = "financial_records_partitions"
+PARTITION_LOCK_TIMEOUT_MS = int(os.getenv("PARTITION_LOCK_TIMEOUT_MS", "5000"))
+PARTITION_LOCK_RETRIES = int(os.getenv("PARTITION_LOCK_RETRIES", "2"))
+# SQLSTATE lock_not_available, raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+
+class PartitionLockTimeout(RuntimeError):
+    """Partitions could not be created within the lock timeout and retries."""
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year}_{month.month:02d}"
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    relkind = db.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": PARENT_TABLE}
+    ).scalar()
+    return relkind == "p"
+
+def _missing(conn, months) -> list:
+    return [
+        month for month in months
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": partition_name(month)}).scalar() is None
+    ]
+
+def ensure_partitions(db: Session, months) -> list:
+    """
+    Create and attach partitions for the given months (first-of-month dates) in a
+    short transaction of their own, committed before this returns, so the locks it
+    takes are not held for the rest of the caller's upload. The caller's transaction
+    (READ COMMITTED) sees the new partitions from its next statement on. Returns the
+    names of partitions created. Raises PartitionLockTimeout when the locks it needs
+    cannot be taken (see the module docstring).
+    """
+    months = sorted(set(months))
+    if not _missing(db, months):
+        return []
+
+    for attempt in range(PARTITION_LOCK_RETRIES + 1):
+        try:
+            return _create_partitions(db, months)
+        except exc.OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                raise
+            if attempt == PARTITION_LOCK_RETRIES:
+                raise PartitionLockTimeout(
+                    f"Could not create partitions of {PARENT_TABLE} within {PARTITION_LOCK_TIMEOUT_MS} ms "
+                    f"({attempt + 1} attempts); the table is locked, e.g. by a clear or retention run"
+                ) from e
+            time.sleep(0.1 * 2 ** attempt)
+
+def _create_partitions(db: Session, months) -> list:
+    created = []
+    with db.get_bind().connect() as conn, conn.begin():
+        conn.execute(text(f"SET LOCAL lock_timeout = {PARTITION_LOCK_TIMEOUT_MS}"))
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": PARTITION_LOCK})
+        # Re-check under the lock; a concurrent ingest may have created some meanwhile
+        for month in _missing(conn, months):
+            name = partition_name(month)
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)"))
+            conn.execute(text(
+                f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            ))
+            created.append(name)
+    return created
+
+def list_partitions(db: Session) -> list:
+    """(month, partition name) for every attached monthly partition, oldest first."""
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:name)"
+    ), {"name": PARENT_TABLE}).scalars()
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+def drop_partitions(db: Session, before: date | None = None) -> list:
+    """
+    Drop whole months of records (all of them when `before` is None) in the caller's
+    transaction. Returns the dropped months as YYYY-MM strings.
+    """
+    dropped = []
+    for month, name in list_partitions(db):
+        if before is None or month < before:
+            db.execute(text(f"DROP TABLE {name}"))
+            dropped.append(f"{month.year}-{month.month:02d}")
+    return dropped
@@ -0,0 +1,232 @@
+"""
+Vectorized group-by evaluation for POST /dashboard/query.
+
+Queries run against the worker's ColumnarSnapshot of the requesting user's
+records (app.snapshot), never against PostgreSQL. Filters become boolean masks.
+The dimension codes of each row are packed into one int64 group key, indexed
+directly when the key space is small (np.unique otherwise). Sums and counts use
+np.bincount. Extremes and percentiles take the column's value order, sorted once
+per snapshot version, and stably re-sort the selected rows by group. The cost is
+a few passes over the selected rows whatever the number of groups.
+"""
+import operator
+import time
+
+import numpy as np
+
+from app.snapshot import snapshot_for, month_label
+from app.schemas import AnalyticsQuery
+
+# Upper-exclusive edges of the payment delay buckets, in days
+DELAY_BUCKET_EDGES = np.array([1, 31, 61, 91])
+DELAY_BUCKET_LABELS = ["0", "1-30", "31-60", "61-90", "90+"]
+
+# Group keys up to this many distinct values are grouped by direct indexing
+DENSE_KEY_LIMIT = 1 << 24
+
+PERCENTILES = {"median": 50, "p25": 25, "p50": 50, "p75": 75, "p90": 90, "p95": 95, "p99": 99}
+
+COMPARISONS = {
+    "eq": operator.eq, "ne": operator.ne, "lt": operator.lt,
+    "le": operator.le, "gt": operator.gt, "ge": operator.ge,
+}
+
+class QueryError(ValueError):
+    """Raised for queries that are valid JSON but cannot be evaluated."""
+
+def _column(columns: dict, name: str) -> np.ndarray:
+    if name == "profit":
+        return columns["revenue"] - columns["expense"]
+    return columns[name]
+
+def _delay_bucket(columns: dict) -> np.ndarray:
+    return np.searchsorted(DELAY_BUCKET_EDGES, columns["payment_delay_days"], side="right")
+
+def _filter_operands(view, condition):
+    """The snapshot column a filter applies to and its values in that column's encoding."""
+    columns = view.columns
+    if condition.column == "account_id":
+        codes = {account: code for code, account in enumerate(view.accounts)}
+        return columns["account"], np.array([codes.get(value, -1) for value in condition.values()])
+    if condition.column == "month":
+        return columns["month"], np.array([
+            (int(value[:4]) - 1970) * 12 + int(value[5:7]) - 1 for value in condition.values()
+        ])
+    if condition.column == "date":
+        return columns["date"], np.array(condition.values(), dtype="datetime64[D]")
+    if condition.column == "delay_bucket":
+        unknown = set(condition.values()) - set(DELAY_BUCKET_LABELS)
+        if unknown:
+            raise ValueError(f"unknown delay bucket(s) {sorted(unknown)}")
+        return _delay_bucket(columns), np.array([DELAY_BUCKET_LABELS.index(value) for value in condition.values()])
+    return _column(columns, condition.column), np.array(condition.values(), dtype=np.float64)
+
+def _filter_mask(view, query: AnalyticsQuery) -> np.ndarray:
+    mask = np.ones(view.rows, dtype=bool)
+    if not view.rows:
+        return mask
+    for condition in query.filters:
+        try:
+            column, values = _filter_operands(view, condition)
+        except (TypeError, ValueError) as e:
+            raise QueryError(f"Invalid value for filter on {condition.column}: {e}")
+
+        if len(values) == 0:
+            raise QueryError(f"Filter on {condition.column} has no values")
+        if condition.op == "in":
+            mask &= np.isin(column, values)
+        elif condition.op == "between":
+            if len(values) != 2:
+                raise QueryError("'between' takes exactly two values")
+            mask &= (column >= values[0]) & (column <= values[1])
+        else:
+            mask &= COMPARISONS[condition.op](column, values[0])
+    return mask
+
+def _group_keys(view, query: AnalyticsQuery, mask: np.ndarray):
+    """
+    Pack the dimension codes of the selected rows into one int64 key per row.
+    Returns the number of groups, each selected row's group index and, per
+    dimension, the code of every group (unpacked from the keys).
+    """
+    sizes, offsets = [], []
+    key = np.zeros(int(mask.sum()), dtype=np.int64)
+    for dimension in query.dimensions:
+        offset = 0
+        if dimension == "account_id":
+            values, size = view.columns["account"][mask], len(view.accounts)
+        elif dimension == "month":
+            values = view.columns["month"][mask]
+            offset = int(values.min())
+            values, size = values - offset, int(values.max()) - offset + 1
+        else:
+            values, size = _delay_bucket(view.columns)[mask], len(DELAY_BUCKET_LABELS)
+        key = key * size + values
+        sizes.append(size)
+        offsets.append(offset)
+
+    key_space = int(np.prod(sizes, dtype=np.int64))
+    if key_space <= DENSE_KEY_LIMIT:
+        # Small key space: index by key directly instead of sorting
+        present = np.bincount(key, minlength=key_space) > 0
+        groups = np.flatnonzero(present)
+        inverse = (np.cumsum(present) - 1)[key]
+    else:
+        groups, inverse = np.unique(key, return_inverse=True)
+
+    codes = {}
+    remainder = groups
+    for dimension, size, offset in reversed(list(zip(query.dimensions, sizes, offsets))):
+        remainder, code = np.divmod(remainder, size)
+        codes[dimension] = code + offset
+    return len(groups), inverse.reshape(-1), codes
+
+def _value_order(view, column: str) -> np.ndarray:
+    """Indices of all snapshot rows sorted by a column, computed once per snapshot version."""
+    cache_key = f"{column}:order"
+    order = view.columns.get(cache_key)
+    if order is None:
+        order = np.argsort(_column(view.columns, column), kind="stable")
+        view.columns[cache_key] = order
+    return order
+
+def _sorted_by_group(view, column: str, group_of_row: np.ndarray, group_count: int) -> np.ndarray:
+    """Values of the selected rows ordered by (group, value)."""
+    order = _value_order(view, column)
+    selected = order[group_of_row[order] >= 0]
+    # Stable sort by group keeps the value order inside each group (radix sort for int16)
+    group_dtype = np.int16 if group_count < 2 ** 15 else np.int32
+    by_group = np.argsort(group_of_row[selected].astype(group_dtype), kind="stable")
+    return _column(view.columns, column)[selected[by_group]].astype(np.float64)
+
+def _aggregate(values: np.ndarray, inverse: np.ndarray, group_count: int, aggs: set, sorted_values) -> dict:
+    """
+    All requested aggregates of one column, each an array with one value per group.
+    `sorted_values` returns the values ordered by (group, value) and is only called
+    for min/max/percentiles.
+    """
+    group_sizes = np.bincount(inverse, minlength=group_count)
+    counts = group_sizes.astype(np.float64)
+    results = {"count": group_sizes}
+    if aggs & {"sum", "mean", "std"}:
+        sums = np.bincount(inverse, weights=values, minlength=group_count)
+        results["sum"] = sums
+        results["mean"] = sums / counts
+        if "std" in aggs:
+            # Sample standard deviation via centred squares (stable for large values)
+            centred = values - results["mean"][inverse]
+            squares = np.bincount(inverse, weights=centred * centred, minlength=group_count)
+            results["std"] = np.sqrt(
+                np.divide(squares, counts - 1, out=np.zeros(group_count), where=counts > 1)
+            )
+
+    if aggs & ({"min", "max"} | set(PERCENTILES)):
+        ordered = sorted_values()
+        starts = np.concatenate([[0], np.cumsum(group_sizes[:-1])]).astype(np.int64)
+        last = starts + group_sizes - 1
+        results["min"] = ordered[starts]
+        results["max"] = ordered[last]
+        for agg in aggs & set(PERCENTILES):
+            # Linear interpolation between closest ranks, as numpy.percentile
+            position = starts + (counts - 1) * PERCENTILES[agg] / 100
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, last)
+            fraction = position - lower
+            results[agg] = ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+    return results
+
+def _dimension_label(dimension: str, code, accounts) -> str:
+    if dimension == "account_id":
+        return accounts[code]
+    if dimension == "month":
+        return month_label(int(code))
+    return DELAY_BUCKET_LABELS[int(code)]
+
+def run_query(owner_id: int, query: AnalyticsQuery) -> dict:
+    """Evaluate an ad-hoc group-by query against the owner's (refreshed) in-memory snapshot."""
+    started = time.perf_counter()
+    view = snapshot_for(owner_id).refresh()
+    refreshed = time.perf_counter()
+
+    names = [*query.dimensions, *(metric.name for metric in query.metrics)]
+    if query.order_by and query.order_by not in names:
+        raise QueryError(f"order_by must be one of {names}")
+
+    mask = _filter_mask(view, query)
+    matched = int(mask.sum())
+    rows = []
+    group_count = 0
+    if matched:
+        group_count, inverse, codes = _group_keys(view, query, mask)
+        group_of_row = np.full(view.rows, -1, dtype=np.int64)
+        group_of_row[mask] = inverse
+
+        results = {}
+        for column in {metric.column for metric in query.metrics}:
+            aggs = {metric.agg for metric in query.metrics if metric.column == column}
+            results[column] = _aggregate(
+                _column(view.columns, column)[mask].astype(np.float64), inverse, group_count, aggs,
+                lambda column=column: _sorted_by_group(view, column, group_of_row, group_count)
+            )
+
+        table = {
+            dimension: [_dimension_label(dimension, code, view.accounts) for code in codes[dimension]]
+            for dimension in query.dimensions
+        }
+        for metric in query.metrics:
+            table[metric.name] = results[metric.column][metric.agg].tolist()
+        rows = [dict(zip(table, values)) for values in zip(*table.values())]
+
+    if query.order_by:
+        rows.sort(key=lambda row: row[query.order_by], reverse=query.descending)
+
+    return {
+        "data_version": view.version,
+        "rows_total": view.rows,
+        "rows_matched": matched,
+        "groups": group_count,
+        "truncated": len(rows) > query.limit,
+        "elapsed_ms": round((time.perf_counter() - refreshed) * 1000, 3),
+        "refresh_ms": round((refreshed - started) * 1000, 3),
+        "data": rows[:query.limit]
+    }
@@ -0,0 +1,239 @@
+"""
+Per-account risk scoring.
+
+Every (account_id, month) in financial_aggregates gets a score computed over a
+trailing window of RISK_WINDOW_MONTHS months of that account's statistics:
+
+- expense ratio: window expenses / window revenue
+- overdue ratio: window overdue amount / window revenue
+- average payment delay in days
+- revenue volatility: standard deviation / mean of revenue over the window
+
+Each signal is mapped linearly onto 0..1 between a healthy and a critical
+threshold, and the weighted sum is scaled to a 0..100 score. Window sums are
+differences of per-account cumulative sums, so scoring is a handful of NumPy
+operations regardless of the number of accounts.
+
+Scores are kept per owner (the uploading user) like the aggregates they are
+computed from. They are refreshed inside the upload transaction, only for the
+owner's accounts and months the upload touched plus the following months whose windows include them.
+The owner's portfolio (average of each account's latest score, accounts per
+level) is refreshed in the same transaction and stored in portfolio_risk, so the
+dashboard reads one row. numpy/pandas are imported inside the scoring functions,
+so the read path does not load them.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.orm import Session
+
+from app.models import FinancialAggregate, AccountRisk, PortfolioRisk
+from app.crud import upsert_insert
+
+RISK_WINDOW_MONTHS = int(os.getenv("RISK_WINDOW_MONTHS", "3"))
+
+# signal: (healthy, critical, weight); weights sum to 1
+SIGNALS = {
+    "expense_ratio": (0.8, 1.1, 0.35),
+    "overdue_ratio": (0.0, 0.2, 0.25),
+    "avg_delay_days": (0.0, 60.0, 0.2),
+    "revenue_volatility": (0.1, 0.6, 0.2),
+}
+
+# Lower score bound of each level, highest first
+LEVELS = ((65.0, "High"), (35.0, "Medium"), (0.0, "Low"))
+
+STAT_COLUMNS = ["record_count", "revenue_sum", "revenue_sumsq", "expense_sum", "overdue_sum", "delay_sum"]
+
+RISK_COLUMNS = [
+    "owner_id", "account_id", "month", "score", "level", "expense_ratio", "overdue_ratio",
+    "avg_delay_days", "revenue_volatility", "record_count", "updated_at"
+]
+
+def month_number(months):
+    """YYYY-MM strings to consecutive integers (year * 12 + month - 1)."""
+    import numpy as np
+    import pandas as pd
+
+    months = pd.Series(months, dtype=str)
+    years = months.str.slice(0, 4).astype(np.int64).to_numpy()
+    return years * 12 + months.str.slice(5, 7).astype(np.int64).to_numpy() - 1
+
+def shift_month(month: str, delta: int) -> str:
+    number = int(month_number([month])[0]) + delta
+    return f"{number // 12:04d}-{number % 12 + 1:02d}"
+
+def level_of(score: float) -> str:
+    return next(name for bound, name in LEVELS if score >= bound)
+
+def window_sums(aggregates, window: int = RISK_WINDOW_MONTHS):
+    """
+    Trailing `window`-month sums of STAT_COLUMNS for each row of aggregates, which
+    must be sorted by (account_id, month). Missing months count as empty.
+    """
+    import numpy as np
+    import pandas as pd
+
+    account_code = pd.factorize(aggregates["account_id"])[0].astype(np.int64)
+    # Months are < 10^6, so this key is sorted and never mixes accounts
+    key = account_code * 1_000_000 + month_number(aggregates["month"])
+    start = np.searchsorted(key, key - (window - 1), side="left")
+
+    values = aggregates[STAT_COLUMNS].to_numpy(dtype=float)
+    cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    return cumulative[1:] - cumulative[start]
+
+def score_windows(aggregates):
+    """Risk signals, score and level for every (account_id, month) row of aggregates (a DataFrame)."""
+    import numpy as np
+
+    aggregates = aggregates.sort_values(["account_id", "month"], ignore_index=True)
+    n, revenue, revenue_sumsq, expense, overdue, delay = window_sums(aggregates).T
+
+    has_revenue = revenue > 0
+    mean = np.divide(revenue, n, out=np.zeros_like(n), where=n > 0)
+    variance = np.divide(revenue_sumsq - revenue * mean, n - 1, out=np.zeros_like(n), where=n > 1)
+
+    scores = aggregates[["account_id", "month"]].copy()
+    scores["expense_ratio"] = np.divide(expense, revenue, out=np.zeros_like(n), where=has_revenue)
+    scores["overdue_ratio"] = np.divide(overdue, revenue, out=np.zeros_like(n), where=has_revenue)
+    scores["avg_delay_days"] = np.divide(delay, n, out=np.zeros_like(n), where=n > 0)
+    scores["revenue_volatility"] = np.divide(
+        np.sqrt(np.clip(variance, 0, None)), mean, out=np.zeros_like(n), where=mean > 0
+    )
+    scores["record_count"] = n.astype(np.int64)
+
+    score = np.zeros_like(n)
+    for signal, (healthy, critical, weight) in SIGNALS.items():
+        score += weight * np.clip((scores[signal].to_numpy() - healthy) / (critical - healthy), 0, 1)
+    scores["score"] = np.round(score * 100, 2)
+    scores["level"] = np.select(
+        [scores["score"] >= bound for bound, _ in LEVELS[:-1]],
+        [name for _, name in LEVELS[:-1]],
+        default=LEVELS[-1][1]
+    )
+    return scores
+
+def update_risk_scores(db: Session, owner_id: int, touched) -> int:
+    """
+    Recompute the owner's stored scores after the (account_id, month) pairs in `touched` changed.
+    Rescores each touched account from its first touched month up to
+    RISK_WINDOW_MONTHS - 1 months past its last one. Returns the number of scores written.
+    Also refreshes the owner's portfolio_risk row.
+    """
+    import pandas as pd
+
+    touched = pd.DataFrame(list(touched), columns=["account_id", "month"])
+    if touched.empty:
+        return 0
+    written = _rescore(db, owner_id, touched)
+    refresh_portfolio_risk(db, owner_id)
+    return written
+
+def _rescore(db: Session, owner_id: int, touched) -> int:
+    import pandas as pd
+
+    bounds = touched.groupby("account_id")["month"].agg(["min", "max"])
+    first = shift_month(bounds["min"].min(), -(RISK_WINDOW_MONTHS - 1))
+    last = shift_month(bounds["max"].max(), RISK_WINDOW_MONTHS - 1)
+
+    rows = db.execute(
+        select(FinancialAggregate.account_id, FinancialAggregate.month, *[
+            FinancialAggregate.__table__.c[column] for column in STAT_COLUMNS
+        ]).where(
+            FinancialAggregate.owner_id == owner_id,
+            FinancialAggregate.account_id.in_(bounds.index.tolist()),
+            FinancialAggregate.month.between(first, last)
+        )
+    ).all()
+    if not rows:
+        return 0
+
+    scores = score_windows(pd.DataFrame(rows, columns=["account_id", "month", *STAT_COLUMNS]))
+
+    # Keep only months whose window contains a touched month
+    account_bounds = bounds.reindex(scores["account_id"])
+    month = month_number(scores["month"])
+    affected = (month >= month_number(account_bounds["min"])) & (
+        month <= month_number(account_bounds["max"]) + RISK_WINDOW_MONTHS - 1
+    )
+    scores = scores[affected]
+    if scores.empty:
+        return 0
+    scores["owner_id"] = owner_id
+    scores["updated_at"] = datetime.utcnow()
+
+    table = AccountRisk.__table__
+    stmt = upsert_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.owner_id, table.c.account_id, table.c.month],
+        set_={column: stmt.excluded[column] for column in RISK_COLUMNS[3:]}
+    )
+    db.execute(stmt, scores[RISK_COLUMNS].to_dict(orient="records"))
+    return len(scores)
+
+def touched_by_months(db: Session, months: list) -> dict:
+    """
+    (account_id, month) pairs stored for the given months, per owner_id, e.g. before
+    the months are dropped.
+    """
+    touched = {}
+    if not months:
+        return touched
+    rows = db.execute(
+        select(FinancialAggregate.owner_id, FinancialAggregate.account_id, FinancialAggregate.month)
+        .where(FinancialAggregate.month.in_(months))
+    ).all()
+    for owner_id, account_id, month in rows:
+        touched.setdefault(owner_id, []).append((account_id, month))
+    return touched
+
+def latest_scores(owner_id: int):
+    """Subquery selecting the most recent score of each of the owner's accounts."""
+    latest = select(
+        AccountRisk.account_id, func.max(AccountRisk.month).label("month")
+    ).where(AccountRisk.owner_id == owner_id).group_by(AccountRisk.account_id).subquery()
+    return select(AccountRisk).where(AccountRisk.owner_id == owner_id).join(
+        latest, (AccountRisk.account_id == latest.c.account_id) & (AccountRisk.month == latest.c.month)
+    )
+
+def refresh_portfolio_risk(db: Session, owner_id: int):
+    """
+    Recompute the owner's portfolio_risk row from each account's latest score, in the
+    caller's transaction (deleted when no account is scored). Runs at write time only.
+    """
+    latest = latest_scores(owner_id).subquery()
+    rows = db.execute(
+        select(latest.c.level, func.count(), func.avg(latest.c.score), func.max(latest.c.month))
+        .group_by(latest.c.level)
+    ).all()
+    if not rows:
+        db.execute(delete(PortfolioRisk).where(PortfolioRisk.owner_id == owner_id))
+        return
+
+    counts = {level: count for level, count, _, _ in rows}
+    average = sum(count * avg for _, count, avg, _ in rows) / sum(counts.values())
+    values = {
+        "average_score": round(average, 2),
+        "level": level_of(average),
+        "accounts_low": counts.get("Low", 0),
+        "accounts_medium": counts.get("Medium", 0),
+        "accounts_high": counts.get("High", 0),
+        "as_of": max(month for _, _, _, month in rows),
+        "updated_at": datetime.utcnow()
+    }
+    stmt = upsert_insert(db, PortfolioRisk.__table__).values(owner_id=owner_id, **values)
+    db.execute(stmt.on_conflict_do_update(index_elements=[PortfolioRisk.owner_id], set_=values))
+
+def portfolio_risk(db: Session, owner_id: int):
+    """The owner's stored portfolio risk: average latest score, its level and accounts per level."""
+    row = db.get(PortfolioRisk, owner_id)
+    if row is None:
+        return None
+    return {
+        "level": row.level,
+        "average_score": row.average_score,
+        "accounts": {"High": row.accounts_high, "Medium": row.accounts_medium, "Low": row.accounts_low},
+        "as_of": row.as_of
+    }
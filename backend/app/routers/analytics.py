@@ -1,94 +1,451 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, tuple_, select
 from app.database import get_db
-from app.models import FinancialRecord
-from app.auth import get_current_user
+from app.models import FinancialRecord, FinancialAggregate, DashboardTotals, MonthlyTotals, AccountRisk
+from app.risk import portfolio_risk, latest_scores
+from app.schemas import MONTH_PATTERN, FinancialRecordResponse, AnalyticsQuery
+from app.auth import get_current_user, get_stream_user
 from app.models import User
-from typing import List, Dict
+from app.caching import VersionedResponse, conditional_get
+from typing import List, Dict, Optional
+from datetime import date
+import base64
+import json
 
 router = APIRouter(
     prefix="/dashboard",
-    tags=["dashboard"]
+    tags=["dashboard"],
+    default_response_class=ORJSONResponse
 )
 
+# Record fields projected straight from the table, in FinancialRecordResponse order
+RECORD_FIELDS = list(FinancialRecordResponse.model_fields)
+RECORD_COLUMNS = [FinancialRecord.__table__.c[field] for field in RECORD_FIELDS]
+
 @router.get("/summary")
 def get_dashboard_summary(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    versioned: VersionedResponse = Depends(conditional_get)
 ):
     """
-    Get high-level financial summary: Total Revenue, Total Expense, Net Balance.
+    Get high-level financial summary of the current user's data: Total Revenue, Total
+    Expense, Net Balance. Served from the user's running totals row; falls back to one
+    combined scan of their records when it is cold.
+    Like every dashboard GET, tagged with the data version (ETag / 304, response cache).
     """
+    cached = versioned.cached()
+    if cached is not None:
+        return cached
     try:
-        # Aggregations
-        total_revenue = db.query(func.sum(FinancialRecord.revenue)).scalar() or 0.0
-        total_expense = db.query(func.sum(FinancialRecord.expense)).scalar() or 0.0
-        total_balance = db.query(func.sum(FinancialRecord.balance)).scalar() or 0.0
+        totals = db.get(DashboardTotals, current_user.id)
+        if totals is not None:
+            total_revenue = totals.total_revenue or 0.0
+            total_expense = totals.total_expense or 0.0
+            total_balance = totals.total_balance or 0.0
+        else:
+            sums = db.query(
+                func.sum(FinancialRecord.revenue),
+                func.sum(FinancialRecord.expense),
+                func.sum(FinancialRecord.balance)
+            ).filter(FinancialRecord.owner_id == current_user.id).one()
+            total_revenue, total_expense, total_balance = (value or 0.0 for value in sums)
         
         # Calculate Net Profit (Simplistic view same as balance here, or Revenue - Expense)
         net_profit = total_revenue - total_expense
+
+        # Precomputed by app.risk at upload time
+        risk = portfolio_risk(db, current_user.id)
         
-        return {
+        return versioned.store(ORJSONResponse({
             "total_revenue": total_revenue,
             "total_expense": total_expense,
             "net_profit": net_profit,
             "current_balance": total_balance,
-            # Placeholder for risk until ML phase
-            "risk_exposure": "Low (Stable)" 
-        }
+            "risk_exposure": (
+                f"{risk['level']} ({risk['accounts']['High']} high-risk accounts)" if risk else "Not scored"
+            ),
+            "risk": risk
+        }))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/trends")
 def get_financial_trends(
+    from_month: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    to_month: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    account_id: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    versioned: VersionedResponse = Depends(conditional_get)
 ):
     """
-    Get monthly trends for Revenue vs Expense.
+    Get monthly trends for Revenue vs Expense, optionally limited to a month range
+    (YYYY-MM, inclusive) and a single account.
+    Served from the monthly rollups, so the cost is one row per month in the window.
     """
+    cached = versioned.cached()
+    if cached is not None:
+        return cached
     try:
-        # Group by Month (using date truncation)
-        # SQLite usage might differ, but for PostgreSQL 'date_trunc' is standard.
-        # Assuming postgresql based on connection string.
-        
-        trends = db.query(
-            func.to_char(FinancialRecord.date, 'YYYY-MM').label('month'),
-            func.sum(FinancialRecord.revenue).label('revenue'),
-            func.sum(FinancialRecord.expense).label('expense')
-        ).group_by('month').order_by('month').all()
+        if account_id:
+            # Per-account series via the (owner_id, account_id, month) unique index
+            query = db.query(
+                FinancialAggregate.month.label('month'),
+                FinancialAggregate.revenue_sum.label('revenue'),
+                FinancialAggregate.expense_sum.label('expense')
+            ).filter(
+                FinancialAggregate.owner_id == current_user.id,
+                FinancialAggregate.account_id == account_id
+            )
+            month_column = FinancialAggregate.month
+        else:
+            query = db.query(
+                MonthlyTotals.month.label('month'),
+                MonthlyTotals.revenue_sum.label('revenue'),
+                MonthlyTotals.expense_sum.label('expense')
+            ).filter(MonthlyTotals.owner_id == current_user.id)
+            month_column = MonthlyTotals.month
+
+        # YYYY-MM strings sort chronologically, so plain comparisons select the window
+        if from_month:
+            query = query.filter(month_column >= from_month)
+        if to_month:
+            query = query.filter(month_column <= to_month)
+
+        trends = query.order_by(month_column).all()
         
-        return [
+        # Returning the response directly skips jsonable_encoder; orjson encodes the rows
+        return versioned.store(ORJSONResponse([
             {
                 "month": t.month,
                 "revenue": t.revenue,
                 "expense": t.expense
             }
             for t in trends
-        ]
+        ]))
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
 
+RISK_FIELDS = [
+    "account_id", "month", "score", "level", "expense_ratio", "overdue_ratio",
+    "avg_delay_days", "revenue_volatility", "record_count"
+]
+
+@router.get("/risk")
+def get_risk_scores(
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    account_id: Optional[str] = None,
+    level: Optional[str] = Query(None, pattern="^(Low|Medium|High)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    versioned: VersionedResponse = Depends(conditional_get)
+):
+    """
+    Precomputed account risk scores, riskiest first: each account's latest score, or
+    every account's score for `month`. With `account_id`, that account's monthly
+    history, newest first.
+    """
+    cached = versioned.cached()
+    if cached is not None:
+        return cached
+    try:
+        if account_id:
+            query = select(AccountRisk).where(
+                AccountRisk.owner_id == current_user.id, AccountRisk.account_id == account_id
+            )
+            order = [AccountRisk.month.desc()]
+        else:
+            query = select(AccountRisk).where(
+                AccountRisk.owner_id == current_user.id, AccountRisk.month == month
+            ) if month else latest_scores(current_user.id)
+            order = [AccountRisk.score.desc(), AccountRisk.account_id]
+        if level:
+            query = query.where(AccountRisk.level == level)
+
+        scores = db.execute(query.order_by(*order).limit(limit)).scalars().all()
+        return versioned.store(ORJSONResponse([
+            {field: getattr(score, field) for field in RISK_FIELDS} for score in scores
+        ]))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+DISTRIBUTION_METRICS = ["payment_delay_days", "overdue_amount", "revenue"]
+DISTRIBUTION_QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+@router.get("/distributions")
+def get_distributions(
+    metric: Optional[List[str]] = Query(None, description="payment_delay_days, overdue_amount and/or revenue"),
+    from_month: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    to_month: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    account_id: Optional[str] = None,
+    bins: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    versioned: VersionedResponse = Depends(conditional_get)
+):
+    """
+    Approximate p50/p90/p99, extremes and an equal-width histogram of payment delays,
+    overdue amounts and revenue over a month window (YYYY-MM, inclusive), for all
+    accounts or one. Merged from the per-month (or per account and month) quantile
+    sketches kept by app.sketches: every value reported is within `relative_accuracy`
+    (1%) of the exact one at that rank.
+    """
+    cached = versioned.cached()
+    if cached is not None:
+        return cached
+    metrics = metric or DISTRIBUTION_METRICS
+    unknown = set(metrics) - set(DISTRIBUTION_METRICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metric(s): {sorted(unknown)}")
+
+    # numpy loads on the first distribution request, not at startup
+    from app.sketches import distributions, RELATIVE_ACCURACY
+
+    try:
+        return versioned.store(ORJSONResponse({
+            "from": from_month,
+            "to": to_month,
+            "account_id": account_id,
+            "relative_accuracy": RELATIVE_ACCURACY,
+            "metrics": distributions(
+                db, current_user.id, metrics, from_month, to_month, account_id, DISTRIBUTION_QUANTILES, bins
+            )
+        }))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def month_bounds(from_month: Optional[str], to_month: Optional[str]):
+    """Date range [start, end) covering the YYYY-MM window; None for open ends."""
+    start = date.fromisoformat(f"{from_month}-01") if from_month else None
+    end = None
+    if to_month:
+        year, month = map(int, to_month.split("-"))
+        end = date(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+@router.get("/accounts/{account_id}")
+def get_account_detail(
+    account_id: str,
+    from_month: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    to_month: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    versioned: VersionedResponse = Depends(conditional_get)
+):
+    """
+    Drill-down for one account: monthly series, window totals, overdue and delay
+    statistics, and the latest balance as of the end of the window.
+    The series comes from financial_aggregates; the balance is an index-only scan.
+    """
+    cached = versioned.cached()
+    if cached is not None:
+        return cached
+    try:
+        query = db.query(FinancialAggregate).filter(
+            FinancialAggregate.owner_id == current_user.id,
+            FinancialAggregate.account_id == account_id
+        )
+        if from_month:
+            query = query.filter(FinancialAggregate.month >= from_month)
+        if to_month:
+            query = query.filter(FinancialAggregate.month <= to_month)
+        months = query.order_by(FinancialAggregate.month).all()
+
+        _, end = month_bounds(from_month, to_month)
+        latest = select(FinancialRecord.date, FinancialRecord.balance).where(
+            FinancialRecord.owner_id == current_user.id,
+            FinancialRecord.account_id == account_id
+        )
+        if end:
+            latest = latest.where(FinancialRecord.date < end)
+        latest = db.execute(
+            latest.order_by(FinancialRecord.date.desc(), FinancialRecord.id.desc()).limit(1)
+        ).first()
+
+        if not months and latest is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+        record_count = sum(m.record_count for m in months)
+        revenue = sum(m.revenue_sum for m in months)
+        expense = sum(m.expense_sum for m in months)
+
+        return versioned.store(ORJSONResponse({
+            "account_id": account_id,
+            "from": from_month,
+            "to": to_month,
+            "totals": {
+                "record_count": record_count,
+                "revenue": revenue,
+                "expense": expense,
+                "profit": revenue - expense,
+                "expense_ratio": expense / revenue if revenue > 0 else 0,
+                "overdue_amount": sum(m.overdue_sum for m in months),
+                "overdue_records": sum(m.overdue_count for m in months),
+                "delayed_records": sum(m.delayed_count for m in months),
+                "avg_payment_delay_days": sum(m.delay_sum for m in months) / record_count if record_count else 0,
+                "max_payment_delay_days": max((m.delay_max for m in months), default=0)
+            },
+            "latest_balance": {"date": latest.date, "balance": latest.balance} if latest else None,
+            "series": [
+                {
+                    "month": m.month,
+                    "record_count": m.record_count,
+                    "revenue": m.revenue_sum,
+                    "expense": m.expense_sum,
+                    "profit": m.profit,
+                    "expense_ratio": m.expense_ratio,
+                    "avg_revenue": m.avg_revenue,
+                    "cashflow_volatility": m.cashflow_volatility,
+                    "overdue_amount": m.overdue_sum,
+                    "overdue_records": m.overdue_count,
+                    "avg_payment_delay_days": m.delay_sum / m.record_count if m.record_count else 0,
+                    "max_payment_delay_days": m.delay_max
+                }
+                for m in months
+            ]
+        }))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def encode_cursor(record_date: date, record_id: int) -> str:
+    """Opaque keyset cursor for the (date, id) position of a record."""
+    raw = json.dumps([record_date.isoformat(), record_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        record_date, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        return date.fromisoformat(record_date), int(record_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def estimate_record_count(db: Session, owner_id: int):
+    """
+    Cheap row count: the owner's maintained counter in dashboard_totals (None while it
+    is cold; the planner's reltuples would count every owner's rows).
+    """
+    totals = db.get(DashboardTotals, owner_id)
+    return totals.record_count if totals is not None else None
+
 @router.get("/records")
 def get_financial_records(
     db: Session = Depends(get_db), 
-    skip: int = 0, 
-    limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    account_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    total: str = Query("estimate", pattern="^(exact|estimate|none)$"),
+    current_user: User = Depends(get_current_user),
+    versioned: VersionedResponse = Depends(conditional_get)
 ):
     """
-    Get raw financial records with pagination.
+    Get the current user's raw financial records ordered by (date, id).
+    Pass the returned next_cursor back as `cursor` for constant-time pages;
+    `skip` still works for offset paging but gets slower on deep pages.
+    `total` is exact (full count), estimate (maintained counter, unfiltered only) or none.
     """
+    cached = versioned.cached()
+    if cached is not None:
+        return cached
     try:
-        total = db.query(func.count(FinancialRecord.id)).scalar()
-        records = db.query(FinancialRecord).offset(skip).limit(limit).all()
+        # Core select of plain tuples; no ORM objects are built per row
+        query = select(*RECORD_COLUMNS).where(FinancialRecord.owner_id == current_user.id)
+        filtered = bool(account_id or date_from or date_to)
+        if account_id:
+            query = query.where(FinancialRecord.account_id == account_id)
+        if date_from:
+            query = query.where(FinancialRecord.date >= date_from)
+        if date_to:
+            query = query.where(FinancialRecord.date <= date_to)
+
+        if total == "exact":
+            total_count = db.execute(
+                query.with_only_columns(func.count(FinancialRecord.id))
+            ).scalar()
+        elif total == "estimate" and not filtered:
+            total_count = estimate_record_count(db, current_user.id)
+        else:
+            total_count = None
+
+        position = tuple_(FinancialRecord.date, FinancialRecord.id)
+        if order == "desc":
+            query = query.order_by(FinancialRecord.date.desc(), FinancialRecord.id.desc())
+        else:
+            query = query.order_by(FinancialRecord.date, FinancialRecord.id)
+
+        if cursor:
+            after = tuple_(*decode_cursor(cursor))
+            query = query.where(position < after if order == "desc" else position > after)
+        elif skip:
+            query = query.offset(skip)
+
+        # One extra row tells us whether another page exists
+        records = db.execute(query.limit(limit + 1)).all()
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_cursor = encode_cursor(records[-1].date, records[-1].id)
         
-        return {
-            "total": total,
+        return versioned.store(ORJSONResponse({
+            "total": total_count,
             "skip": skip,
             "limit": limit,
-            "data": records
-        }
+            "next_cursor": next_cursor,
+            "data": [dict(zip(RECORD_FIELDS, row)) for row in records]
+        }))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query")
+def run_adhoc_query(
+    query: AnalyticsQuery,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ad-hoc group-by over account_id, month and delay_bucket with sum/mean/std/min/max
+    and percentile metrics over the current user's data. Evaluated in memory against
+    this worker's columnar snapshot of the user's financial_records, which catches up
+    with new uploads before the query.
+    """
+    # numpy/pandas load on the first query, not at startup
+    from app.query_engine import run_query, QueryError
+    from app.snapshot import SnapshotTooLarge
+
+    try:
+        return ORJSONResponse(run_query(current_user.id, query))
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SnapshotTooLarge as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stream")
+def stream_dashboard(current_user: User = Depends(get_stream_user)):
+    """
+    Server-Sent Events replacing dashboard polling. Starts with a `ready` event carrying
+    the current data version and totals, then pushes `upload`, `cleared`, `retention` or
+    `changed` events with the new version and totals (plus the changed months and
+    accounts) whenever the user's data changes. Each event's id is the data version.
+    Authenticate with the Bearer header or `?access_token=` (EventSource).
+    """
+    from app.events import event_stream
+
+    return StreamingResponse(
+        event_stream(current_user.id),
+        media_type="text/event-stream",
+        # Stop nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.database import get_db
 from app.models import User
-from app.auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.auth import hash_password_async, verify_and_update_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.metrics import histogram
 from datetime import timedelta
+import time
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# Endpoint latency, watched separately from password hashing time
+LOGIN_MS = histogram("auth_request_ms", "Login request latency", endpoint="login")
+REGISTER_MS = histogram("auth_request_ms", "Register request latency", endpoint="register")
+
 class UserCreate(BaseModel):
     email: str
     password: str
@@ -20,8 +27,8 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-@router.post("/register", response_model=Token)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+# Blocking DB helpers; the async handlers run them on the threadpool
+def _check_can_register(db: Session, email: str):
     # 1. Enforce 50 User Limit (Project Requirement)
     user_count = db.query(User).count()
     if user_count >= 50:
@@ -31,30 +38,52 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
 
     # Check if user exists
-    user = db.query(User).filter(User.email == user_data.email).first()
+    user = db.query(User).filter(User.email == email).first()
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    
-    # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    new_user = User(email=user_data.email, password_hash=hashed_password)
+
+def _create_user(db: Session, email: str, password_hash: str) -> User:
+    new_user = User(email=email, password_hash=password_hash)
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
-    
-    # Generate Token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": new_user.email}, expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer", "role": new_user.role}
+    return new_user
+
+def _get_user_by_email(db: Session, email: str):
+    return db.query(User).filter(User.email == email).first()
+
+def _update_password_hash(db: Session, user: User, password_hash: str):
+    user.password_hash = password_hash
+    db.commit()
+    db.refresh(user)
+
+@router.post("/register", response_model=Token)
+async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+    started = time.perf_counter()
+    try:
+        await run_in_threadpool(_check_can_register, db, user_data.email)
+        
+        # Create new user (bcrypt runs on the dedicated hashing pool)
+        hashed_password = await hash_password_async(user_data.password)
+        new_user = await run_in_threadpool(_create_user, db, user_data.email, hashed_password)
+        
+        # Generate Token
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": new_user.email}, expires_delta=access_token_expires
+        )
+        
+        return {"access_token": access_token, "token_type": "bearer", "role": new_user.role}
+    finally:
+        REGISTER_MS.observe((time.perf_counter() - started) * 1000)
 
 from typing import List
-from app.auth import get_current_user, get_current_admin_user
+from app.auth import get_current_admin_user, invalidate_principal, HASH_MS, VERIFY_MS
+from app.crud import bump_principal_revision, delete_owner_data
+from app.jobs import remove_reports
 
 class UserOut(BaseModel):
     id: int
@@ -80,14 +109,24 @@ def delete_user(
     current_user: User = Depends(get_current_admin_user)
 ):
     """
-    Delete a user by ID (Admin Only).
+    Delete a user by ID, together with all of their financial data (Admin Only).
     """
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    email = user.email
+    # Same transaction: the user's records, rollups, scores, sketches, ledger and jobs go with them
+    reports = delete_owner_data(db, user_id)
     db.delete(user)
+    # Other workers drop their cached principal of this user on their next revision check
+    bump_principal_revision(db)
     db.commit()
+    invalidate_principal(email)
+    remove_reports(reports)
+    # Imported here: app.snapshot loads pandas, which the API defers to first use
+    from app.snapshot import drop_snapshot
+    drop_snapshot(user_id)
     return None
 
 class TokenResponse(BaseModel):
@@ -96,18 +135,41 @@ class TokenResponse(BaseModel):
     role: str
 
 @router.post("/login", response_model=TokenResponse)
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == user_data.email).first()
-    if not user or not verify_password(user_data.password, user.password_hash):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
+async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+    started = time.perf_counter()
+    try:
+        user = await run_in_threadpool(_get_user_by_email, db, user_data.email)
+        valid, new_hash = False, None
+        if user:
+            valid, new_hash = await verify_and_update_password(user_data.password, user.password_hash)
+        if not valid:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect email or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        # Transparent rehash when BCRYPT_ROUNDS (or the scheme) changed
+        if new_hash:
+            await run_in_threadpool(_update_password_hash, db, user, new_hash)
+        
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": user.email}, expires_delta=access_token_expires
         )
-    
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer", "role": user.role}
+        
+        return {"access_token": access_token, "token_type": "bearer", "role": user.role}
+    finally:
+        LOGIN_MS.observe((time.perf_counter() - started) * 1000)
+
+@router.get("/metrics")
+def get_auth_metrics(current_user: User = Depends(get_current_admin_user)):
+    """
+    Login/register latency and bcrypt timing histograms (Admin Only).
+    """
+    return {
+        "login_ms": LOGIN_MS.snapshot(),
+        "register_ms": REGISTER_MS.snapshot(),
+        "hash_ms": HASH_MS.snapshot(),
+        "verify_ms": VERIFY_MS.snapshot()
+    }
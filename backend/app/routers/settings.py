@@ -1,23 +1,112 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.database import get_db
+from sqlalchemy import text, delete
+from app.database import get_db, pool_status
+from app.caching import response_cache
+from app.auth import get_current_user, get_current_admin_user
+from app.models import User, DashboardTotals
+from app.crud import clear_owner_data, remove_months, bump_data_version, bump_all_data_versions
+from app.partitions import is_partitioned, drop_partitions
+from app.risk import update_risk_scores, touched_by_months, refresh_portfolio_risk
+from app.schemas import MONTH_PATTERN
+from app.events import broadcaster, publish_changes
+from datetime import date
 
 router = APIRouter(
     prefix="/settings",
     tags=["settings"]
 )
 
+def _drop_snapshot(owner_id: int | None = None):
+    # Imported here: app.snapshot loads pandas, which the API defers to first use
+    from app.snapshot import drop_snapshot
+    drop_snapshot(owner_id)
+
 @router.delete("/clear-data")
-def clear_all_data(db: Session = Depends(get_db)):
+def clear_all_data(
+    all_tenants: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
     """
-    DANGER: Clears all financial records.
+    DANGER: Clears the current user's financial records, rollups and upload ledger.
+    With `all_tenants=true` (Admin Only), clears every user's data.
     """
+    if all_tenants and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="The user doesn't have enough privileges")
     try:
-        # Use execute with text() for safe raw SQL execution or use ORM delete
-        db.execute(text("TRUNCATE TABLE financial_records"))
+        if not all_tenants:
+            # Owner-leading indexes make this a range delete of the user's slice only
+            removed = clear_owner_data(db, current_user.id)
+            db.commit()
+            _drop_snapshot(current_user.id)
+            publish_changes([current_user.id], "cleared")
+            return {"message": "Your financial data was cleared successfully.", "records_deleted": removed}
+
+        # Dropping monthly partitions is O(1) per month; older unpartitioned tables are truncated
+        if is_partitioned(db):
+            drop_partitions(db)
+        else:
+            db.execute(text("TRUNCATE TABLE financial_records"))
+        # Aggregates are merged across uploads, so they must be reset with the records;
+        # the ledger goes too so the same files can be uploaded again
+        db.execute(text(
+            "TRUNCATE TABLE financial_aggregates, monthly_totals, account_risk, portfolio_risk, "
+            "account_distributions, monthly_distributions, upload_ledger"
+        ))
+        db.execute(delete(DashboardTotals))
+        bump_all_data_versions(db)
         db.commit()
+        _drop_snapshot()
+        publish_changes(broadcaster.owners(), "cleared")
         return {"message": "All financial data cleared successfully."}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/partitions")
+def drop_months_before(
+    before: str = Query(..., pattern=MONTH_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Retention: drop every month of records older than `before` (YYYY-MM) by dropping
+    whole partitions, and remove those months from the rollups (Admin Only).
+    """
+    if not is_partitioned(db):
+        raise HTTPException(status_code=400, detail="financial_records is not partitioned. Run fix_schema.py first.")
+    try:
+        year, month = map(int, before.split("-"))
+        dropped = drop_partitions(db, before=date(year, month, 1))
+        # Later months whose risk window reached into the dropped ones are rescored
+        touched = touched_by_months(db, dropped)
+        owners = remove_months(db, dropped)
+        for owner_id, pairs in touched.items():
+            update_risk_scores(db, owner_id, pairs)
+        # Owners losing only unscored months still lose those months' scores
+        for owner_id in set(owners) - set(touched):
+            refresh_portfolio_risk(db, owner_id)
+        changed = set(owners) | set(touched)
+        for owner_id in changed:
+            bump_data_version(db, owner_id)
+        db.commit()
+        publish_changes(changed, "retention", months_removed=dropped)
+        return {"message": f"Dropped {len(dropped)} month(s).", "months": dropped}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/db-pool")
+def get_db_pool_stats(current_user: User = Depends(get_current_admin_user)):
+    """
+    Connection pool statistics for sizing (Admin Only).
+    """
+    return pool_status()
+
+@router.get("/response-cache")
+def get_response_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """
+    Dashboard response cache statistics of this worker (Admin Only).
+    """
+    return response_cache.stats()
@@ -1,107 +1,99 @@
-from fastapi import APIRouter, UploadFile, File, Depends
-from sqlalchemy.orm import Session
-import pandas as pd
-from datetime import datetime
-from app.database import SessionLocal
-from app.models import FinancialRecord, FinancialAggregate
+import os
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from app.auth import get_current_user
 from app.models import User
-import io
-import numpy as np
+from app.jobs import spool_upload, submit_ingest, get_job, find_duplicate
 
 router = APIRouter(prefix="/upload", tags=["Financial Upload"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@router.post("/financial-data")
+@router.post("/financial-data", status_code=status.HTTP_202_ACCEPTED)
 async def upload_financial_data(
+    response: Response,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Read file content safely
-    contents = await file.read()
-    df = pd.read_csv(io.BytesIO(contents))
+    """
+    Accept an upload and queue it for background ingestion.
+    Poll GET /upload/jobs/{job_id} for progress and the final result.
+    Rows are stored under the current user and only visible to them. Rows failing
+    validation are skipped; the job result counts them by reason and links a report.
+    A file whose exact bytes the user already ingested is skipped (200, status "duplicate").
+    """
+    # Copy the spooled upload off the event loop; the request's file is closed afterwards
+    path, content_hash, size = await run_in_threadpool(spool_upload, file.file)
+
+    existing = await run_in_threadpool(find_duplicate, current_user.id, content_hash)
+    if existing is not None:
+        os.remove(path)
+        response.status_code = status.HTTP_200_OK
+        return {
+            "message": "Identical file already ingested. Skipped.",
+            "status": "duplicate",
+            "content_hash": content_hash,
+            "ingested_at": existing.created_at,
+            "records_inserted": existing.records_inserted,
+            "records_rejected": existing.records_rejected
+        }
 
-    # Normalize column names
-    df.columns = [c.lower().strip() for c in df.columns]
+    job = await run_in_threadpool(
+        submit_ingest, path, file.filename, current_user.id, current_user.email, content_hash, size
+    )
 
-    required_columns = {
-        "account_id", "date", "revenue", "expense", "balance",
-        "transaction_count", "overdue_amount", "payment_delay_days"
+    return {
+        "message": "Upload accepted. Processing in background.",
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/upload/jobs/{job.id}"
     }
 
-    if not required_columns.issubset(df.columns):
-        missing = required_columns - set(df.columns)
-        return {"error": f"CSV structure invalid. Missing: {missing}"}
+@router.get("/jobs/{job_id}")
+def get_upload_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the status, rows processed so far and result of an ingest job.
+    """
+    return _visible_job(job_id, current_user).to_dict()
 
-    # Data Type Conversion & Validation
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.strftime('%Y-%m') # Create month column for aggregation
+def _visible_job(job_id: str, current_user: User):
+    job = get_job(job_id)
+    if job is None or (job.owner_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-    records = []
-    for _, row in df.iterrows():
-        records.append(
-            FinancialRecord(
-                account_id=str(row["account_id"]),
-                date=row["date"].date(),
-                revenue=float(row["revenue"]),
-                expense=float(row["expense"]),
-                balance=float(row["balance"]),
-                transaction_count=int(row["transaction_count"]),
-                overdue_amount=float(row["overdue_amount"]),
-                payment_delay_days=int(row["payment_delay_days"]),
-                created_at=datetime.utcnow()
-            )
-        )
+def _ndjson_lines(path: str):
+    # pandas loads on the first NDJSON download, not at startup
+    import pandas as pd
 
-    db.add_all(records)
-    
-    # --- Aggregation Logic (Table 3 Generation) ---
-    # Group by account_id and month
-    agg_df = df.groupby(['account_id', 'month']).agg(
-        avg_revenue=('revenue', 'mean'),
-        avg_expense=('expense', 'mean'),
-        total_revenue=('revenue', 'sum'),
-        total_expense=('expense', 'sum'),
-        cashflow_volatility=('revenue', 'std') # Simple volatility metric
-    ).reset_index()
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=50000):
+        chunk["row_number"] = chunk["row_number"].astype(int)
+        yield chunk.to_json(orient="records", lines=True)
 
-    # Calculate derived metrics
-    agg_df['profit'] = agg_df['total_revenue'] - agg_df['total_expense']
-    agg_df['expense_ratio'] = agg_df.apply(lambda x: x['total_expense'] / x['total_revenue'] if x['total_revenue'] > 0 else 0, axis=1)
-    agg_df['cashflow_volatility'] = agg_df['cashflow_volatility'].fillna(0) # Handle single-record months
+@router.get("/jobs/{job_id}/rejected")
+def download_rejected_rows(
+    job_id: str,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Download the rows of a finished job that failed validation, as read from the file,
+    with their 1-based data row number and the reasons (CSV or NDJSON).
+    """
+    job = _visible_job(job_id, current_user)
+    if not job.finished:
+        raise HTTPException(status_code=409, detail="Job is still running")
+    path = job.rejected_path
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No rejected rows for this job")
 
-    aggregates = []
-    for _, row in agg_df.iterrows():
-        aggregates.append(
-            FinancialAggregate(
-                account_id=str(row['account_id']),
-                month=str(row['month']),
-                avg_revenue=float(row['avg_revenue']),
-                avg_expense=float(row['avg_expense']),
-                profit=float(row['profit']),
-                expense_ratio=float(row['expense_ratio']),
-                cashflow_volatility=float(row['cashflow_volatility']),
-                created_at=datetime.utcnow()
-            )
+    stem = os.path.splitext(job.filename or "upload")[0]
+    if format == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(path),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{stem}-rejected.ndjson"'}
         )
-    
-    db.add_all(aggregates)
-    
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        return {"error": f"Database commit failed: {str(e)}"}
-
-    return {
-        "message": "Upload successful. Records and Aggregates generated.",
-        "records_inserted": len(records),
-        "aggregates_generated": len(aggregates)
-    }
+    return FileResponse(path, media_type="text/csv", filename=f"{stem}-rejected.csv")
@@ -1,5 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date
+from typing import List, Literal, Optional, Union
+
+# Month strings used by rollups and filters (YYYY-MM)
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
 
 # 1. Schema for reading data (Output)
 class FinancialRecordResponse(BaseModel):
@@ -14,4 +18,37 @@ class FinancialRecordResponse(BaseModel):
     payment_delay_days: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+# 2. Ad-hoc query (POST /dashboard/query)
+QueryDimension = Literal["account_id", "month", "delay_bucket"]
+QueryColumn = Literal[
+    "revenue", "expense", "profit", "balance", "overdue_amount", "payment_delay_days", "transaction_count"
+]
+QueryAggregate = Literal[
+    "count", "sum", "mean", "std", "min", "max", "median", "p25", "p50", "p75", "p90", "p95", "p99"
+]
+
+class QueryMetric(BaseModel):
+    column: QueryColumn
+    agg: QueryAggregate
+
+    @property
+    def name(self) -> str:
+        return f"{self.column}_{self.agg}"
+
+class QueryFilter(BaseModel):
+    # Months are YYYY-MM, dates YYYY-MM-DD, delay buckets one of 0, 1-30, 31-60, 61-90, 90+
+    column: Union[Literal["account_id", "month", "date", "delay_bucket"], QueryColumn]
+    op: Literal["eq", "ne", "lt", "le", "gt", "ge", "in", "between"] = "eq"
+    value: Union[List[Union[float, str]], float, str]
+
+    def values(self) -> list:
+        return self.value if isinstance(self.value, list) else [self.value]
+
+class AnalyticsQuery(BaseModel):
+    dimensions: List[QueryDimension] = Field(default_factory=list, max_length=3)
+    metrics: List[QueryMetric] = Field(..., min_length=1)
+    filters: List[QueryFilter] = Field(default_factory=list)
+    order_by: Optional[str] = None
+    descending: bool = True
+    limit: int = Field(1000, ge=1, le=10000)
@@ -0,0 +1,314 @@
+"""
+Mergeable quantile sketches of payment_delay_days, overdue_amount and revenue.
+
+Values are counted in logarithmic buckets (the DDSketch scheme): with
+gamma = (1 + a) / (1 - a), bucket k holds the values in (gamma^(k-1), gamma^k]
+and reports them as 2 * gamma^k / (gamma + 1). Exact zeros (and negatives, which
+validation rejects) have a bucket of their own that reports 0.
+
+Error bound: every quantile, minimum and maximum returned is within a relative
+error of a = RELATIVE_ACCURACY (1%) of the exact value at that rank (nearest
+rank), for any distribution and any number of merges. Zeros are exact. The bound
+holds for values between gamma^-32767 and gamma^32767 (about 1e-282 to 1e282).
+Histogram bins are counted from the bucket values, so only values within a of a
+bin edge can land in the neighbouring bin.
+
+A sketch is a sorted array of int16 bucket keys with an int64 count per key.
+Two sketches merge by adding counts, so sketches are stored per (owner, account,
+month, metric) and per (owner, month, metric), merged with the new rows in the
+upload transaction, and added up at query time. Reading a month range costs one
+row per month and metric, whatever the number of records.
+"""
+import io
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, text, null
+from sqlalchemy.orm import Session
+
+from app.models import AccountDistribution, MonthlyDistribution
+from app.crud import upsert_insert
+
+SKETCH_METRICS = ["payment_delay_days", "overdue_amount", "revenue"]
+
+# Stored sketches depend on it: changing it requires rebuilding them from the records
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = np.log(GAMMA)
+
+ZERO_KEY = -32768
+MAX_KEY = 32767
+KEY_DTYPE = np.dtype("<i2")
+COUNT_DTYPE = np.dtype("<i8")
+
+# Bucket entries (16 bytes each) an upload accumulates before merging them into the stored sketches
+SKETCH_FLUSH_ENTRIES = int(os.getenv("SKETCH_FLUSH_ENTRIES", "5000000"))
+
+# Advisory lock serializing sketch merges of one owner's concurrent uploads
+SKETCH_LOCK = "distribution_sketches"
+
+def bucket_keys(values: np.ndarray) -> np.ndarray:
+    """Bucket key of each value."""
+    keys = np.full(len(values), ZERO_KEY, dtype=np.int16)
+    positive = values > 0
+    keys[positive] = np.clip(np.ceil(np.log(values[positive]) / LOG_GAMMA), -MAX_KEY, MAX_KEY)
+    return keys
+
+def bucket_values(keys: np.ndarray) -> np.ndarray:
+    """Value reported for each bucket key."""
+    values = 2 * np.power(GAMMA, keys.astype(np.float64)) / (GAMMA + 1)
+    values[keys == ZERO_KEY] = 0.0
+    return values
+
+# Bucket entries are packed into one int64: account code | month | metric | bucket key
+KEY_BITS = 16
+METRIC_BITS = 2
+MONTH_BITS = 16
+GROUP_SHIFT = KEY_BITS
+MONTH_SHIFT = KEY_BITS + METRIC_BITS
+ACCOUNT_SHIFT = MONTH_SHIFT + MONTH_BITS
+MONTH_OFFSET = 1 << (MONTH_BITS - 1)  # Months before 1970 stay positive
+
+def _pack(accounts, months, metric: int, keys) -> np.ndarray:
+    return (
+        (accounts.astype(np.int64) << ACCOUNT_SHIFT)
+        | ((months.astype(np.int64) + MONTH_OFFSET) << MONTH_SHIFT)
+        | (np.int64(metric) << GROUP_SHIFT)
+        | (keys.astype(np.int64) - ZERO_KEY)
+    )
+
+def _month_label(month: int) -> str:
+    """Packed month (months since 1970-01 plus MONTH_OFFSET) to YYYY-MM."""
+    month -= MONTH_OFFSET
+    return f"{1970 + month // 12:04d}-{month % 12 + 1:02d}"
+
+def _combine(codes: list, counts: list):
+    """Sum the counts of equal codes. Returns (sorted unique codes, counts)."""
+    codes = np.concatenate(codes)
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return unique, np.bincount(inverse, weights=np.concatenate(counts), minlength=len(unique)).astype(np.int64)
+
+class SketchBuilder:
+    """
+    Collects the bucket counts of one upload's inserted rows and merges them into the
+    owner's stored sketches, at the latest on flush(). Memory is bounded by
+    SKETCH_FLUSH_ENTRIES distinct (account, month, metric, bucket) entries.
+    """
+
+    def __init__(self, db: Session, owner_id: int):
+        self.db = db
+        self.owner_id = owner_id
+        self.sketches_written = 0
+        self._account_codes = {}
+        self._accounts = []  # account code -> account_id
+        self._codes = []
+        self._counts = []
+        self._pending = 0
+        self._locked = False
+
+    def _encode_accounts(self, account_ids: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(account_ids)
+        for account in uniques:
+            if account not in self._account_codes:
+                self._account_codes[account] = len(self._accounts)
+                self._accounts.append(account)
+        return np.array([self._account_codes[account] for account in uniques], dtype=np.int64)[codes]
+
+    def add(self, records: pd.DataFrame):
+        """Count the buckets of a chunk of inserted records."""
+        if records.empty:
+            return
+        accounts = self._encode_accounts(records["account_id"])
+        months = records["date"].to_numpy().astype("datetime64[M]").astype(np.int64)
+        codes = np.concatenate([
+            _pack(accounts, months, metric, bucket_keys(records[name].to_numpy(dtype=np.float64)))
+            for metric, name in enumerate(SKETCH_METRICS)
+        ])
+        codes, counts = np.unique(codes, return_counts=True)
+        self._codes.append(codes)
+        self._counts.append(counts)
+        self._pending += len(codes)
+        if self._pending >= SKETCH_FLUSH_ENTRIES:
+            self.flush()
+
+    def flush(self) -> int:
+        """Merge the counts collected so far into the stored sketches. Returns the sketches written."""
+        if not self._codes:
+            return 0
+        codes, counts = _combine(self._codes, self._counts)
+        self._codes, self._counts, self._pending = [], [], 0
+
+        if not self._locked and self.db.get_bind().dialect.name == "postgresql":
+            # Held until commit: merges read, add to and rewrite the stored sketches
+            self.db.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"{SKETCH_LOCK}:{self.owner_id}"}
+            )
+            self._locked = True
+
+        written = self._merge(AccountDistribution, codes, counts)
+        # The monthly sketches are the same entries without the account
+        written += self._merge(MonthlyDistribution, *_combine([codes & ((1 << ACCOUNT_SHIFT) - 1)], [counts]))
+        self.sketches_written += written
+        return written
+
+    def _merge(self, model, codes: np.ndarray, counts: np.ndarray) -> int:
+        """Add (code, count) entries to the stored sketches of their groups and write them back."""
+        per_account = model is AccountDistribution
+        groups = np.unique(codes >> GROUP_SHIFT)
+        labels = {
+            int(month): _month_label(int(month))
+            for month in np.unique((groups >> (MONTH_SHIFT - GROUP_SHIFT)) & ((1 << MONTH_BITS) - 1))
+        }
+        month_codes = {label: month for month, label in labels.items()}
+
+        columns = [model.month, model.metric, model.bucket_keys, model.bucket_counts]
+        query = select(model.account_id if per_account else null(), *columns).where(
+            model.owner_id == self.owner_id, model.month.in_(list(labels.values()))
+        )
+        if per_account:
+            accounts = np.unique(groups >> (ACCOUNT_SHIFT - GROUP_SHIFT))
+            query = query.where(model.account_id.in_([self._accounts[account] for account in accounts]))
+        stored = self.db.execute(query).all()
+
+        if stored:
+            stored_groups = np.array([
+                (self._account_codes[account_id] if per_account else 0) << (ACCOUNT_SHIFT - GROUP_SHIFT)
+                | month_codes[month] << (MONTH_SHIFT - GROUP_SHIFT)
+                | SKETCH_METRICS.index(metric)
+                for account_id, month, metric, _, _ in stored
+            ], dtype=np.int64)
+            # Only sketches of touched groups are rewritten
+            kept = np.isin(stored_groups, groups)
+            stored = [row for row, keep in zip(stored, kept) if keep]
+            sizes = [len(row.bucket_keys) // KEY_DTYPE.itemsize for row in stored]
+            keys = np.frombuffer(b"".join(row.bucket_keys for row in stored), dtype=KEY_DTYPE)
+            stored_codes = np.repeat(stored_groups[kept], sizes) << GROUP_SHIFT
+            stored_codes |= keys.astype(np.int64) - ZERO_KEY
+            stored_counts = np.frombuffer(b"".join(row.bucket_counts for row in stored), dtype=COUNT_DTYPE)
+            codes, counts = _combine([codes, stored_codes], [counts, stored_counts])
+
+        # Codes are sorted, so every group's buckets are contiguous and ascending
+        group_of = codes >> GROUP_SHIFT
+        starts = np.flatnonzero(np.diff(group_of, prepend=-1))
+        ends = np.append(starts[1:], len(codes))
+        key_bytes = ((codes & ((1 << KEY_BITS) - 1)) + ZERO_KEY).astype(KEY_DTYPE).tobytes()
+        count_bytes = counts.astype(COUNT_DTYPE).tobytes()
+
+        now = datetime.utcnow()
+        rows = []
+        for group, start, end in zip(group_of[starts].tolist(), starts.tolist(), ends.tolist()):
+            row = {
+                "owner_id": self.owner_id,
+                "month": labels[(group >> (MONTH_SHIFT - GROUP_SHIFT)) & ((1 << MONTH_BITS) - 1)],
+                "metric": SKETCH_METRICS[group & ((1 << METRIC_BITS) - 1)],
+                "bucket_keys": key_bytes[start * KEY_DTYPE.itemsize:end * KEY_DTYPE.itemsize],
+                "bucket_counts": count_bytes[start * COUNT_DTYPE.itemsize:end * COUNT_DTYPE.itemsize],
+                "updated_at": now,
+            }
+            if per_account:
+                row["account_id"] = self._accounts[group >> (ACCOUNT_SHIFT - GROUP_SHIFT)]
+            rows.append(row)
+        write_sketches(self.db, model, rows)
+        return len(rows)
+
+def write_sketches(db: Session, model, rows: list):
+    """
+    Insert or replace whole sketches. On PostgreSQL the rows are COPYed into a temp
+    staging table and moved over with one INSERT ... ON CONFLICT DO UPDATE, like
+    upsert_financial_records; elsewhere a Core executemany is used.
+    """
+    table = model.__table__
+    key_columns = [table.c[name] for name in ("owner_id", "account_id", "month", "metric") if name in table.c]
+    replaced = ("bucket_keys", "bucket_counts", "updated_at")
+
+    if db.get_bind().dialect.name != "postgresql":
+        stmt = upsert_insert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns, set_={column: stmt.excluded[column] for column in replaced}
+        )
+        db.execute(stmt, rows)
+        return
+
+    columns = [column.name for column in key_columns] + list(replaced)
+    staging = f"{table.name}_staging"
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS "
+        f"SELECT {', '.join(columns)} FROM {table.name} WITH NO DATA"
+    ))
+    db.execute(text(f"TRUNCATE {staging}"))
+
+    frame = pd.DataFrame(rows, columns=columns)
+    for column in ("bucket_keys", "bucket_counts"):
+        # bytea hex input format
+        frame[column] = ["\\x" + value.hex() for value in frame[column]]
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {staging} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+    keys = ", ".join(column.name for column in key_columns)
+    db.execute(text(
+        f"INSERT INTO {table.name} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {staging} "
+        f"ON CONFLICT ({keys}) DO UPDATE SET "
+        + ", ".join(f"{column} = EXCLUDED.{column}" for column in replaced)
+    ))
+
+def summarize(keys: np.ndarray, counts: np.ndarray, quantiles: dict, bins: int) -> dict:
+    """Count, extremes, quantiles and an equal-width histogram of a merged sketch."""
+    dense = np.bincount(keys.astype(np.int64) - ZERO_KEY, weights=counts, minlength=1 << 16)
+    present = np.flatnonzero(dense)
+    total = int(dense.sum())
+    if not total:
+        return {"count": 0, "min": None, "max": None, **{name: None for name in quantiles}, "histogram": []}
+
+    values = bucket_values((present + ZERO_KEY).astype(np.int16))
+    weights = dense[present]
+    cumulative = np.cumsum(weights)
+    result = {"count": total, "min": float(values[0]), "max": float(values[-1])}
+    for name, q in quantiles.items():
+        # Nearest rank: the smallest value with at least q * count values at or below it
+        rank = max(int(np.ceil(q * total)), 1)
+        result[name] = float(values[np.searchsorted(cumulative, rank)])
+
+    if values[-1] == values[0]:
+        # A single distinct value gets one zero-width bin (np.histogram would widen it to +-0.5)
+        result["histogram"] = [{"lower": result["min"], "upper": result["max"], "count": total}]
+        return result
+    hist, edges = np.histogram(values, bins=bins, range=(values[0], values[-1]), weights=weights)
+    result["histogram"] = [
+        {"lower": float(lower), "upper": float(upper), "count": int(count)}
+        for lower, upper, count in zip(edges[:-1], edges[1:], hist)
+    ]
+    return result
+
+def distributions(
+    db: Session, owner_id: int, metrics: list, from_month, to_month, account_id, quantiles: dict, bins: int
+) -> dict:
+    """Merge the owner's stored sketches for the window (one account or all) and summarize each metric."""
+    model = AccountDistribution if account_id else MonthlyDistribution
+    query = select(model.metric, model.bucket_keys, model.bucket_counts).where(
+        model.owner_id == owner_id, model.metric.in_(metrics)
+    )
+    if account_id:
+        query = query.where(model.account_id == account_id)
+    # YYYY-MM strings sort chronologically
+    if from_month:
+        query = query.where(model.month >= from_month)
+    if to_month:
+        query = query.where(model.month <= to_month)
+
+    rows = db.execute(query).all()
+    result = {}
+    for metric in metrics:
+        sketches = [row for row in rows if row.metric == metric]
+        keys = np.frombuffer(b"".join(row.bucket_keys for row in sketches), dtype=KEY_DTYPE)
+        counts = np.frombuffer(b"".join(row.bucket_counts for row in sketches), dtype=COUNT_DTYPE)
+        result[metric] = summarize(keys, counts.astype(np.float64), quantiles, bins)
+    return result
@@ -0,0 +1,216 @@
+"""
+In-memory columnar snapshots of financial_records for the ad-hoc query engine.
+
+Each worker holds one snapshot per user that has queried it, with that user's
+records as NumPy arrays: account codes, month numbers, dates and the measures. A
+snapshot is brought up to date before a query by comparing its data version with
+the user's version in the database:
+
+- same version: used as is
+- otherwise the user's rows with an id above the highest id held are appended. If
+  the row count then disagrees with the user's dashboard_totals, the snapshot is
+  rebuilt from scratch. That happens when records were deleted (clear-data,
+  retention drops) or when ids committed out of order.
+
+On PostgreSQL the version, the counter and the new rows are read in one
+REPEATABLE READ transaction, so they describe the same committed state. Bulk
+loads use COPY ... TO STDOUT.
+
+The registry is an LRU: snapshots idle for QUERY_SNAPSHOT_IDLE_SECONDS, and the
+least recently used beyond QUERY_SNAPSHOT_MAX_OWNERS snapshots or
+QUERY_SNAPSHOT_MAX_TOTAL_ROWS rows in the worker, are dropped (the most recently
+used one is always kept). Clearing a user's data or deleting the user drops
+their snapshot in the worker handling the request.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+
+from app.database import engine
+from app.models import FinancialRecord, DashboardTotals
+from app.crud import get_data_version
+
+# Refuse to hold more rows than this for one user in one worker (about 64 bytes per row, plus cached sort orders)
+QUERY_SNAPSHOT_MAX_ROWS = int(os.getenv("QUERY_SNAPSHOT_MAX_ROWS", "20000000"))
+# Bounds on all snapshots of one worker
+QUERY_SNAPSHOT_MAX_OWNERS = int(os.getenv("QUERY_SNAPSHOT_MAX_OWNERS", "32"))
+QUERY_SNAPSHOT_MAX_TOTAL_ROWS = int(os.getenv("QUERY_SNAPSHOT_MAX_TOTAL_ROWS", "40000000"))
+QUERY_SNAPSHOT_IDLE_SECONDS = float(os.getenv("QUERY_SNAPSHOT_IDLE_SECONDS", "1800"))
+
+MEASURES = ["revenue", "expense", "balance", "overdue_amount", "payment_delay_days", "transaction_count"]
+SNAPSHOT_COLUMNS = ["id", "account_id", "date", *MEASURES]
+
+# Consistent view handed to a query; refreshes replace arrays instead of mutating them
+SnapshotView = namedtuple("SnapshotView", ["version", "rows", "accounts", "columns"])
+
+class SnapshotTooLarge(ValueError):
+    """Raised when a user's financial_records exceed QUERY_SNAPSHOT_MAX_ROWS."""
+
+def month_label(number: int) -> str:
+    """Month number (months since 1970-01) to YYYY-MM."""
+    return f"{1970 + number // 12:04d}-{number % 12 + 1:02d}"
+
+def _fetch(conn, owner_id: int, after_id: int) -> pd.DataFrame:
+    """The owner's rows of financial_records with id > after_id, in snapshot column order."""
+    table = FinancialRecord.__table__
+    query = select(*[table.c[column] for column in SNAPSHOT_COLUMNS]).where(
+        table.c.owner_id == owner_id, table.c.id > after_id
+    )
+
+    if conn.dialect.name == "postgresql":
+        sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+        cursor = conn.connection.cursor()
+        with tempfile.TemporaryFile() as buffer:
+            try:
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", buffer)
+            finally:
+                cursor.close()
+            buffer.seek(0)
+            frame = pd.read_csv(buffer, names=SNAPSHOT_COLUMNS, dtype={"account_id": str})
+    else:
+        frame = pd.DataFrame(conn.execute(query).all(), columns=SNAPSHOT_COLUMNS)
+
+    frame["date"] = pd.to_datetime(frame["date"])
+    return frame
+
+class ColumnarSnapshot:
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        self.version = None
+        self.max_id = 0
+        self.rows = 0
+        self.accounts = np.array([], dtype=object)  # account code -> account_id
+        self.columns = {}
+        self._account_codes = {}
+        self._lock = threading.Lock()
+        self.used_at = time.monotonic()
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def _encode_accounts(self, account_ids: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(account_ids)
+        new = [account for account in uniques if account not in self._account_codes]
+        for account in new:
+            self._account_codes[account] = len(self._account_codes)
+        if new:
+            self.accounts = np.concatenate([self.accounts, np.array(new, dtype=object)])
+        mapping = np.array([self._account_codes[account] for account in uniques], dtype=np.int32)
+        return mapping[codes] if len(codes) else np.array([], dtype=np.int32)
+
+    def _to_columns(self, frame: pd.DataFrame) -> dict:
+        dates = frame["date"].to_numpy().astype("datetime64[D]")
+        columns = {
+            "account": self._encode_accounts(frame["account_id"]),
+            "month": dates.astype("datetime64[M]").astype(np.int32),
+            "date": dates,
+        }
+        for measure in MEASURES:
+            columns[measure] = frame[measure].to_numpy(dtype=np.float64)
+        return columns
+
+    def _reset(self):
+        self.max_id = 0
+        self.rows = 0
+        self.accounts = np.array([], dtype=object)
+        self.columns = {}
+        self._account_codes = {}
+
+    def _append(self, frame: pd.DataFrame):
+        if self.rows + len(frame) > QUERY_SNAPSHOT_MAX_ROWS:
+            raise SnapshotTooLarge(
+                f"Your financial_records have more than {QUERY_SNAPSHOT_MAX_ROWS} rows; raise QUERY_SNAPSHOT_MAX_ROWS"
+            )
+        new = self._to_columns(frame)
+        self.columns = {
+            name: np.concatenate([self.columns[name], values]) if self.columns else values
+            for name, values in new.items()
+        }
+        self.rows += len(frame)
+        if len(frame):
+            self.max_id = max(self.max_id, int(frame["id"].max()))
+
+    def _view(self) -> SnapshotView:
+        return SnapshotView(self.version, self.rows, self.accounts, self.columns)
+
+    def refresh(self) -> SnapshotView:
+        """Bring the snapshot up to the committed data version and return a view of it."""
+        with self._lock, engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                conn = conn.execution_options(isolation_level="REPEATABLE READ")
+
+            version, _ = get_data_version(conn, self.owner_id)
+            if version == self.version:
+                return self._view()
+
+            expected = conn.execute(
+                select(DashboardTotals.record_count).where(DashboardTotals.owner_id == self.owner_id)
+            ).scalar()
+            if expected is None:
+                expected = conn.execute(
+                    select(func.count()).select_from(FinancialRecord.__table__)
+                    .where(FinancialRecord.owner_id == self.owner_id)
+                ).scalar()
+
+            if self.loaded and expected >= self.rows:
+                self._append(_fetch(conn, self.owner_id, self.max_id))
+            if not self.loaded or self.rows != expected:
+                self._reset()
+                self._append(_fetch(conn, self.owner_id, 0))
+
+            self.version = version
+            view = self._view()
+        # Its size may have grown past the worker's budget
+        with _snapshots_lock:
+            _evict(keep=self.owner_id)
+        return view
+
+_snapshots = OrderedDict()  # owner_id -> snapshot, least recently used first
+_snapshots_lock = threading.Lock()
+
+def _evict(keep: int):
+    """Drop idle snapshots and the least recently used beyond the worker's bounds. Caller holds _snapshots_lock."""
+    now = time.monotonic()
+    total_rows = sum(snapshot.rows for snapshot in _snapshots.values())
+    for owner_id, snapshot in list(_snapshots.items()):
+        if owner_id == keep:
+            continue
+        if (
+            len(_snapshots) <= QUERY_SNAPSHOT_MAX_OWNERS and total_rows <= QUERY_SNAPSHOT_MAX_TOTAL_ROWS
+            and now - snapshot.used_at < QUERY_SNAPSHOT_IDLE_SECONDS
+        ):
+            break
+        del _snapshots[owner_id]
+        total_rows -= snapshot.rows
+
+def snapshot_for(owner_id: int) -> ColumnarSnapshot:
+    """This worker's snapshot of the owner's records, created (empty) on first use."""
+    with _snapshots_lock:
+        snapshot = _snapshots.get(owner_id)
+        if snapshot is None:
+            snapshot = _snapshots[owner_id] = ColumnarSnapshot(owner_id)
+        _snapshots.move_to_end(owner_id)
+        snapshot.used_at = time.monotonic()
+        _evict(keep=owner_id)
+        return snapshot
+
+def drop_snapshot(owner_id: int | None = None):
+    """Free the owner's snapshot in this worker (every snapshot when owner_id is None)."""
+    with _snapshots_lock:
+        if owner_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(owner_id, None)
+
+def refresh_if_loaded(owner_id: int):
+    """Catch up after an upload, but only if the owner has queried this worker before."""
+    snapshot = _snapshots.get(owner_id)
+    if snapshot is not None and snapshot.loaded:
+        snapshot.refresh()
@@ -0,0 +1,296 @@
+"""
+Benchmark suite for the ingest, aggregation and dashboard hot paths.
+
+Runs against the PostgreSQL database in DATABASE_URL (it must be set explicitly,
+because every run TRUNCATEs the data tables). Datasets are generated with
+data-engineering/generate_data.py.
+
+Usage (from backend/):
+    DATABASE_URL=postgresql://... python benchmarks/run_benchmarks.py run --sizes 10k,1M --output bench.json
+    python benchmarks/run_benchmarks.py compare baseline.json bench.json --threshold 0.10
+
+`compare` exits with status 1 when any metric regressed by more than the threshold.
+
+Endpoint timings measure the query paths: the in-process response cache is disabled
+while they run, and the benchmark owner's data version is bumped on every reset and
+ingest so nothing cached for an earlier size (or run) is served.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GENERATOR_PATH = os.path.join(BACKEND_DIR, "..", "data-engineering", "generate_data.py")
+sys.path.insert(0, BACKEND_DIR)
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+def parse_size(label: str) -> int:
+    label = label.strip().lower()
+    if label[-1] in SIZE_SUFFIXES:
+        return int(float(label[:-1]) * SIZE_SUFFIXES[label[-1]])
+    return int(label)
+
+def load_generator():
+    # Registered (and importable) as generate_data so its worker processes can unpickle generate_shard
+    sys.path.insert(0, os.path.dirname(GENERATOR_PATH))
+    spec = importlib.util.spec_from_file_location("generate_data", GENERATOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["generate_data"] = module
+    spec.loader.exec_module(module)
+    return module
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def repeat_ms(fn, repeat: int) -> dict:
+    """Median and max wall time of `repeat` calls, in milliseconds."""
+    samples = [timed(fn)[1] * 1000 for _ in range(repeat)]
+    return {"median_ms": round(statistics.median(samples), 3), "max_ms": round(max(samples), 3)}
+
+# Owner the benchmark data is loaded under and the endpoints are queried as
+BENCH_OWNER_ID = 0
+
+def reset_data(db):
+    from sqlalchemy import text
+    from app.crud import reset_dashboard_totals, bump_data_version
+    db.execute(text(
+        "TRUNCATE TABLE financial_records, financial_aggregates, monthly_totals, account_risk, portfolio_risk, "
+        "account_distributions, monthly_distributions, upload_ledger"
+    ))
+    reset_dashboard_totals(db, BENCH_OWNER_ID)
+    bump_data_version(db, BENCH_OWNER_ID)
+    db.commit()
+
+def bench_ingest(db, csv_path: str, chunk_size: int) -> dict:
+    """Time parse, insert and aggregation phases of the chunked ingest separately."""
+    from app import ingest
+    from app.crud import upsert_financial_records, ensure_dashboard_totals, ensure_monthly_totals, bump_data_version
+    from app.sketches import SketchBuilder
+    from app.partitions import is_partitioned, ensure_partitions
+
+    parse_s = insert_s = aggregate_s = 0.0
+    rows = 0
+    stats = None
+    ensure_dashboard_totals(db, BENCH_OWNER_ID)
+    ensure_monthly_totals(db, BENCH_OWNER_ID)
+    sketches = SketchBuilder(db, BENCH_OWNER_ID)
+    # Same on-demand partition creation as ingest_file; counted as insert time
+    partitioned = is_partitioned(db)
+    ensured_months = set()
+
+    with open(csv_path, "rb") as fileobj:
+        reader = ingest.iter_chunks(fileobj, chunk_size)
+        while True:
+            started = time.perf_counter()
+            chunk = next(reader, None)
+            if chunk is None:
+                break
+            chunk, _, _ = ingest.prepare_chunk(chunk, BENCH_OWNER_ID)
+            parse_s += time.perf_counter() - started
+
+            started = time.perf_counter()
+            if partitioned:
+                new_months = ingest.chunk_months(chunk) - ensured_months
+                ensure_partitions(db, new_months)
+                ensured_months |= new_months
+            inserted = upsert_financial_records(db, chunk)
+            rows += len(inserted)
+            insert_s += time.perf_counter() - started
+
+            started = time.perf_counter()
+            partial = ingest.partial_stats(inserted)
+            stats = ingest.merge_stats(stats, partial)
+            sketches.add(inserted)
+            aggregate_s += time.perf_counter() - started
+
+    _, elapsed = timed(ingest.merge_rollups, db, BENCH_OWNER_ID, stats, rows)
+    aggregate_s += elapsed
+    _, elapsed = timed(sketches.flush)
+    aggregate_s += elapsed
+    bump_data_version(db, BENCH_OWNER_ID)
+
+    _, commit_s = timed(db.commit)
+    return {
+        "rows": rows,
+        "csv_parse_s": round(parse_s, 4),
+        "record_insert_s": round(insert_s + commit_s, 4),
+        "aggregate_s": round(aggregate_s, 4),
+        "rows_per_second": round(rows / (parse_s + insert_s + aggregate_s + commit_s), 1)
+    }
+
+def bench_endpoints(db, repeat: int) -> dict:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import select
+    from app.main import app
+    from app.auth import get_current_user
+    from app.caching import response_cache
+    from app.models import FinancialRecord, User
+    from app.routers.analytics import encode_cursor
+
+    # Authentication is benchmarked separately; bypass it here
+    app.dependency_overrides[get_current_user] = lambda: User(id=BENCH_OWNER_ID, email="bench@local", role="admin")
+    client = TestClient(app)
+    # Every repeat runs the endpoint's queries instead of replaying the first response
+    cache_entries, response_cache.max_entries = response_cache.max_entries, 0
+
+    total = db.query(FinancialRecord).count()
+    deep_skip = max(total - 100, 0)
+    # Cursor pointing at the same deep position, for a keyset comparison
+    deep = db.execute(
+        select(FinancialRecord.date, FinancialRecord.id)
+        .order_by(FinancialRecord.date, FinancialRecord.id)
+        .offset(max(deep_skip - 1, 0)).limit(1)
+    ).first()
+    deep_cursor = encode_cursor(deep.date, deep.id) if deep else None
+
+    def get(url, **params):
+        return lambda: client.get(url, params=params).raise_for_status()
+
+    results = {
+        "summary": repeat_ms(get("/dashboard/summary"), repeat),
+        "trends": repeat_ms(get("/dashboard/trends"), repeat),
+        "trends_24_months": repeat_ms(get("/dashboard/trends", **{"from": "2023-01", "to": "2024-12"}), repeat),
+        "records_first_page": repeat_ms(get("/dashboard/records", limit=100), repeat),
+        "records_deep_offset": repeat_ms(get("/dashboard/records", skip=deep_skip, limit=100), repeat),
+    }
+    if deep_cursor:
+        results["records_deep_cursor"] = repeat_ms(
+            get("/dashboard/records", cursor=deep_cursor, limit=100), repeat
+        )
+    app.dependency_overrides.pop(get_current_user, None)
+    response_cache.max_entries = cache_entries
+    return results
+
+def run(args):
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("Set DATABASE_URL explicitly; the benchmark truncates all financial data.")
+
+    from app.database import SessionLocal, init_db
+    init_db()
+
+    generator = load_generator()
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "chunk_size": args.chunk_size,
+            "repeat": args.repeat
+        },
+        "results": {}
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        for label in args.sizes.split(","):
+            label = label.strip()
+            num_rows = parse_size(label)
+            csv_path = os.path.join(workdir, f"records_{label}.csv")
+            print(f"[{label}] generating {num_rows} rows...")
+            _, generate_s = timed(generator.generate_synthetic_data, num_rows, csv_path)
+
+            db = SessionLocal()
+            try:
+                reset_data(db)
+                print(f"[{label}] ingesting...")
+                ingest_results = bench_ingest(db, csv_path, args.chunk_size)
+                print(f"[{label}] querying endpoints...")
+                endpoint_results = bench_endpoints(db, args.repeat)
+            finally:
+                db.close()
+            os.remove(csv_path)
+
+            report["results"][label] = {
+                "generate_s": round(generate_s, 4),
+                **ingest_results,
+                "endpoints": endpoint_results
+            }
+            print(json.dumps(report["results"][label], indent=2))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Flatten nested results into {"10k.endpoints.summary.median_ms": value}."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+# Metrics where larger is better; everything else timed is lower-is-better
+HIGHER_IS_BETTER = ("rows_per_second",)
+IGNORED = ("rows", "max_ms")
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f)["results"])
+    with open(args.current) as f:
+        current = flatten(json.load(f)["results"])
+
+    regressions = []
+    print(f"{'metric':<55} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(baseline.keys() & current.keys()):
+        if name.split(".")[-1] in IGNORED:
+            continue
+        old, new = baseline[name], current[name]
+        if not old:
+            continue
+        change = (new - old) / old
+        if name.endswith(HIGHER_IS_BETTER):
+            change = -change
+        flag = " REGRESSION" if change > args.threshold else ""
+        print(f"{name:<55} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--sizes", default="10k", help="Comma separated dataset sizes, e.g. 10k,1M,10M")
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--chunk-size", type=int, default=50_000)
+    run_parser.add_argument("--repeat", type=int, default=5, help="Calls per endpoint")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative slowdown treated as a regression (default 0.10)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 from app.database import engine, Base
-from app.models import FinancialRecord
+import app.models  # noqa: F401 (registers all tables on Base.metadata)
 from sqlalchemy import text
 
-# Drop table directly using SQL to ensure it's gone
+# Data tables are rebuilt from uploads; the users table is left untouched
+DATA_TABLES = [t for t in Base.metadata.sorted_tables if t.name != "users"]
+
+# Drop tables directly using SQL to ensure they're gone
 with engine.connect() as conn:
-    conn.execute(text("DROP TABLE IF EXISTS financial_records"))
+    for table in reversed(DATA_TABLES):
+        conn.execute(text(f"DROP TABLE IF EXISTS {table.name} CASCADE"))
+        print(f"Table '{table.name}' dropped.")
     conn.commit()
-    print("Table 'financial_records' dropped.")
 
 # Recreate all tables defined in models
 Base.metadata.create_all(bind=engine)
@@ -0,0 +1,6 @@
+from app.database import init_db
+
+# Creates missing tables and indexes without touching existing data.
+# Run once per deploy when the API is started with DB_INIT_ON_STARTUP=false.
+init_db()
+print("Database schema is up to date.")
@@ -1,5 +1,7 @@
 from app.database import SessionLocal
 from app.models import User
+from app.auth import PRINCIPAL_REVISION_CHECK_SECONDS
+from app.crud import bump_principal_revision
 import sys
 
 def promote_to_admin(email):
@@ -9,8 +11,11 @@ def promote_to_admin(email):
         user = db.query(User).filter(User.email == email).first()
         if user:
             user.role = "admin"
+            # Running API workers cache principals; this makes them drop their caches
+            bump_principal_revision(db)
             db.commit()
             print(f"✅ Successfully promoted {email} to ADMIN.")
+            print(f"   Active sessions pick up the new role within {PRINCIPAL_REVISION_CHECK_SECONDS:.0f}s.")
         else:
             print(f"❌ User not found: {email}")
     except Exception as e:
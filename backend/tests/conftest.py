@@ -0,0 +1,92 @@
+import io
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.auth
+import app.events
+import app.jobs
+from app.database import init_db
+
+@pytest.fixture
+def engine(tmp_path):
+    """A fresh SQLite database with every table. A file, so that background jobs get connections of their own."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    init_db(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session_factory(engine, monkeypatch):
+    """Sessions on the test database, also used by modules that open their own (jobs, events, auth)."""
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for module in (app.auth, app.events, app.jobs):
+        monkeypatch.setattr(module, "SessionLocal", factory)
+    return factory
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+@pytest.fixture
+def client(engine, session_factory, monkeypatch):
+    """The API on the test database, with empty process-wide caches. Lifespan (init_db) is not run."""
+    from fastapi.testclient import TestClient
+
+    import app.caching
+    import app.snapshot
+    from app.auth import PrincipalCache, PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES
+    from app.caching import ResponseCache, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_ENTRY_BYTES
+    from app.database import get_db
+    from app.main import app as api
+
+    def get_test_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(app.auth, "principal_cache", PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES))
+    monkeypatch.setattr(app.caching, "response_cache", ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_ENTRY_BYTES))
+    monkeypatch.setattr(app.snapshot, "engine", engine)
+    api.dependency_overrides[get_db] = get_test_db
+    yield TestClient(api)
+    api.dependency_overrides.clear()
+    app.snapshot.drop_snapshot()
+
+@pytest.fixture
+def make_user(db):
+    """Create a user and return (user id, Authorization header for them)."""
+    from app.auth import create_access_token
+    from app.models import User
+
+    def make(email: str, role: str = "user"):
+        user = User(email=email, password_hash="unused", role=role)
+        db.add(user)
+        db.commit()
+        return user.id, {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+    return make
+
+@pytest.fixture
+def ingest(engine, session_factory, monkeypatch):
+    """Spool and ingest bytes for an owner as the upload router does, synchronously; returns the job."""
+    import app.snapshot
+    from app.models import IngestJobRecord
+
+    monkeypatch.setattr(app.snapshot, "engine", engine)
+    monkeypatch.setattr(app.jobs, "_prune_finished", lambda: None)
+
+    def run(data: bytes, owner_id: int = 1, filename: str = "upload.csv"):
+        path, content_hash, size = app.jobs.spool_upload(io.BytesIO(data))
+        job = app.jobs.IngestJob(filename, owner_id, f"user{owner_id}@example.com", content_hash, size)
+        with session_factory() as session:
+            session.add(IngestJobRecord(**{column: getattr(job, column) for column in app.jobs.JOB_COLUMNS}))
+            session.commit()
+        app.jobs._run(job, path)
+        return job
+    yield run
+    app.snapshot.drop_snapshot()
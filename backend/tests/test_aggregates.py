@@ -0,0 +1,98 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from app.ingest import ingest_file
+from app.models import DashboardTotals, FinancialAggregate, MonthlyTotals
+
+def make_records(rows: int = 600, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "account_id": rng.choice([f"ACC-{i}" for i in range(12)], rows),
+        "date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 180, rows), unit="D"),
+        "revenue": rng.uniform(0, 5000, rows).round(2),
+        "expense": rng.uniform(0, 4000, rows).round(2),
+        "balance": rng.normal(1000, 500, rows).round(2),
+        "transaction_count": rng.integers(0, 50, rows),
+        "overdue_amount": np.where(rng.random(rows) < 0.3, rng.uniform(0, 900, rows).round(2), 0.0),
+        "payment_delay_days": np.where(rng.random(rows) < 0.4, rng.integers(1, 120, rows), 0),
+    })
+
+def to_csv(frame: pd.DataFrame) -> io.BytesIO:
+    return io.BytesIO(frame.to_csv(index=False, date_format="%Y-%m-%d").encode())
+
+def load(db, frame: pd.DataFrame, owner_id: int, chunk_size: int):
+    result = ingest_file(db, to_csv(frame), owner_id, chunk_size=chunk_size)
+    db.commit()
+    return result
+
+AGGREGATE_COLUMNS = [
+    "account_id", "month", "record_count", "revenue_sum", "expense_sum", "overdue_sum", "overdue_count",
+    "delay_sum", "delay_max", "delayed_count", "avg_revenue", "avg_expense", "profit", "expense_ratio",
+    "cashflow_volatility",
+]
+
+def aggregates(db, owner_id: int) -> pd.DataFrame:
+    columns = [getattr(FinancialAggregate, name) for name in AGGREGATE_COLUMNS]
+    rows = db.execute(
+        select(*columns).where(FinancialAggregate.owner_id == owner_id)
+        .order_by(FinancialAggregate.account_id, FinancialAggregate.month)
+    ).all()
+    return pd.DataFrame(rows, columns=AGGREGATE_COLUMNS)
+
+def test_aggregates_match_pandas(db):
+    records = make_records()
+    load(db, records, 1, chunk_size=1000)
+
+    month = records["date"].dt.strftime("%Y-%m").rename("month")
+    expected = records.groupby(["account_id", month]).agg(
+        record_count=("revenue", "size"),
+        revenue_sum=("revenue", "sum"),
+        expense_sum=("expense", "sum"),
+        avg_revenue=("revenue", "mean"),
+        cashflow_volatility=("revenue", "std"),
+        delay_max=("payment_delay_days", "max"),
+    ).fillna({"cashflow_volatility": 0.0}).reset_index()
+    actual = aggregates(db, 1)
+
+    assert len(actual) == len(expected)
+    for column in expected.columns[2:]:
+        np.testing.assert_allclose(actual[column], expected[column], rtol=1e-9, err_msg=column)
+    np.testing.assert_allclose(actual["profit"], expected["revenue_sum"] - expected["expense_sum"], rtol=1e-9)
+
+def test_split_uploads_merge_into_the_same_aggregates(db):
+    records = make_records()
+    load(db, records, 1, chunk_size=1000)
+    # Same rows in three uploads of small chunks, so every account-month is merged repeatedly
+    shuffled = records.sample(frac=1, random_state=3)
+    for part in (shuffled.iloc[:150], shuffled.iloc[150:400], shuffled.iloc[400:]):
+        load(db, part, 2, chunk_size=37)
+
+    one_pass, merged = aggregates(db, 1), aggregates(db, 2)
+    pd.testing.assert_frame_equal(one_pass, merged, check_exact=False, rtol=1e-9)
+
+    def monthly(owner_id):
+        return [
+            (row.month, row.record_count, pytest.approx(row.revenue_sum), pytest.approx(row.balance_sum))
+            for row in db.execute(
+                select(MonthlyTotals).where(MonthlyTotals.owner_id == owner_id).order_by(MonthlyTotals.month)
+            ).scalars()
+        ]
+    assert monthly(1) == monthly(2)
+
+    totals_1, totals_2 = db.get(DashboardTotals, 1), db.get(DashboardTotals, 2)
+    assert totals_1.record_count == totals_2.record_count == len(records)
+    assert totals_1.total_revenue == pytest.approx(records["revenue"].sum())
+    assert totals_2.total_revenue == pytest.approx(records["revenue"].sum())
+
+def test_reingest_leaves_aggregates_unchanged(db):
+    records = make_records(200)
+    load(db, records, 1, chunk_size=50)
+    before = aggregates(db, 1)
+    result = load(db, records, 1, chunk_size=50)
+    assert result["records_inserted"] == 0
+    assert result["records_skipped"] == len(records)
+    pd.testing.assert_frame_equal(aggregates(db, 1), before)
@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import delete
+
+import app.auth
+import promote_admin
+from app.models import User
+
+@pytest.fixture
+def revision_checks(monkeypatch):
+    """Check principal_revision on every request (set to 0) or never (set to inf)."""
+    def set_interval(seconds: float):
+        monkeypatch.setattr(app.auth, "PRINCIPAL_REVISION_CHECK_SECONDS", seconds)
+    return set_interval
+
+def test_principal_is_cached(client, db, make_user, revision_checks):
+    revision_checks(0)
+    user_id, headers = make_user("a@example.com")
+    assert client.get("/dashboard/summary", headers=headers).status_code == 200
+
+    # Removed behind the cache's back (no revision bump): still served from the cache
+    db.execute(delete(User).where(User.id == user_id))
+    db.commit()
+    assert client.get("/dashboard/summary", headers=headers).status_code == 200
+
+    app.auth.invalidate_principal("a@example.com")
+    assert client.get("/dashboard/summary", headers=headers).status_code == 401
+
+def test_role_change_is_picked_up_at_the_next_revision_check(client, session_factory, make_user, revision_checks, monkeypatch):
+    revision_checks(float("inf"))
+    _, headers = make_user("a@example.com")
+    assert client.get("/auth/users", headers=headers).status_code == 403
+
+    monkeypatch.setattr(promote_admin, "SessionLocal", session_factory)
+    promote_admin.promote_to_admin("a@example.com")
+    # Not due yet: the cached principal still has the old role
+    assert client.get("/auth/users", headers=headers).status_code == 403
+
+    revision_checks(0)
+    assert client.get("/auth/users", headers=headers).status_code == 200
+
+def test_deleted_user_is_rejected(client, make_user, revision_checks):
+    revision_checks(float("inf"))
+    _, admin = make_user("admin@example.com", role="admin")
+    user_id, headers = make_user("a@example.com")
+    assert client.get("/dashboard/summary", headers=headers).status_code == 200
+
+    assert client.delete(f"/auth/users/{user_id}", headers=admin).status_code == 204
+    assert client.get("/dashboard/summary", headers=headers).status_code == 401
+
+def test_principal_cache_bounds():
+    cache = app.auth.PrincipalCache(60, 2)
+    cache.sync(1)
+    for email in ("a", "b", "c"):
+        cache.put(email, email, 1)
+    assert cache.get("a") is None
+    assert cache.get("b") == "b" and cache.get("c") == "c"
+
+    # Loaded under a revision that has since moved: not cached
+    cache.put("d", "d", 0)
+    assert cache.get("d") is None
+
+    cache.sync(2)
+    assert cache.get("b") is None and cache.get("c") is None
+
+    disabled = app.auth.PrincipalCache(0, 2)
+    disabled.sync(1)
+    disabled.put("a", "a", 1)
+    assert disabled.get("a") is None
@@ -0,0 +1,103 @@
+from app.caching import ResponseCache
+
+def entry(body=b"{}"):
+    return (body, 200, "application/json")
+
+def test_put_evicts_least_recently_used_past_max_entries():
+    cache = ResponseCache(2, 1024)
+    cache.put((1, "/dashboard/records", "skip=0"), 1, entry())
+    cache.put((1, "/dashboard/summary", ""), 1, entry())
+    cache.put((2, "/dashboard/summary", ""), 1, entry())
+
+    assert cache.get((1, "/dashboard/records", "skip=0"), 1) is None
+    assert cache.get((1, "/dashboard/summary", ""), 1) is not None
+    assert cache.get((2, "/dashboard/summary", ""), 1) is not None
+    assert cache.stats()["entries"] == 2
+
+def test_evicting_an_owners_last_entry_forgets_its_version():
+    cache = ResponseCache(1, 1024)
+    cache.put((1, "/dashboard/summary", ""), 5, entry())
+    cache.put((2, "/dashboard/summary", ""), 1, entry())
+    assert cache.stats()["owners"] == 1
+
+    # Owner 1 starts over at an older version without being refused
+    cache.put((1, "/dashboard/summary", ""), 3, entry())
+    assert cache.get((1, "/dashboard/summary", ""), 3) is not None
+
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+
+from app.crud import bump_data_version
+from app.models import DataVersion
+
+CSV = (
+    b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+    b"ACC-1,2023-01-01,100.00,40.00,60.00,1,0.00,0\n"
+)
+
+def age_version(db, owner_id: int, seconds: float = 5):
+    """Move the owner's last change into the past, as if made `seconds` ago."""
+    version = db.get(DataVersion, owner_id)
+    version.updated_at = datetime.utcnow() - timedelta(seconds=seconds)
+    db.commit()
+
+def test_etag_round_trip(client, db, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    ingest(CSV, owner_id)
+
+    first = client.get("/dashboard/summary", headers=headers)
+    etag = first.headers["etag"]
+    assert etag.startswith(f'W/"{owner_id}-')
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    revalidated = client.get("/dashboard/summary", headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert client.get("/dashboard/summary", headers={**headers, "If-None-Match": etag.removeprefix("W/")}).status_code == 304
+
+    bump_data_version(db, owner_id)
+    db.commit()
+    changed = client.get("/dashboard/summary", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+def test_etags_differ_between_owners(client, make_user, ingest):
+    a_id, a = make_user("a@example.com")
+    b_id, b = make_user("b@example.com")
+    ingest(CSV, a_id)
+    ingest(CSV, b_id)
+    etag = client.get("/dashboard/summary", headers=a).headers["etag"]
+    assert client.get("/dashboard/summary", headers={**b, "If-None-Match": etag}).status_code == 200
+
+def test_if_modified_since_round_trip(client, db, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    ingest(CSV, owner_id)
+    age_version(db, owner_id)
+
+    last_modified = client.get("/dashboard/summary", headers=headers).headers["last-modified"]
+    assert client.get("/dashboard/summary", headers={**headers, "If-Modified-Since": last_modified}).status_code == 304
+
+    bump_data_version(db, owner_id)
+    db.commit()
+    assert client.get("/dashboard/summary", headers={**headers, "If-Modified-Since": last_modified}).status_code == 200
+
+def test_no_last_modified_within_the_second_of_a_change(client, db, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    ingest(CSV, owner_id)
+    version = db.get(DataVersion, owner_id)
+    version.updated_at = datetime.utcnow() + timedelta(seconds=30)  # Still running however slow the test
+    db.commit()
+
+    response = client.get("/dashboard/summary", headers=headers)
+    assert "last-modified" not in response.headers
+    # A date covering that second must not yield a 304: another change may follow within it
+    since = format_datetime(version.updated_at.replace(microsecond=0) + timedelta(seconds=1), usegmt=False)
+    assert client.get("/dashboard/summary", headers={**headers, "If-Modified-Since": since}).status_code == 200
+
+def test_new_version_replaces_cached_response(client, db, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    ingest(CSV, owner_id)
+    assert client.get("/dashboard/summary", headers=headers).json()["total_revenue"] == 100.0
+
+    ingest(CSV.replace(b"2023-01-01,100.00", b"2023-02-01,250.00"), owner_id)
+    assert client.get("/dashboard/summary", headers=headers).json()["total_revenue"] == 350.0
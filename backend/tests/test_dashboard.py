@@ -0,0 +1,125 @@
+import pytest
+
+HEADER = b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+RECORDS = HEADER + (
+    b"ACC-1,2023-01-05,100.00,40.00,60.00,1,0.00,0\n"
+    b"ACC-1,2023-01-20,50.00,10.00,100.00,1,20.00,10\n"
+    b"ACC-1,2023-03-02,300.00,100.00,300.00,2,0.00,0\n"
+    b"ACC-2,2023-01-11,1000.00,900.00,100.00,3,0.00,0\n"
+    b"ACC-2,2023-02-14,2000.00,500.00,1600.00,4,300.00,45\n"
+    b"ACC-2,2023-04-30,500.00,700.00,1400.00,5,0.00,0\n"
+)
+
+@pytest.fixture
+def owner(make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    assert ingest(RECORDS, owner_id).status == "succeeded"
+    return headers
+
+def test_trends_are_monthly_totals(client, owner):
+    assert client.get("/dashboard/trends", headers=owner).json() == [
+        {"month": "2023-01", "revenue": 1150.0, "expense": 950.0},
+        {"month": "2023-02", "revenue": 2000.0, "expense": 500.0},
+        {"month": "2023-03", "revenue": 300.0, "expense": 100.0},
+        {"month": "2023-04", "revenue": 500.0, "expense": 700.0},
+    ]
+
+def test_trends_month_window_is_inclusive(client, owner):
+    months = [row["month"] for row in client.get(
+        "/dashboard/trends", params={"from": "2023-02", "to": "2023-03"}, headers=owner
+    ).json()]
+    assert months == ["2023-02", "2023-03"]
+    assert [row["month"] for row in client.get(
+        "/dashboard/trends", params={"from": "2023-03"}, headers=owner
+    ).json()] == ["2023-03", "2023-04"]
+    assert client.get("/dashboard/trends", params={"to": "2022-12"}, headers=owner).json() == []
+
+def test_trends_for_one_account(client, owner):
+    assert client.get("/dashboard/trends", params={"account_id": "ACC-1", "to": "2023-02"}, headers=owner).json() == [
+        {"month": "2023-01", "revenue": 150.0, "expense": 50.0},
+    ]
+
+@pytest.mark.parametrize("month", ["2023-13", "2023-1", "January"])
+def test_trends_reject_malformed_months(client, owner, month):
+    assert client.get("/dashboard/trends", params={"from": month}, headers=owner).status_code == 422
+
+def all_pages(client, headers, **params) -> list:
+    """Every record reached by following next_cursor."""
+    rows, cursor = [], None
+    while True:
+        page = client.get("/dashboard/records", params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers).json()
+        rows += page["data"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_cursor_pages_cover_every_record_once(client, owner, order):
+    rows = all_pages(client, owner, limit=4, order=order)
+    keys = [(row["date"], row["id"]) for row in rows]
+    assert len(keys) == 6
+    assert keys == sorted(keys, reverse=order == "desc")
+
+    everything = client.get("/dashboard/records", params={"limit": 100, "order": order}, headers=owner).json()
+    assert everything["next_cursor"] is None
+    assert everything["data"] == rows
+
+def test_cursor_pages_with_filters(client, owner):
+    rows = all_pages(client, owner, limit=1, account_id="ACC-2", date_from="2023-02-01")
+    assert [row["date"] for row in rows] == ["2023-02-14", "2023-04-30"]
+
+def test_offset_matches_cursor(client, owner):
+    first = client.get("/dashboard/records", params={"limit": 2}, headers=owner).json()
+    by_cursor = client.get("/dashboard/records", params={"limit": 2, "cursor": first["next_cursor"]}, headers=owner).json()
+    by_offset = client.get("/dashboard/records", params={"limit": 2, "skip": 2}, headers=owner).json()
+    assert by_cursor["data"] == by_offset["data"]
+
+def test_record_totals(client, owner):
+    def total(**params):
+        return client.get("/dashboard/records", params=params, headers=owner).json()["total"]
+    assert total() == 6  # Maintained counter
+    assert total(total="exact") == 6
+    assert total(total="exact", account_id="ACC-1") == 3
+    assert total(account_id="ACC-1") is None  # No estimate for filtered pages
+    assert total(total="none") is None
+
+def test_malformed_cursor_is_rejected(client, owner):
+    assert client.get("/dashboard/records", params={"cursor": "not-a-cursor"}, headers=owner).status_code == 400
+
+def test_account_detail(client, owner):
+    detail = client.get("/dashboard/accounts/ACC-1", headers=owner).json()
+    assert detail["totals"] == {
+        "record_count": 3,
+        "revenue": 450.0,
+        "expense": 150.0,
+        "profit": 300.0,
+        "expense_ratio": pytest.approx(150 / 450),
+        "overdue_amount": 20.0,
+        "overdue_records": 1,
+        "delayed_records": 1,
+        "avg_payment_delay_days": pytest.approx(10 / 3),
+        "max_payment_delay_days": 10,
+    }
+    assert detail["latest_balance"] == {"date": "2023-03-02", "balance": 300.0}
+    assert [(m["month"], m["record_count"], m["revenue"]) for m in detail["series"]] == [
+        ("2023-01", 2, 150.0), ("2023-03", 1, 300.0)
+    ]
+    january = detail["series"][0]
+    assert january["avg_revenue"] == 75.0
+    assert january["cashflow_volatility"] == pytest.approx(35.3553, rel=1e-4)  # Sample std of 100, 50
+
+def test_account_detail_window(client, owner):
+    detail = client.get("/dashboard/accounts/ACC-2", params={"to": "2023-02"}, headers=owner).json()
+    assert [m["month"] for m in detail["series"]] == ["2023-01", "2023-02"]
+    assert detail["totals"]["revenue"] == 3000.0
+    # Balance as of the end of the window, not the account's latest
+    assert detail["latest_balance"] == {"date": "2023-02-14", "balance": 1600.0}
+
+    detail = client.get("/dashboard/accounts/ACC-2", params={"from": "2023-03", "to": "2023-03"}, headers=owner).json()
+    assert detail["series"] == [] and detail["totals"]["record_count"] == 0
+    assert detail["latest_balance"] == {"date": "2023-02-14", "balance": 1600.0}
+
+def test_unknown_account_is_not_found(client, owner, make_user):
+    assert client.get("/dashboard/accounts/ACC-9", headers=owner).status_code == 404
+    _, other = make_user("b@example.com")
+    assert client.get("/dashboard/accounts/ACC-1", headers=other).status_code == 404
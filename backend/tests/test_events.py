@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+import orjson
+import pytest
+
+import app.events
+from app.crud import bump_data_version
+from app.events import Broadcaster, event_stream, format_event
+
+CSV = (
+    b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+    b"ACC-1,2023-01-01,100.00,40.00,60.00,1,0.00,0\n"
+    b"ACC-2,2023-02-01,200.00,50.00,150.00,2,0.00,0\n"
+)
+
+def parse(message: bytes) -> tuple:
+    """(event, data) of one SSE message."""
+    fields = dict(line.split(": ", 1) for line in message.decode().strip().split("\n") if not line.startswith("retry"))
+    data = orjson.loads(fields["data"])
+    assert int(fields["id"]) == data["version"]
+    return fields["event"], data
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    broadcaster = Broadcaster(queue_size=2)
+    monkeypatch.setattr(app.events, "broadcaster", broadcaster)
+    return broadcaster
+
+def test_format_event():
+    assert format_event("upload", {"version": 7, "months": ["2023-01"]}) == (
+        b'id: 7\nevent: upload\ndata: {"version":7,"months":["2023-01"]}\n\n'
+    )
+
+def test_publish_reaches_only_the_owners_streams(broadcaster):
+    async def scenario():
+        mine, also_mine, theirs = broadcaster.subscribe(1), broadcaster.subscribe(1), broadcaster.subscribe(2)
+        assert broadcaster.connections() == 3
+        # Published from another thread, as jobs do
+        worker = threading.Thread(target=broadcaster.publish, args=(1, "upload", {"version": 3}))
+        worker.start()
+        worker.join()
+        for queue in (mine, also_mine):
+            assert parse(await asyncio.wait_for(queue.get(), 1)) == ("upload", {"version": 3})
+        assert theirs.empty()
+
+        broadcaster.unsubscribe(1, mine)
+        broadcaster.unsubscribe(1, also_mine)
+        assert not broadcaster.has_subscribers(1)
+        assert broadcaster.owners() == [2]
+    asyncio.run(scenario())
+
+def test_slow_stream_loses_the_oldest_events(broadcaster):
+    async def scenario():
+        queue = broadcaster.subscribe(1)
+        for version in (1, 2, 3):
+            broadcaster.publish(1, "upload", {"version": version})
+        await asyncio.sleep(0)  # Let the loop run the queued puts
+        versions = [parse(queue.get_nowait())[1]["version"] for _ in range(queue.qsize())]
+        assert versions == [2, 3]
+    asyncio.run(scenario())
+
+def test_versions_seen_by_streams(broadcaster):
+    async def scenario():
+        broadcaster.subscribe(1)
+        broadcaster.seen(1, 4)
+        assert not broadcaster.is_new(1, 4)
+        assert broadcaster.is_new(1, 5)
+        broadcaster.publish(1, "changed", {"version": 5})
+        assert not broadcaster.is_new(1, 5)
+    asyncio.run(scenario())
+
+def test_stream_sends_ready_then_upload_deltas(broadcaster, make_user, ingest):
+    owner_id, _ = make_user("a@example.com")
+
+    async def scenario():
+        stream = event_stream(owner_id)
+        first = await stream.__anext__()
+        assert first.startswith(b"retry: ")
+        event, ready = parse(first)
+        assert event == "ready"
+        assert ready["totals"]["record_count"] == 0
+
+        await asyncio.to_thread(ingest, CSV, owner_id)
+        event, upload = parse(await asyncio.wait_for(stream.__anext__(), 5))
+        assert event == "upload"
+        assert upload["version"] > ready["version"]
+        assert upload["totals"]["record_count"] == 2
+        assert upload["totals"]["net_profit"] == 210.0
+        assert upload["accounts"] == ["ACC-1", "ACC-2"]
+        assert [(month["month"], month["revenue"]) for month in upload["months"]] == [("2023-01", 100.0), ("2023-02", 200.0)]
+        await stream.aclose()
+        assert not broadcaster.has_subscribers(owner_id)
+    asyncio.run(scenario())
+
+def test_changes_by_other_workers_are_polled(broadcaster, db, make_user):
+    owner_id, _ = make_user("a@example.com")
+
+    async def scenario():
+        stream = event_stream(owner_id)
+        _, ready = parse(await stream.__anext__())
+        # Committed elsewhere: no local publish, only the version moves
+        bump_data_version(db, owner_id)
+        db.commit()
+        await asyncio.to_thread(app.events._poll_versions, broadcaster.owners())
+        event, changed = parse(await asyncio.wait_for(stream.__anext__(), 5))
+        assert event == "changed" and changed["version"] == ready["version"] + 1
+        # Already sent: the next poll publishes nothing
+        await asyncio.to_thread(app.events._poll_versions, broadcaster.owners())
+        assert broadcaster.published == 1
+        await stream.aclose()
+    asyncio.run(scenario())
+
+def test_stream_endpoint_requires_a_token(client):
+    assert client.get("/dashboard/stream").status_code == 401
@@ -0,0 +1,67 @@
+import importlib.util
+import io
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from app.ingest import iter_chunks, prepare_chunk
+
+GENERATOR_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data-engineering")
+
+@pytest.fixture(scope="module")
+def generator():
+    # Importable as generate_data so worker processes can unpickle generate_shard
+    sys.path.insert(0, GENERATOR_DIR)
+    spec = importlib.util.spec_from_file_location("generate_data", os.path.join(GENERATOR_DIR, "generate_data.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["generate_data"] = module
+    spec.loader.exec_module(module)
+    yield module
+    sys.modules.pop("generate_data", None)
+    sys.path.remove(GENERATOR_DIR)
+
+def generate(generator, tmp_path, name: str, **kwargs) -> pd.DataFrame:
+    path = str(tmp_path / name)
+    generator.generate_synthetic_data(output_path=path, **kwargs)
+    return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+
+def test_same_seed_same_rows_whatever_the_worker_count(generator, tmp_path):
+    options = dict(num_records=2500, chunk_size=600, seed=7)
+    serial = generate(generator, tmp_path, "serial.csv", workers=1, **options)
+    parallel = generate(generator, tmp_path, "parallel.csv", workers=3, **options)
+    assert len(serial) == 2500
+    pd.testing.assert_frame_equal(serial, parallel)
+
+    other_seed = generate(generator, tmp_path, "other.csv", workers=1, **{**options, "seed": 8})
+    assert not serial.equals(other_seed)
+
+def test_rows_respect_the_requested_shape(generator, tmp_path):
+    rows = generate(
+        generator, tmp_path, "rows.csv", num_records=1000, num_accounts=5,
+        start_date="2024-02-01", end_date="2024-02-29", workers=1
+    )
+    assert rows["account_id"].nunique() <= 5
+    assert set(rows["account_id"]) <= {f"ACC-{100 + i}" for i in range(5)}
+    dates = pd.to_datetime(rows["date"])
+    assert dates.min() >= pd.Timestamp("2024-02-01") and dates.max() <= pd.Timestamp("2024-02-29")
+    assert (rows["revenue"].between(5000, 50000)).all()
+    # Loss-making rows always carry a delay
+    assert (rows.loc[rows["expense"] > rows["revenue"], "payment_delay_days"] >= 10).all()
+
+def test_csv_and_parquet_hold_the_same_rows(generator, tmp_path):
+    options = dict(num_records=800, chunk_size=300, seed=3, workers=1)
+    csv = generate(generator, tmp_path, "rows.csv", **options)
+    parquet = generate(generator, tmp_path, "rows.parquet", **options)
+    parquet["date"] = parquet["date"].dt.strftime("%Y-%m-%d")
+    pd.testing.assert_frame_equal(csv, parquet)
+
+def test_generated_rows_pass_upload_validation(generator, tmp_path):
+    path = str(tmp_path / "rows.csv")
+    generator.generate_synthetic_data(2000, path, chunk_size=700, workers=1)
+    with open(path, "rb") as f:
+        data = f.read()
+    for chunk in iter_chunks(io.BytesIO(data), 1000):
+        _, rejected, _ = prepare_chunk(chunk, 1)
+        assert rejected is None
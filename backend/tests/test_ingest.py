@@ -0,0 +1,106 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.ingest import IngestError, iter_chunks, prepare_chunk, validate_chunk
+
+HEADER = "account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+
+def read(rows: str) -> pd.DataFrame:
+    return next(iter_chunks(io.BytesIO((HEADER + rows).encode())))
+
+def test_valid_rows_are_coerced():
+    valid, rejected, counts = validate_chunk(read(
+        "ACC-1,2023-01-05,100.5,40,60,3,0,0\n"
+        "ACC-2,2023-02-01,0,0,-10,0,1.25,7\n"
+    ))
+    assert rejected is None and counts == {}
+    assert list(valid["account_id"]) == ["ACC-1", "ACC-2"]
+    assert list(valid["date"]) == [pd.Timestamp("2023-01-05"), pd.Timestamp("2023-02-01")]
+    assert valid["transaction_count"].dtype == "int64"
+    assert valid["revenue"].tolist() == [100.5, 0.0]
+
+def test_rejected_rows_carry_their_reasons_and_row_numbers():
+    valid, rejected, counts = validate_chunk(read(
+        "ACC-1,2023-01-05,100,40,60,3,0,0\n"
+        ",2023-01-05,100,40,60,3,0,0\n"
+        "ACC-3,not-a-date,100,40,60,3,0,0\n"
+        "ACC-4,2023-01-05,-1,40,60,3,0,0\n"
+        "ACC-5,2023-01-05,100,abc,60,2.5,0,0\n"
+        "ACC-6,2023-01-05,100,40,60,3,0,0\n"
+        "ACC-7,,100,40,inf,3,0,3000000000\n"
+    ), first_row=100)
+    assert list(valid["account_id"]) == ["ACC-1", "ACC-6"]
+    assert rejected["row_number"].tolist() == [102, 103, 104, 105, 107]
+    assert rejected["reason"].tolist() == [
+        "account_id is missing",
+        "date is not a valid date",
+        "revenue is below 0",
+        "expense is not a number; transaction_count is not a whole number",
+        "date is missing; balance is not finite; payment_delay_days is above 2147483647",
+    ]
+    # The report keeps the values as read
+    assert rejected.iloc[1]["date"] == "not-a-date"
+    assert counts == {
+        "account_id is missing": 1,
+        "date is missing": 1,
+        "date is not a valid date": 1,
+        "revenue is below 0": 1,
+        "expense is not a number": 1,
+        "balance is not finite": 1,
+        "transaction_count is not a whole number": 1,
+        "payment_delay_days is above 2147483647": 1,
+    }
+
+def test_row_numbers_continue_across_chunks():
+    data = (HEADER + "ACC-1,2023-01-01,1,1,1,1,0,0\n" * 3 + "ACC-1,bad,1,1,1,1,0,0\n").encode()
+    rows_read, numbers = 0, []
+    for chunk in iter_chunks(io.BytesIO(data), chunk_size=2):
+        read_count = len(chunk)
+        _, rejected, _ = prepare_chunk(chunk, 1, rows_read)
+        if rejected is not None:
+            numbers += rejected["row_number"].tolist()
+        rows_read += read_count
+    assert numbers == [4]
+
+def test_prepare_chunk_stamps_owner_and_row_ids():
+    chunk, _, _ = prepare_chunk(read(
+        "ACC-1,2023-01-05,100,40,60,3,0,0\n"
+        "ACC-1,2023-01-06,100,40,60,3,0,0\n"
+    ), owner_id=7)
+    assert chunk["owner_id"].tolist() == [7, 7]
+    assert chunk["source_row_id"].str.fullmatch("[0-9a-f]{16}").all()
+    assert chunk["source_row_id"].nunique() == 2
+
+    again, _, _ = prepare_chunk(read("ACC-1,2023-01-05,100,40,60,3,0,0\n"), owner_id=7)
+    assert again["source_row_id"].iloc[0] == chunk["source_row_id"].iloc[0]
+
+def test_prepare_chunk_normalizes_headers():
+    chunk = read("ACC-1,2023-01-05,100,40,60,3,0,0\n")
+    chunk.columns = [f" {column.upper()} " for column in chunk.columns]
+    valid, rejected, _ = prepare_chunk(chunk, 1)
+    assert rejected is None and len(valid) == 1
+
+def test_prepare_chunk_rejects_missing_columns():
+    with pytest.raises(IngestError, match="balance"):
+        prepare_chunk(read("ACC-1,2023-01-05,100,40,60,3,0,0\n").drop(columns="balance"), 1)
+
+def test_job_reports_rejected_rows(client, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    job = ingest((HEADER + "ACC-1,2023-01-05,100,40,60,3,0,0\nACC-2,2023-01-05,-5,40,60,3,0,0\n").encode(), owner_id)
+    assert job.result["records_inserted"] == 1
+    assert job.result["records_rejected"] == 1
+    assert job.result["rejection_reasons"] == {"revenue is below 0": 1}
+
+    report = client.get(f"/upload/jobs/{job.id}/rejected", headers=headers)
+    assert report.status_code == 200
+    assert report.text.splitlines() == [
+        "row_number,reason," + HEADER.strip(),
+        "2,revenue is below 0,ACC-2,2023-01-05,-5,40,60,3,0,0",
+    ]
+    lines = client.get(f"/upload/jobs/{job.id}/rejected", params={"format": "ndjson"}, headers=headers).text
+    assert pd.read_json(io.StringIO(lines), lines=True)["row_number"].tolist() == [2]
+
+    _, other = make_user("b@example.com")
+    assert client.get(f"/upload/jobs/{job.id}/rejected", headers=other).status_code == 404
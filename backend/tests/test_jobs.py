@@ -0,0 +1,151 @@
+import gzip
+import io
+import time
+
+import pandas as pd
+import pytest
+from sqlalchemy import func, select
+
+from app import jobs
+from app.crud import record_upload
+from app.models import FinancialRecord, IngestJobRecord, UploadLedger
+
+CSV = (
+    b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+    b"ACC-101,2023-01-01,5000.00,2000.00,3000.00,15,0.00,0\n"
+    b"ACC-101,2023-02-01,5200.00,2100.00,3100.00,18,50.00,2\n"
+    b"ACC-102,2023-01-15,1000.00,1200.00,-200.00,5,300.00,15\n"
+)
+
+def as_parquet(data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    pd.read_csv(io.BytesIO(data)).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+FILES = {
+    "csv": CSV,
+    "gzip": gzip.compress(CSV),
+    "parquet": as_parquet(CSV),
+}
+
+@pytest.mark.parametrize("file_format", FILES)
+def test_reupload_is_found_in_the_ledger(ingest, db, file_format):
+    data = FILES[file_format]
+    job = ingest(data)
+    assert job.status == "succeeded", job.error
+    assert job.result["records_inserted"] == 3
+
+    _, content_hash, _ = jobs.spool_upload(io.BytesIO(data))
+    existing = jobs.find_duplicate(1, content_hash)
+    assert existing is not None
+    assert existing.records_inserted == 3
+    assert jobs.find_duplicate(2, content_hash) is None
+
+@pytest.mark.parametrize("file_format", FILES)
+def test_concurrent_duplicate_fails_on_the_ledger_key(ingest, db, file_format):
+    data = FILES[file_format]
+    assert ingest(data).status == "succeeded"
+
+    # A second job for the same bytes that passed the router's check before the first committed
+    job = ingest(data)
+    assert job.status == "duplicate"
+    assert job.error == "Identical file was already ingested"
+    assert db.scalar(select(func.count()).select_from(FinancialRecord)) == 3
+    assert db.scalar(select(func.count()).select_from(UploadLedger)) == 1
+
+def test_each_format_is_a_distinct_upload(ingest, db):
+    for data in FILES.values():
+        assert ingest(data).status == "succeeded"
+    # Same rows, so the natural key skips them after the first file
+    assert db.scalar(select(func.count()).select_from(FinancialRecord)) == 3
+    assert db.scalar(select(func.count()).select_from(UploadLedger)) == 3
+
+def test_other_integrity_errors_are_not_duplicates(db):
+    from sqlalchemy.exc import IntegrityError
+
+    record_upload(db, 1, "abc", "upload", "user1@example.com", 1)
+    db.commit()
+    with pytest.raises(IntegrityError) as ledger_violation:
+        record_upload(db, 1, "abc", "upload", "user1@example.com", 1)
+    db.rollback()
+    assert jobs._is_duplicate_upload(ledger_violation.value)
+
+    db.add(FinancialRecord(id=1, owner_id=1, account_id="ACC-1", date=pd.Timestamp("2023-01-01").date()))
+    db.commit()
+    db.add(FinancialRecord(id=1, owner_id=1, account_id="ACC-2", date=pd.Timestamp("2023-02-01").date()))
+    with pytest.raises(IntegrityError) as key_violation:
+        db.commit()
+    db.rollback()
+    assert not jobs._is_duplicate_upload(key_violation.value)
+
+def wait_for(client, headers, job_id: str, timeout: float = 10) -> dict:
+    """The job as served once its worker is done with it (it leaves the in-memory registry last)."""
+    deadline = time.monotonic() + timeout
+    while job_id in jobs._jobs and time.monotonic() < deadline:
+        assert client.get(f"/upload/jobs/{job_id}", headers=headers).json()["status"] in JOB_STATUSES
+        time.sleep(0.02)
+    return client.get(f"/upload/jobs/{job_id}", headers=headers).json()
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "duplicate")
+
+def upload(client, headers, data: bytes, filename: str = "records.csv"):
+    return client.post("/upload/financial-data", files={"file": (filename, data)}, headers=headers)
+
+def test_upload_runs_as_a_background_job(client, make_user):
+    _, headers = make_user("a@example.com")
+    response = upload(client, headers, CSV)
+    assert response.status_code == 202
+    accepted = response.json()
+    assert accepted["status_url"] == f"/upload/jobs/{accepted['job_id']}"
+
+    job = wait_for(client, headers, accepted["job_id"])
+    assert job["status"] == "succeeded", job["error"]
+    assert job["filename"] == "records.csv"
+    assert job["rows_processed"] == 3
+    assert job["result"]["records_inserted"] == 3
+    assert job["rejected_rows_url"] is None
+    assert client.get("/dashboard/summary", headers=headers).json()["total_revenue"] == 11200.0
+
+    again = upload(client, headers, CSV)
+    assert again.status_code == 200
+    assert again.json()["status"] == "duplicate"
+    assert again.json()["records_inserted"] == 3
+
+def test_finished_job_is_read_from_the_database(client, db, make_user):
+    _, headers = make_user("a@example.com")
+    job_id = upload(client, headers, CSV).json()["job_id"]
+    # Served from ingest_jobs, as by any other worker
+    job = wait_for(client, headers, job_id)
+    assert job["status"] == "succeeded" and job["rows_processed"] == 3
+    assert job["started_at"] <= job["finished_at"]
+
+    record = db.get(IngestJobRecord, job_id)
+    assert record.status == "succeeded"
+    assert record.result["records_inserted"] == 3
+
+    _, other = make_user("b@example.com")
+    assert client.get(f"/upload/jobs/{job_id}", headers=other).status_code == 404
+    _, admin = make_user("admin@example.com", role="admin")
+    assert client.get(f"/upload/jobs/{job_id}", headers=admin).status_code == 200
+
+def test_invalid_file_fails_the_job(client, make_user):
+    _, headers = make_user("a@example.com")
+    job_id = upload(client, headers, b"account_id,date\nACC-1,2023-01-01\n").json()["job_id"]
+    job = wait_for(client, headers, job_id)
+    assert job["status"] == "failed"
+    assert "Missing" in job["error"]
+    assert client.get("/dashboard/summary", headers=headers).json()["total_revenue"] == 0.0
+    # Nothing was ingested, so the same file can be fixed and sent again
+    assert jobs.find_duplicate(1, jobs.spool_upload(io.BytesIO(b"account_id,date\nACC-1,2023-01-01\n"))[1]) is None
+
+def test_old_finished_jobs_are_pruned(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(jobs, "INGEST_MAX_FINISHED_JOBS", 1)
+    _, headers = make_user("a@example.com")
+    first = upload(client, headers, CSV).json()["job_id"]
+    wait_for(client, headers, first)
+    second = upload(client, headers, FILES["gzip"]).json()["job_id"]
+    wait_for(client, headers, second)
+
+    assert db.get(IngestJobRecord, second) is not None
+    assert db.get(IngestJobRecord, first) is None
+    assert client.get(f"/upload/jobs/{first}", headers=headers).status_code == 404
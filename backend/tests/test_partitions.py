@@ -0,0 +1,91 @@
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.orm import sessionmaker
+
+from app import partitions
+from app.partitions import (
+    PartitionLockTimeout, ensure_partitions, list_partitions, month_start, next_month, partition_name
+)
+
+# PostgreSQL database the partition DDL tests may recreate financial_records in
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+def test_month_helpers():
+    assert month_start(date(2023, 5, 17)) == date(2023, 5, 1)
+    assert next_month(date(2023, 5, 1)) == date(2023, 6, 1)
+    assert next_month(date(2023, 12, 1)) == date(2024, 1, 1)
+    assert partition_name(date(2023, 5, 1)) == "financial_records_p2023_05"
+    assert partitions.PARTITION_NAME.match(partition_name(date(2023, 5, 1))).groups() == ("2023", "05")
+
+class LockNotAvailable(Exception):
+    pgcode = partitions.LOCK_NOT_AVAILABLE
+
+def lock_timeouts(monkeypatch, failures: int):
+    """Make the first `failures` creation attempts time out on a lock; returns the attempt log."""
+    attempts = []
+
+    def create(db, months):
+        attempts.append(months)
+        if len(attempts) <= failures:
+            raise exc.OperationalError("ALTER TABLE ...", {}, LockNotAvailable())
+        return [partition_name(month) for month in months]
+
+    monkeypatch.setattr(partitions, "_missing", lambda conn, months: list(months))
+    monkeypatch.setattr(partitions, "_create_partitions", create)
+    monkeypatch.setattr(partitions.time, "sleep", lambda seconds: None)
+    return attempts
+
+def test_lock_timeout_is_retried(monkeypatch):
+    attempts = lock_timeouts(monkeypatch, failures=partitions.PARTITION_LOCK_RETRIES)
+    assert ensure_partitions(None, [date(2023, 1, 1)]) == ["financial_records_p2023_01"]
+    assert len(attempts) == partitions.PARTITION_LOCK_RETRIES + 1
+
+def test_lock_timeout_gives_up_after_retries(monkeypatch):
+    attempts = lock_timeouts(monkeypatch, failures=partitions.PARTITION_LOCK_RETRIES + 1)
+    with pytest.raises(PartitionLockTimeout):
+        ensure_partitions(None, [date(2023, 1, 1)])
+    assert len(attempts) == partitions.PARTITION_LOCK_RETRIES + 1
+
+def test_other_errors_are_not_retried(monkeypatch):
+    attempts = lock_timeouts(monkeypatch, failures=0)
+
+    def broken(db, months):
+        attempts.append(months)
+        raise exc.OperationalError("CREATE TABLE ...", {}, Exception("connection lost"))
+    monkeypatch.setattr(partitions, "_create_partitions", broken)
+    with pytest.raises(exc.OperationalError):
+        ensure_partitions(None, [date(2023, 1, 1)])
+    assert len(attempts) == 1
+
+@pytest.fixture
+def pg_db():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL (PostgreSQL) not set")
+    from app.models import FinancialRecord
+
+    engine = create_engine(TEST_DATABASE_URL)
+    FinancialRecord.__table__.drop(engine, checkfirst=True)
+    FinancialRecord.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    FinancialRecord.__table__.drop(engine)
+    engine.dispose()
+
+def test_ensure_partitions_is_idempotent(pg_db):
+    assert partitions.is_partitioned(pg_db)
+    months = [date(2023, 1, 1), date(2023, 2, 1)]
+    assert ensure_partitions(pg_db, months) == ["financial_records_p2023_01", "financial_records_p2023_02"]
+    assert ensure_partitions(pg_db, months) == []
+    assert ensure_partitions(pg_db, months + [date(2023, 3, 1)]) == ["financial_records_p2023_03"]
+    assert [name for _, name in list_partitions(pg_db)] == [
+        "financial_records_p2023_01", "financial_records_p2023_02", "financial_records_p2023_03"
+    ]
+    pg_db.execute(text(
+        "INSERT INTO financial_records (owner_id, account_id, date) VALUES (1, 'ACC-1', '2023-02-15')"
+    ))
+    assert pg_db.execute(text("SELECT count(*) FROM financial_records_p2023_02")).scalar() == 1
+    pg_db.rollback()
@@ -0,0 +1,111 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.query_engine import QueryError, run_query
+from app.schemas import AnalyticsQuery
+
+AGGS = ["count", "sum", "mean", "std", "min", "max", "median", "p25", "p90", "p99"]
+PANDAS_AGGS = {
+    "count": "size", "sum": "sum", "mean": "mean", "std": "std", "min": "min", "max": "max",
+    "median": "median", "p25": lambda s: s.quantile(0.25), "p90": lambda s: s.quantile(0.9),
+    "p99": lambda s: s.quantile(0.99),
+}
+
+def make_records(rows: int = 800, seed: int = 11) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "account_id": rng.choice([f"ACC-{i}" for i in range(9)], rows),
+        "date": pd.Timestamp("2023-10-01") + pd.to_timedelta(rng.integers(0, 200, rows), unit="D"),
+        "revenue": rng.uniform(0, 5000, rows).round(2),
+        "expense": rng.uniform(0, 4000, rows).round(2),
+        "balance": rng.normal(1000, 500, rows).round(2),
+        "transaction_count": rng.integers(0, 50, rows),
+        "overdue_amount": rng.uniform(0, 900, rows).round(2),
+        "payment_delay_days": rng.choice([0, 0, 5, 30, 31, 60, 61, 90, 91, 140], rows),
+    })
+
+@pytest.fixture
+def records(db, ingest):
+    frame = make_records()
+    job = ingest(frame.to_csv(index=False, date_format="%Y-%m-%d").encode(), 1)
+    assert job.result["records_inserted"] == len(frame)
+    frame["month"] = frame["date"].dt.strftime("%Y-%m")
+    frame["profit"] = frame["revenue"] - frame["expense"]
+    frame["delay_bucket"] = pd.cut(
+        frame["payment_delay_days"], [-1, 0, 30, 60, 90, np.inf], labels=["0", "1-30", "31-60", "61-90", "90+"]
+    ).astype(str)
+    return frame
+
+def query(**fields) -> dict:
+    return run_query(1, AnalyticsQuery(**fields))
+
+def expected_groups(frame: pd.DataFrame, dimensions: list, column: str) -> pd.DataFrame:
+    grouped = frame.groupby(dimensions)[column] if dimensions else frame.assign(_all=0).groupby("_all")[column]
+    expected = grouped.agg(list(PANDAS_AGGS.values()))
+    expected.columns = [f"{column}_{agg}" for agg in PANDAS_AGGS]
+    return expected.fillna({f"{column}_std": 0.0})
+
+def result_frame(result: dict, dimensions: list) -> pd.DataFrame:
+    frame = pd.DataFrame(result["data"])
+    return frame.set_index(dimensions).sort_index() if dimensions else frame
+
+@pytest.mark.parametrize("dimensions", [[], ["account_id"], ["month"], ["delay_bucket"], ["account_id", "month"]])
+@pytest.mark.parametrize("column", ["revenue", "profit", "payment_delay_days"])
+def test_aggregates_match_pandas(records, dimensions, column):
+    result = query(dimensions=dimensions, metrics=[{"column": column, "agg": agg} for agg in AGGS])
+    expected = expected_groups(records, dimensions, column)
+    assert result["rows_total"] == result["rows_matched"] == len(records)
+    assert result["groups"] == len(expected)
+
+    actual = result_frame(result, dimensions)
+    for name in expected.columns:
+        np.testing.assert_allclose(actual[name].to_numpy(dtype=float), expected[name].to_numpy(dtype=float), rtol=1e-9, atol=1e-9, err_msg=name)
+
+@pytest.mark.parametrize("condition, selector", [
+    ({"column": "account_id", "op": "in", "value": ["ACC-1", "ACC-3", "ACC-404"]}, lambda f: f["account_id"].isin(["ACC-1", "ACC-3"])),
+    ({"column": "month", "op": "between", "value": ["2023-12", "2024-02"]}, lambda f: f["month"].between("2023-12", "2024-02")),
+    ({"column": "date", "op": "lt", "value": "2023-11-15"}, lambda f: f["date"] < "2023-11-15"),
+    ({"column": "delay_bucket", "op": "ne", "value": "0"}, lambda f: f["delay_bucket"] != "0"),
+    ({"column": "profit", "op": "ge", "value": 0}, lambda f: f["profit"] >= 0),
+])
+def test_filters_match_pandas(records, condition, selector):
+    result = query(dimensions=["account_id"], metrics=[{"column": "revenue", "agg": "sum"}], filters=[condition])
+    selected = records[selector(records)]
+    assert result["rows_matched"] == len(selected)
+    expected = selected.groupby("account_id")["revenue"].sum()
+    actual = result_frame(result, ["account_id"])["revenue_sum"]
+    pd.testing.assert_series_equal(actual, expected, check_names=False, rtol=1e-9)
+
+def test_order_and_limit(records):
+    result = query(dimensions=["account_id"], metrics=[{"column": "revenue", "agg": "sum"}], order_by="revenue_sum", limit=3)
+    expected = records.groupby("account_id")["revenue"].sum().sort_values(ascending=False)
+    assert [row["account_id"] for row in result["data"]] == list(expected.index[:3])
+    assert result["truncated"]
+
+def test_snapshot_catches_up_with_new_uploads(records, ingest):
+    before = query(metrics=[{"column": "revenue", "agg": "sum"}])
+    extra = "account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\nACC-1,2024-06-01,1234.5,0,0,1,0,0\n"
+    ingest(extra.encode(), 1)
+    after = query(metrics=[{"column": "revenue", "agg": "sum"}])
+    assert after["data_version"] > before["data_version"]
+    assert after["rows_total"] == len(records) + 1
+    assert after["data"][0]["revenue_sum"] == pytest.approx(before["data"][0]["revenue_sum"] + 1234.5)
+
+@pytest.mark.parametrize("fields", [
+    {"metrics": [{"column": "revenue", "agg": "sum"}], "order_by": "expense_sum"},
+    {"metrics": [{"column": "revenue", "agg": "sum"}], "filters": [{"column": "revenue", "op": "between", "value": [1]}]},
+    {"metrics": [{"column": "revenue", "agg": "sum"}], "filters": [{"column": "delay_bucket", "value": "7"}]},
+    {"metrics": [{"column": "revenue", "agg": "sum"}], "filters": [{"column": "date", "value": "yesterday"}]},
+])
+def test_invalid_queries(records, fields):
+    with pytest.raises(QueryError):
+        query(**fields)
+
+def test_query_endpoint_reports_invalid_queries(client, make_user):
+    _, headers = make_user("a@example.com")
+    body = {"metrics": [{"column": "revenue", "agg": "sum"}], "order_by": "nope"}
+    assert client.post("/dashboard/query", json=body, headers=headers).status_code == 400
+    assert client.post("/dashboard/query", json={"metrics": []}, headers=headers).status_code == 422
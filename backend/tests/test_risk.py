@@ -0,0 +1,125 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from app.ingest import ingest_file
+from app.models import AccountRisk, FinancialAggregate
+from app.risk import (
+    RISK_COLUMNS, STAT_COLUMNS, level_of, month_number, portfolio_risk, score_windows, shift_month, window_sums
+)
+
+def random_aggregates(seed: int = 1) -> pd.DataFrame:
+    """Sorted (account_id, month) rows with gaps, spanning a year boundary."""
+    rng = np.random.default_rng(seed)
+    months = [f"{year}-{month:02d}" for year in (2022, 2023) for month in range(1, 13)]
+    rows = []
+    for account in ("ACC-1", "ACC-2", "ACC-3"):
+        for month in sorted(rng.choice(months, 14, replace=False)):
+            rows.append([account, month, *rng.integers(1, 100, len(STAT_COLUMNS))])
+    return pd.DataFrame(rows, columns=["account_id", "month", *STAT_COLUMNS])
+
+def test_month_arithmetic():
+    assert month_number(["2023-01"])[0] - month_number(["2022-12"])[0] == 1
+    assert shift_month("2023-01", -2) == "2022-11"
+    assert shift_month("2022-11", 14) == "2024-01"
+
+@pytest.mark.parametrize("window", [1, 3, 6])
+def test_window_sums_match_a_naive_loop(window):
+    aggregates = random_aggregates()
+    numbers = month_number(aggregates["month"])
+    expected = np.array([
+        aggregates.loc[
+            (aggregates["account_id"] == row.account_id)
+            & (numbers <= numbers[i]) & (numbers > numbers[i] - window),
+            STAT_COLUMNS
+        ].sum().to_numpy(dtype=float)
+        for i, row in enumerate(aggregates.itertuples())
+    ])
+    np.testing.assert_allclose(window_sums(aggregates, window), expected)
+
+def test_score_of_a_known_window():
+    aggregates = pd.DataFrame([
+        # Two months of revenue 100 and 300, expenses 330 (ratio 0.825), overdue 20, delays 30 days
+        ["ACC-1", "2023-01", 1, 100.0, 100.0 ** 2, 110.0, 0.0, 0],
+        ["ACC-1", "2023-02", 1, 300.0, 300.0 ** 2, 220.0, 20.0, 30],
+    ], columns=["account_id", "month", *STAT_COLUMNS])
+    scores = score_windows(aggregates).set_index("month")
+    february = scores.loc["2023-02"]
+    assert february["record_count"] == 2
+    assert february["expense_ratio"] == pytest.approx(330 / 400)
+    assert february["overdue_ratio"] == pytest.approx(20 / 400)
+    assert february["avg_delay_days"] == pytest.approx(15)
+    assert february["revenue_volatility"] == pytest.approx(np.std([100, 300], ddof=1) / 200)
+
+    expected = 100 * (
+        0.35 * (0.825 - 0.8) / 0.3 + 0.25 * 0.05 / 0.2 + 0.2 * 15 / 60 + 0.2 * min((february["revenue_volatility"] - 0.1) / 0.5, 1)
+    )
+    assert february["score"] == pytest.approx(expected, abs=0.01)
+    assert february["level"] == level_of(february["score"])
+    assert [level_of(score) for score in (0, 34.99, 35, 64.99, 65, 100)] == ["Low", "Low", "Medium", "Medium", "High", "High"]
+
+HEADER = "account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+
+def make_upload(seed: int, months: list) -> bytes:
+    rng = np.random.default_rng(seed)
+    lines = [
+        f"ACC-{rng.integers(1, 5)},{month}-{rng.integers(1, 28):02d},{rng.uniform(100, 1000):.2f},"
+        f"{rng.uniform(50, 1200):.2f},0,1,{rng.choice([0, rng.uniform(0, 300)]):.2f},{rng.choice([0, rng.integers(1, 90)])}\n"
+        for month in months for _ in range(6)
+    ]
+    return (HEADER + "".join(lines)).encode()
+
+def stored_scores(db, owner_id: int) -> pd.DataFrame:
+    rows = db.execute(
+        select(*[AccountRisk.__table__.c[column] for column in RISK_COLUMNS[1:-1]])
+        .where(AccountRisk.owner_id == owner_id).order_by(AccountRisk.account_id, AccountRisk.month)
+    ).all()
+    return pd.DataFrame(rows, columns=RISK_COLUMNS[1:-1])
+
+def test_incremental_scores_match_a_full_rescore(db):
+    uploads = [
+        make_upload(1, ["2023-01", "2023-02", "2023-03", "2023-04", "2023-05"]),
+        make_upload(2, ["2023-06", "2023-07"]),
+        # Back-filled month: later windows that contain it must be rescored too
+        make_upload(3, ["2023-02"]),
+    ]
+    for data in uploads:
+        ingest_file(db, io.BytesIO(data), 1)
+        db.commit()
+
+    aggregates = pd.DataFrame(
+        db.execute(
+            select(FinancialAggregate.account_id, FinancialAggregate.month,
+                   *[FinancialAggregate.__table__.c[column] for column in STAT_COLUMNS])
+            .where(FinancialAggregate.owner_id == 1)
+        ).all(),
+        columns=["account_id", "month", *STAT_COLUMNS]
+    )
+    expected = score_windows(aggregates)[RISK_COLUMNS[1:-1]]
+    pd.testing.assert_frame_equal(stored_scores(db, 1), expected, check_exact=False, rtol=1e-9, check_dtype=False)
+
+    latest = expected.groupby("account_id").tail(1)
+    risk = portfolio_risk(db, 1)
+    assert risk["average_score"] == pytest.approx(latest["score"].mean(), abs=0.01)
+    assert risk["as_of"] == latest["month"].max()
+    assert sum(risk["accounts"].values()) == len(latest)
+    assert risk["accounts"]["High"] == (latest["level"] == "High").sum()
+
+def test_risk_endpoint(client, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    ingest(make_upload(1, ["2023-01", "2023-02", "2023-03"]), owner_id)
+
+    latest = client.get("/dashboard/risk", headers=headers).json()
+    assert [row["score"] for row in latest] == sorted((row["score"] for row in latest), reverse=True)
+    assert {row["month"] for row in latest} <= {"2023-01", "2023-02", "2023-03"}
+
+    account = latest[0]["account_id"]
+    history = client.get("/dashboard/risk", params={"account_id": account}, headers=headers).json()
+    assert [row["month"] for row in history] == sorted((row["month"] for row in history), reverse=True)
+    assert history[0] == latest[0]
+
+    summary = client.get("/dashboard/summary", headers=headers).json()
+    assert sum(summary["risk"]["accounts"].values()) == len(latest)
@@ -0,0 +1,104 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import sketches
+from app.ingest import ingest_file
+from app.sketches import RELATIVE_ACCURACY, bucket_keys, distributions, summarize
+
+QUANTILES = {"p01": 0.01, "p50": 0.5, "p90": 0.9, "p99": 0.99, "p100": 1.0}
+# Float rounding on top of the relative accuracy
+TOLERANCE = RELATIVE_ACCURACY * (1 + 1e-9)
+
+def exact(values: np.ndarray, q: float) -> float:
+    """Nearest-rank quantile."""
+    ordered = np.sort(values)
+    return float(ordered[max(int(np.ceil(q * len(ordered))), 1) - 1])
+
+def assert_within_bound(summary: dict, values: np.ndarray):
+    assert summary["count"] == len(values)
+    for name, q in QUANTILES.items():
+        expected = exact(values, q)
+        assert summary[name] == pytest.approx(expected, rel=TOLERANCE, abs=0), name
+    assert summary["min"] == pytest.approx(values.min(), rel=TOLERANCE, abs=0)
+    assert summary["max"] == pytest.approx(values.max(), rel=TOLERANCE, abs=0)
+
+def sketch(values: np.ndarray):
+    return bucket_keys(values), np.ones(len(values))
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(1).lognormal(5, 2, 20000),
+    np.concatenate([np.zeros(3000), np.random.default_rng(2).uniform(0.01, 10, 7000)]),
+    np.random.default_rng(3).integers(0, 120, 5000).astype(float),
+    np.array([42.0] * 10),
+    np.array([1e-9, 1e9]),
+])
+def test_summary_is_within_the_relative_accuracy(values):
+    assert_within_bound(summarize(*sketch(values), QUANTILES, bins=10), values)
+
+def test_merged_sketches_equal_the_sketch_of_all_values():
+    values = np.random.default_rng(4).exponential(300, 9000)
+    parts = np.split(values, [1000, 6500])
+    keys = np.concatenate([sketch(part)[0] for part in parts])
+    merged = summarize(keys, np.ones(len(keys)), QUANTILES, bins=20)
+    assert merged == summarize(*sketch(values), QUANTILES, bins=20)
+    assert_within_bound(merged, values)
+
+def test_histogram_counts_every_value():
+    values = np.random.default_rng(5).uniform(1, 100, 1000)
+    histogram = summarize(*sketch(values), QUANTILES, bins=7)["histogram"]
+    assert len(histogram) == 7
+    assert sum(row["count"] for row in histogram) == 1000
+    assert summarize(*sketch(np.array([5.0, 5.0])), QUANTILES, bins=7)["histogram"] == [
+        {"lower": pytest.approx(5, rel=TOLERANCE), "upper": pytest.approx(5, rel=TOLERANCE), "count": 2}
+    ]
+
+def test_empty_summary():
+    summary = summarize(np.array([], dtype=np.int16), np.array([]), QUANTILES, bins=5)
+    assert summary["count"] == 0 and summary["p50"] is None and summary["histogram"] == []
+
+def make_records(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "account_id": rng.choice(["ACC-1", "ACC-2", "ACC-3"], rows),
+        "date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 120, rows), unit="D"),
+        "revenue": rng.lognormal(7, 1, rows).round(2),
+        "expense": rng.uniform(0, 1000, rows).round(2),
+        "balance": 0.0,
+        "transaction_count": 1,
+        "overdue_amount": np.where(rng.random(rows) < 0.5, rng.uniform(0, 5000, rows).round(2), 0.0),
+        "payment_delay_days": rng.choice([0, 3, 15, 45, 90], rows),
+    })
+
+def test_stored_sketches_track_the_records(db, monkeypatch):
+    # Flush to the database many times within each upload
+    monkeypatch.setattr(sketches, "SKETCH_FLUSH_ENTRIES", 50)
+    uploads = [make_records(700, seed) for seed in (1, 2, 3)]
+    for records in uploads:
+        ingest_file(db, io.BytesIO(records.to_csv(index=False, date_format="%Y-%m-%d").encode()), 1, chunk_size=150)
+        db.commit()
+    records = pd.concat(uploads)
+    month = records["date"].dt.strftime("%Y-%m")
+
+    metrics = list(sketches.SKETCH_METRICS)
+    for from_month, to_month, account_id in [(None, None, None), ("2023-02", "2023-03", None), (None, "2023-02", "ACC-2")]:
+        selected = records[
+            (month >= (from_month or "0000")) & (month <= (to_month or "9999"))
+            & ((records["account_id"] == account_id) if account_id else True)
+        ]
+        result = distributions(db, 1, metrics, from_month, to_month, account_id, QUANTILES, bins=10)
+        for metric in metrics:
+            assert_within_bound(result[metric], selected[metric].to_numpy(dtype=float))
+
+def test_distributions_endpoint(client, make_user, ingest):
+    owner_id, headers = make_user("a@example.com")
+    ingest(make_records(300, 9).to_csv(index=False, date_format="%Y-%m-%d").encode(), owner_id)
+
+    body = client.get("/dashboard/distributions", params={"metric": "revenue", "bins": 5}, headers=headers).json()
+    assert body["relative_accuracy"] == RELATIVE_ACCURACY
+    assert list(body["metrics"]) == ["revenue"]
+    assert body["metrics"]["revenue"]["count"] == 300
+    assert len(body["metrics"]["revenue"]["histogram"]) == 5
+    assert client.get("/dashboard/distributions", params={"metric": "balance"}, headers=headers).status_code == 400
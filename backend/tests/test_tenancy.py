@@ -0,0 +1,51 @@
+import pytest
+
+OWNER_A = (
+    b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+    b"ACC-1,2023-01-01,100.00,40.00,60.00,1,0.00,0\n"
+    b"ACC-1,2023-02-01,200.00,50.00,150.00,2,0.00,0\n"
+)
+# Same account id and dates as owner A, different values
+OWNER_B = (
+    b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+    b"ACC-1,2023-01-01,1000.00,400.00,600.00,3,10.00,5\n"
+    b"ACC-2,2023-03-01,3000.00,100.00,2900.00,4,0.00,0\n"
+    b"ACC-2,2023-04-01,5000.00,900.00,4100.00,5,0.00,0\n"
+)
+
+@pytest.fixture
+def owners(ingest, make_user):
+    a_id, a = make_user("a@example.com")
+    b_id, b = make_user("b@example.com")
+    assert ingest(OWNER_A, a_id).status == "succeeded"
+    assert ingest(OWNER_B, b_id).status == "succeeded"
+    return a, b
+
+def test_summary_counts_only_the_callers_records(client, owners):
+    a, b = owners
+    summary_a = client.get("/dashboard/summary", headers=a).json()
+    summary_b = client.get("/dashboard/summary", headers=b).json()
+    assert (summary_a["total_revenue"], summary_a["total_expense"]) == (300.0, 90.0)
+    assert (summary_b["total_revenue"], summary_b["total_expense"]) == (9000.0, 1400.0)
+
+def test_records_and_account_ids_do_not_cross_owners(client, owners):
+    a, b = owners
+    page = client.get("/dashboard/records", params={"total": "exact"}, headers=a).json()
+    assert page["total"] == 2
+    assert [row["revenue"] for row in page["data"]] == [100.0, 200.0]
+
+    page = client.get("/dashboard/records", params={"account_id": "ACC-1", "total": "exact"}, headers=b).json()
+    assert page["total"] == 1
+    assert page["data"][0]["revenue"] == 1000.0
+
+    assert client.get("/dashboard/records", params={"account_id": "ACC-2"}, headers=a).json()["data"] == []
+
+def test_query_runs_on_the_callers_snapshot(client, owners):
+    a, b = owners
+    query = {"dimensions": ["account_id"], "metrics": [{"column": "revenue", "agg": "sum"}]}
+    result_a = client.post("/dashboard/query", json=query, headers=a).json()
+    result_b = client.post("/dashboard/query", json=query, headers=b).json()
+    assert result_a["rows_total"] == 2
+    assert result_a["data"] == [{"account_id": "ACC-1", "revenue_sum": 300.0}]
+    assert result_b["rows_total"] == 3
+    assert {row["account_id"]: row["revenue_sum"] for row in result_b["data"]} == {"ACC-1": 1000.0, "ACC-2": 8000.0}
@@ -0,0 +1,54 @@
+import os
+
+from sqlalchemy import func, select
+
+from app.database import Base
+from app.models import DashboardTotals, FinancialAggregate, IngestJobRecord, User
+
+CSV = (
+    b"account_id,date,revenue,expense,balance,transaction_count,overdue_amount,payment_delay_days\n"
+    b"ACC-101,2023-01-01,5000.00,2000.00,3000.00,15,0.00,0\n"
+    b"ACC-101,2023-02-01,5200.00,2100.00,3100.00,18,50.00,2\n"
+    b"ACC-102,2023-01-15,1000.00,1200.00,-200.00,5,300.00,15\n"
+    b"ACC-103,not-a-date,1.00,1.00,1.00,1,0.00,0\n"
+)
+
+def owner_rows(db, owner_id: int) -> dict:
+    """Row count per table holding data of the owner."""
+    counts = {}
+    for table in Base.metadata.sorted_tables:
+        if "owner_id" in table.c:
+            counts[table.name] = db.scalar(select(func.count()).select_from(table).where(table.c.owner_id == owner_id))
+    return counts
+
+def test_delete_user_removes_all_of_their_data(client, db, make_user, ingest):
+    _, admin = make_user("admin@example.com", role="admin")
+    keep_id, keep = make_user("keep@example.com")
+    gone_id, _ = make_user("gone@example.com")
+    for owner_id in (keep_id, gone_id):
+        job = ingest(CSV, owner_id)
+        assert job.status == "succeeded", job.error
+    report = db.scalar(select(IngestJobRecord.rejected_path).where(IngestJobRecord.owner_id == gone_id))
+    assert report is not None and os.path.exists(report)
+    assert db.scalar(select(func.count()).select_from(FinancialAggregate).where(FinancialAggregate.owner_id == gone_id))
+    before = owner_rows(db, keep_id)
+
+    response = client.delete(f"/auth/users/{gone_id}", headers=admin)
+    assert response.status_code == 204
+
+    db.expire_all()
+    assert db.get(User, gone_id) is None
+    remaining = {table: count for table, count in owner_rows(db, gone_id).items() if count}
+    assert remaining == {}
+    assert db.get(DashboardTotals, gone_id) is None
+    assert not os.path.exists(report)
+    assert owner_rows(db, keep_id) == before
+    assert client.get("/dashboard/summary", headers=keep).json()["total_revenue"] == 11200.0
+
+def test_delete_unknown_user(client, make_user):
+    _, admin = make_user("admin@example.com", role="admin")
+    assert client.delete("/auth/users/999", headers=admin).status_code == 404
+
+def test_delete_user_requires_admin(client, make_user):
+    user_id, headers = make_user("user@example.com")
+    assert client.delete(f"/auth/users/{user_id}", headers=headers).status_code == 403
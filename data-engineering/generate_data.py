@@ -1,71 +1,183 @@
-import pandas as pd
+"""
+Synthetic financial records generator.
+
+Rows are generated with NumPy in fixed-size shards. Shard i always draws from
+the random stream seeded by (seed, i), so the output for a given seed and
+chunk size is identical no matter how many worker processes are used.
+Shards are written in order as they complete, keeping memory bounded by
+roughly (workers * 2) shards.
+
+Usage:
+    python generate_data.py                                   # 1000 rows -> ../financial_records.csv
+    python generate_data.py --rows 100000000 --accounts 20000 --workers 8 \
+        --start 2020-01-01 --end 2024-12-31 --seed 7 --output records.parquet
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import random
-from datetime import datetime, timedelta
+import pandas as pd
 
-# Configuration
+# Configuration (defaults for the CLI flags)
 NUM_RECORDS = 1000
-START_DATE = datetime(2023, 1, 1)
-
-def generate_synthetic_data():
-    data = []
-    
-    # Generate 50 unique account IDs
-    account_ids = [f"ACC-{100 + i}" for i in range(50)]
-    
-    for _ in range(NUM_RECORDS):
-        acc_id = random.choice(account_ids)
-        
-        # Random Date within last 2 years
-        days_offset = random.randint(0, 730)
-        date = START_DATE + timedelta(days=days_offset)
-        
-        # Base Logic: Generate realistic correlation
-        # 1. Revenue (Random between 5k and 50k)
-        revenue = round(random.uniform(5000, 50000), 2)
-        
-        # 2. Expense (Usually 60-90% of revenue, sometimes higher for risk)
-        expense_ratio = random.uniform(0.6, 1.1)
-        expense = round(revenue * expense_ratio, 2)
-        
-        # 3. Balance (Revenue - Expense + Random Noise)
-        balance = round(revenue - expense + random.uniform(-1000, 1000), 2)
-        
-        # 4. Transaction Count (Correlated with revenue)
-        transaction_count = int(revenue / random.uniform(200, 500))
-        
-        # 5. Overdue & Delay (Risk Indicators)
-        # If expense > revenue, higher chance of overdue
-        if expense > revenue:
-            overdue_amount = round(random.uniform(1000, 10000), 2)
-            payment_delay_days = random.randint(10, 90)
+NUM_ACCOUNTS = 50
+START_DATE = "2023-01-01"
+END_DATE = "2025-01-01"  # Inclusive; 730 days after START_DATE
+SEED = 42
+CHUNK_SIZE = 500_000
+OUTPUT_PATH = "../financial_records.csv"
+
+def generate_shard(shard_index, num_rows, num_accounts, start_date, end_date, seed):
+    """Generate one shard of `num_rows` records as a DataFrame (vectorized)."""
+    rng = np.random.default_rng([seed, shard_index])
+
+    # Account IDs and random dates within the range
+    account_ids = np.array([f"ACC-{100 + i}" for i in range(num_accounts)])
+    accounts = account_ids[rng.integers(0, num_accounts, num_rows)]
+    start = np.datetime64(start_date, "D")
+    span_days = (np.datetime64(end_date, "D") - start).astype(int)
+    dates = start + rng.integers(0, span_days + 1, num_rows)
+
+    # Base Logic: Generate realistic correlation
+    # 1. Revenue (Random between 5k and 50k)
+    revenue = np.round(rng.uniform(5000, 50000, num_rows), 2)
+
+    # 2. Expense (Usually 60-90% of revenue, sometimes higher for risk)
+    expense = np.round(revenue * rng.uniform(0.6, 1.1, num_rows), 2)
+
+    # 3. Balance (Revenue - Expense + Random Noise)
+    balance = np.round(revenue - expense + rng.uniform(-1000, 1000, num_rows), 2)
+
+    # 4. Transaction Count (Correlated with revenue)
+    transaction_count = (revenue / rng.uniform(200, 500, num_rows)).astype(np.int64)
+
+    # 5. Overdue & Delay (Risk Indicators)
+    overdue_amount = np.zeros(num_rows)
+    payment_delay_days = np.zeros(num_rows, dtype=np.int64)
+
+    # If expense > revenue, higher chance of overdue
+    loss = expense > revenue
+    overdue_amount[loss] = np.round(rng.uniform(1000, 10000, loss.sum()), 2)
+    payment_delay_days[loss] = rng.integers(10, 91, loss.sum())
+
+    # Healthy accounts usually have 0 or low overdue (20% chance of random delay)
+    delayed = ~loss & (rng.random(num_rows) > 0.8)
+    overdue_amount[delayed] = np.round(rng.uniform(0, 2000, delayed.sum()), 2)
+    payment_delay_days[delayed] = rng.integers(1, 16, delayed.sum())
+
+    return pd.DataFrame({
+        "account_id": accounts,
+        "date": dates,
+        "revenue": revenue,
+        "expense": expense,
+        "balance": balance,
+        "transaction_count": transaction_count,
+        "overdue_amount": overdue_amount,
+        "payment_delay_days": payment_delay_days
+    })
+
+class ShardWriter:
+    """Appends shards to a CSV or Parquet file."""
+
+    def __init__(self, output_path, fmt):
+        self.output_path = output_path
+        self.fmt = fmt
+        self._parquet_writer = None
+        self._first = True
+
+    def write(self, df):
+        if self.fmt == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.output_path, table.schema)
+            self._parquet_writer.write_table(table)
         else:
-            # Healthy accounts usually have 0 or low overdue
-            if random.random() > 0.8: # 20% chance of random delay
-                overdue_amount = round(random.uniform(0, 2000), 2)
-                payment_delay_days = random.randint(1, 15)
-            else:
-                overdue_amount = 0.0
-                payment_delay_days = 0
-                
-        data.append({
-            "account_id": acc_id,
-            "date": date.strftime("%Y-%m-%d"),
-            "revenue": revenue,
-            "expense": expense,
-            "balance": balance,
-            "transaction_count": transaction_count,
-            "overdue_amount": overdue_amount,
-            "payment_delay_days": payment_delay_days
-        })
-        
-    df = pd.DataFrame(data)
-    
-    # Save to root folder so it's easy to upload
-    # The script is in data-engineering/, so ../financial_records.csv puts it in dataintellect/
-    output_path = "../financial_records.csv"
-    df.to_csv(output_path, index=False)
-    print(f"✅ Successfully generated {NUM_RECORDS} records at {output_path}")
+            df.to_csv(
+                self.output_path,
+                mode="w" if self._first else "a",
+                header=self._first,
+                index=False,
+                date_format="%Y-%m-%d"
+            )
+        self._first = False
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+def generate_synthetic_data(
+    num_records=NUM_RECORDS,
+    output_path=OUTPUT_PATH,
+    num_accounts=NUM_ACCOUNTS,
+    start_date=START_DATE,
+    end_date=END_DATE,
+    seed=SEED,
+    workers=None,
+    chunk_size=CHUNK_SIZE,
+    fmt=None
+):
+    fmt = fmt or ("parquet" if output_path.endswith(".parquet") else "csv")
+    workers = workers or os.cpu_count() or 1
+
+    shards = [
+        (index, min(chunk_size, num_records - offset))
+        for index, offset in enumerate(range(0, num_records, chunk_size))
+    ]
+
+    def shard_args(index, rows):
+        return (index, rows, num_accounts, start_date, end_date, seed)
+
+    writer = ShardWriter(output_path, fmt)
+    try:
+        if workers == 1 or len(shards) == 1:
+            for index, rows in shards:
+                writer.write(generate_shard(*shard_args(index, rows)))
+        else:
+            # Keep a bounded window of shards in flight and write them in order
+            window = workers * 2
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = []
+                for index, rows in shards:
+                    pending.append(pool.submit(generate_shard, *shard_args(index, rows)))
+                    if len(pending) >= window:
+                        writer.write(pending.pop(0).result())
+                for future in pending:
+                    writer.write(future.result())
+    finally:
+        writer.close()
+
+    print(f"✅ Successfully generated {num_records} records at {output_path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic financial records")
+    parser.add_argument("--rows", type=int, default=NUM_RECORDS, help="Number of records")
+    parser.add_argument("--accounts", type=int, default=NUM_ACCOUNTS, help="Number of distinct accounts")
+    parser.add_argument("--start", default=START_DATE, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", default=END_DATE, help="Last date, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Random seed")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per shard")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None,
+                        help="Output format (default: from the output extension)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="Output file path")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    generate_synthetic_data()
+    args = parse_args()
+    generate_synthetic_data(
+        num_records=args.rows,
+        output_path=args.output,
+        num_accounts=args.accounts,
+        start_date=args.start,
+        end_date=args.end,
+        seed=args.seed,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        fmt=args.format
+    )
@@ -38,7 +38,7 @@ export default function Home() {
     const headers = { 'Authorization': `Bearer ${token}` };
 
     // 2. Fetch Data based on Role
-    const fetchAllData = async () => {
+    const fetchAllData = async (background = false) => {
         try {
             if (savedRole === 'admin') {
                 setAdminLoading(true);
@@ -52,7 +52,7 @@ export default function Home() {
                  }
                  setAdminLoading(false);
             } else {
-                setLoading(true);
+                if (!background) setLoading(true);
                 // User specific data
                 const [summaryRes, trendsRes, recordsRes] = await Promise.all([
                   fetch('http://127.0.0.1:8000/dashboard/summary', { headers }),
@@ -88,6 +88,17 @@ export default function Home() {
     };
 
     fetchAllData();
+
+    // Refresh when the data changes (upload, clear, retention) instead of polling
+    if (savedRole === 'admin') return;
+    const stream = new EventSource(`http://127.0.0.1:8000/dashboard/stream?access_token=${encodeURIComponent(token)}`);
+    const onChange = (event: MessageEvent) => {
+        const { totals } = JSON.parse(event.data);
+        setSummary((current: any) => ({ ...current, ...totals }));
+        fetchAllData(true);
+    };
+    ['upload', 'cleared', 'retention', 'changed'].forEach(name => stream.addEventListener(name, onChange));
+    return () => stream.close();
   }, [router]);
 
   // --- RENDER STATES ---